@@ -0,0 +1,176 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.10"
+# dependencies = []
+# ///
+"""
+Microbenchmark for telemetryrecord.TelemetryRecord
+
+Times the per-record cost of pulling fields out of parsed log records:
+process-api-requests.py's get_* helper chain and watcher.py's normalize()
+as they were, against one TelemetryRecord pass (plus, for the watcher,
+the attributes its session logs use, read on demand). Records come from a
+log file (--log) or are synthesized.
+
+Usage:
+    uv run .logging/decodebench.py [--log .logging/log.jsonl] [--records 20000] [--repeat 5]
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from telemetryrecord import TelemetryRecord
+from logstream import iter_complete_objects
+
+
+# ---------- before: the per-script helpers ----------
+
+def extract_attributes(record):
+    return record.get("attributes", {}) if isinstance(record.get("attributes"), dict) else {}
+
+
+def get_event_timestamp(record):
+    attrs = extract_attributes(record)
+    timestamp = attrs.get("event.timestamp")
+    if timestamp:
+        return timestamp
+    return record.get("timestamp") or record.get("event_timestamp") or record.get("time")
+
+
+def get_event_name(record):
+    attrs = extract_attributes(record)
+    return attrs.get("event.name") or record.get("event") or record.get("name")
+
+
+def processor_before(record):
+    event = get_event_name(record)
+    attrs = extract_attributes(record)
+    return event, attrs.get("prompt_id"), attrs.get("session.id"), get_event_timestamp(record), attrs
+
+
+def watcher_before(rec):
+    """watcher.py's old normalize(): every field for every record, into a dict."""
+    attrs = rec.get("attributes", {}) if isinstance(rec.get("attributes", {}), dict) else {}
+    event = attrs.get("event.name") or rec.get("event") or rec.get("name") or ""
+    t = attrs.get("event.timestamp") or rec.get("time") or None
+    sid = attrs.get("session.id") or rec.get("sessionId") or rec.get("session_id") or "unknown"
+    info = {
+        "event": event,
+        "time": t,
+        "sid": sid,
+        "model": attrs.get("model", ""),
+        "in_tok": attrs.get("input_token_count", ""),
+        "out_tok": attrs.get("output_token_count", ""),
+        "prompt": attrs.get("prompt", "") or "",
+        "resp": attrs.get("response_text", "") or "",
+        "tool_name": attrs.get("function_name", "") or "",
+        "tool_args": attrs.get("function_args", {}) or {},
+        "tool_ok": attrs.get("success", ""),
+        "tool_dur": attrs.get("duration_ms", ""),
+    }
+    if info["event"] not in ROUTED_EVENTS:
+        return None
+    return info["event"], info["sid"], info["time"], ROUTED_FIELDS[info["event"]](info)
+
+
+# ---------- after: one TelemetryRecord, other fields read on demand ----------
+
+def processor_after(record):
+    r = TelemetryRecord(record)
+    return r.event, r.prompt_id, r.session_id, r.timestamp, r.attributes
+
+
+def watcher_after(rec):
+    r = TelemetryRecord(rec)
+    if r.event not in ROUTED_EVENTS:
+        return None
+    return r.event, r.session_id or "unknown", r.timestamp, ROUTED_GETS[r.event](r)
+
+
+# What each session log line uses, per routed event
+ROUTED_EVENTS = {"gemini_cli.user_prompt", "gemini_cli.api_response", "gemini_cli.tool_call"}
+ROUTED_FIELDS = {
+    "gemini_cli.user_prompt": lambda i: (i["prompt"],),
+    "gemini_cli.api_response": lambda i: (i["model"], i["in_tok"], i["out_tok"], i["resp"]),
+    "gemini_cli.tool_call": lambda i: (i["tool_name"], i["tool_ok"], i["tool_dur"], i["tool_args"]),
+}
+ROUTED_GETS = {
+    "gemini_cli.user_prompt": lambda r: (r.get("prompt") or "",),
+    "gemini_cli.api_response": lambda r: (r.model or "", r.get("input_token_count", ""),
+                                          r.get("output_token_count", ""), r.get("response_text") or ""),
+    "gemini_cli.tool_call": lambda r: (r.get("function_name") or "", r.get("success", ""),
+                                       r.get("duration_ms", ""), r.get("function_args") or {}),
+}
+
+
+def synthetic_records(n):
+    events = ["gemini_cli.api_request", "gemini_cli.api_response", "gemini_cli.tool_call",
+              "gemini_cli.user_prompt", "gemini_cli.api_error"]
+    records = []
+    for i in range(n):
+        records.append({
+            "attributes": {
+                "session.id": f"session-{i // 50}",
+                "event.name": events[i % len(events)],
+                "event.timestamp": "2025-10-30T15:07:47.592Z",
+                "prompt_id": f"session-{i // 50}#{i}",
+                "model": "gemini-2.5-pro",
+                "duration_ms": 1200,
+                "input_token_count": 1000,
+                "output_token_count": 50,
+            },
+            "body": "telemetry event",
+        })
+    return records
+
+
+def load_records(path, limit):
+    records = []
+    with path.open("rb") as f:
+        for raw, _ in iter_complete_objects(f, 0):
+            try:
+                records.append(json.loads(raw))
+            except ValueError:
+                continue
+            if len(records) >= limit:
+                break
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark telemetry record decoding")
+    parser.add_argument("--log", type=Path, help="Read records from this log file instead of synthesizing them")
+    parser.add_argument("--records", type=int, default=20000, help="Records per run (default: 20000)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per variant; the best is reported (default: 5)")
+    args = parser.parse_args()
+
+    records = load_records(args.log, args.records) if args.log else synthetic_records(args.records)
+    if not records:
+        print(f"❌ No records found in {args.log}")
+        return 1
+
+    for before, after in ((processor_before, processor_after), (watcher_before, watcher_after)):
+        # Both variants must agree before timing means anything
+        for record in records:
+            assert before(record) == after(record), record
+
+    print(f"🚀 {len(records):,} records, best of {args.repeat} runs")
+    print("=" * 60)
+    for name, before, after in (("process-api-requests.py", processor_before, processor_after),
+                                ("watcher.py", watcher_before, watcher_after)):
+        results = []
+        for fn in (before, after):
+            loop = lambda: [fn(r) for r in records]
+            results.append(min(timeit.repeat(loop, number=1, repeat=args.repeat)) / len(records) * 1e9)
+        print(f"{name:24} before {results[0]:7.0f} ns/record   after {results[1]:7.0f} ns/record"
+              f"   ({results[0] / results[1]:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
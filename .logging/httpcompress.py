@@ -0,0 +1,143 @@
+"""
+Content-Encoding negotiation and cached compressed variants for server.py.
+
+A compressed copy of a session file or static file (the viewer) is stored
+next to it as <name>.gz / <name>.br / <name>.zst and stamped with the
+source's mtime; it is rebuilt when the source's mtime changes. Generated
+files that are rewritten all the time (indexes, rollups) don't get files
+written next to them: their compressed bodies are kept in a small
+in-memory LRU keyed by path and mtime. gzip is always available;
+brotli and zstd are used when the `brotli` / `zstandard` packages (or
+Python 3.14's compression.zstd) are installed. Stdlib only otherwise.
+"""
+
+from __future__ import annotations
+import gzip
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+# Content types worth compressing, and the smallest body worth the effort
+COMPRESSIBLE_TYPES = {"application/json", "text/html"}
+MIN_SIZE = 1024
+
+SUFFIXES = {"zstd": ".zst", "br": ".br", "gzip": ".gz"}
+
+# Compressed bodies kept by memory_variant()
+MEMORY_ENTRIES = 32
+_memory: "OrderedDict[tuple, tuple]" = OrderedDict()   # (path, encoding) -> (mtime_ns, body)
+_memory_lock = threading.Lock()
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    if zstd.__name__ == "zstandard":
+        return zstd.ZstdCompressor(level=10).compress(data)
+    return zstd.compress(data, level=10)
+
+
+ENCODERS: Dict[str, Callable[[bytes], bytes]] = {}
+if zstd is not None:
+    ENCODERS["zstd"] = _zstd_compress
+if brotli is not None:
+    ENCODERS["br"] = lambda data: brotli.compress(data, quality=9)
+ENCODERS["gzip"] = lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+
+# Preference order when the client accepts several
+PREFERENCE = [name for name in ("zstd", "br", "gzip") if name in ENCODERS]
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best encoding we support from an Accept-Encoding header (None for identity)."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for name in PREFERENCE:
+        if accepted.get(name, accepted.get("*", 0)) > 0:
+            return name
+    return None
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.split(";")[0].strip() in COMPRESSIBLE_TYPES
+
+
+def tag(etag: str, encoding: Optional[str]) -> str:
+    """ETag of an encoded representation (strong ETags must differ per encoding)."""
+    if not encoding:
+        return etag
+    return etag[:-1] + "-" + SUFFIXES[encoding][1:] + '"'
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    return ENCODERS[encoding](data)
+
+
+def variant_path(path: Path, encoding: str) -> Path:
+    return path.with_name(path.name + SUFFIXES[encoding])
+
+
+def cached_variant(path: Path, encoding: str, mtime_ns: int, produce: Callable[[], bytes]) -> Path:
+    """
+    Return the compressed variant of `path` for a source at mtime_ns,
+    compressing produce() and writing it first if the cached one is missing
+    or stale.
+    """
+    variant = variant_path(path, encoding)
+    try:
+        if variant.stat().st_mtime_ns == mtime_ns:
+            return variant
+    except FileNotFoundError:
+        pass
+    temp_file = variant.with_name(f"{variant.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    temp_file.write_bytes(compress(produce(), encoding))
+    os.utime(temp_file, ns=(mtime_ns, mtime_ns))
+    temp_file.replace(variant)
+    return variant
+
+
+def memory_variant(path: Path, encoding: str, mtime_ns: int, produce: Callable[[], bytes]) -> bytes:
+    """The compressed body of `path` for a source at mtime_ns, from memory or compressed now."""
+    key = (str(path), encoding)
+    with _memory_lock:
+        cached = _memory.get(key)
+        if cached and cached[0] == mtime_ns:
+            _memory.move_to_end(key)
+            return cached[1]
+    body = compress(produce(), encoding)
+    with _memory_lock:
+        _memory[key] = (mtime_ns, body)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+    return body
+
+
+def discard_variants(path: Path):
+    """Remove every cached variant of `path` (after a rename or delete)."""
+    for encoding in SUFFIXES:
+        variant_path(path, encoding).unlink(missing_ok=True)
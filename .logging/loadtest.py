@@ -0,0 +1,144 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.10"
+# dependencies = []
+# ///
+"""
+Load test for server.py
+
+Simulates many viewer tabs against a running server: each client keeps one
+HTTP/1.1 connection open and loops over /api/files and the session files,
+the way the viewer does on refresh, while --streams tabs hold /api/events
+streams open. By default there are twice as many clients as the server has
+workers, so a server that ties a worker to each connection shows up as
+stalled clients. Prints throughput, latency percentiles per path and the
+fewest requests any one client completed.
+
+Usage:
+    uv run .logging/server.py --no-browser &
+    uv run .logging/loadtest.py [--workers 32] [--clients 64] [--streams 8] [--duration 10] [--url http://localhost:8000]
+"""
+
+import argparse
+import http.client
+import socket
+import json
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import quote, urlsplit
+
+# server.py's default --workers
+DEFAULT_WORKERS = 32
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def client(host, port, paths, deadline, latencies, errors, counts, lock):
+    """One viewer: a single keep-alive connection cycling through paths."""
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    local = defaultdict(list)
+    failed = 0
+    i = 0
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                failed += 1
+                continue
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        local[path].append(time.perf_counter() - start)
+    conn.close()
+    with lock:
+        for path, values in local.items():
+            latencies[path].extend(values)
+        errors[0] += failed
+        counts.append(sum(len(values) for values in local.values()))
+
+
+def stream(host, port, deadline):
+    """One tab's /api/events stream, held open (on a worker) until the deadline."""
+    try:
+        with socket.create_connection((host, port), timeout=5) as sock:
+            sock.sendall(b"GET /api/events HTTP/1.1\r\nHost: loadtest\r\n\r\n")
+            while time.monotonic() < deadline:
+                try:
+                    if not sock.recv(4096):
+                        return
+                except socket.timeout:
+                    pass
+    except OSError:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API Request Viewer server")
+    parser.add_argument("--url", default="http://localhost:8000", help="Server base URL (default: http://localhost:8000)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"The server's --workers, to size the defaults (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--clients", type=int, help="Concurrent viewers (default: 2 x workers)")
+    parser.add_argument("--streams", type=int, help="Open /api/events streams (default: workers / 4)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run (default: 10)")
+    parser.add_argument("--sessions", type=int, default=3, help="Session files each viewer loads (default: 3)")
+    args = parser.parse_args()
+    clients = args.clients if args.clients is not None else 2 * args.workers
+    streams = args.streams if args.streams is not None else args.workers // 4
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    conn.request("GET", "/api/files")
+    files = json.loads(conn.getresponse().read())
+    conn.close()
+    paths = ["/api/files"] + ["/requests/" + quote(f["filename"]) for f in files[:args.sessions]]
+
+    print(f"🚀 {clients} clients and {streams} event streams for {args.duration:.0f}s against {args.url}"
+          f" ({args.workers} workers)")
+    print(f"   Paths: {', '.join(paths)}")
+
+    latencies = defaultdict(list)
+    errors = [0]
+    counts = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=stream, args=(host, port, deadline)) for _ in range(streams)]
+    threads += [threading.Thread(target=client, args=(host, port, paths, deadline, latencies, errors, counts, lock))
+                for _ in range(clients)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    total = sum(len(v) for v in latencies.values())
+    every = [x for v in latencies.values() for x in v]
+    print("\n" + "=" * 60)
+    print(f"Requests:    {total:,} ({errors[0]} failed)")
+    print(f"Throughput:  {total / elapsed:,.0f} req/s")
+    print(f"Latency:     p50 {percentile(every, 50) * 1000:.1f} ms, p99 {percentile(every, 99) * 1000:.1f} ms,"
+          f" max {max(every, default=0) * 1000:.1f} ms")
+    print(f"Per client:  at least {min(counts, default=0):,} requests (a stalled client shows as 0-1)")
+    print("=" * 60)
+    for path, values in latencies.items():
+        print(f"{path[:50]:50} {len(values):7,}  p50 {percentile(values, 50) * 1000:7.1f} ms"
+              f"  p99 {percentile(values, 99) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Incremental reading of Gemini telemetry logs.
+
+log.jsonl is not really JSON Lines: Gemini writes pretty-printed JSON
+objects back to back. These helpers find where each top-level object ends
+so callers can checkpoint a byte offset, resume from it, and leave a
+partially written trailing object alone until it is complete.
+
+Shared by watcher.py, process-api-requests.py and truncate.py (stdlib only).
+"""
+
+from __future__ import annotations
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+READ_CHUNK = 4 * 1024 * 1024  # bytes read per step when resuming from an offset
+
+# Outside strings only brackets and quotes matter. A string is skipped in
+# one regex match over runs of ordinary bytes and backslash pairs, so the
+# escaped quotes of a JSON-encoded request_text cost nothing in Python; the
+# match stops at the closing quote, or at the end of the data (possibly on a
+# lone backslash, whose pair is still to come).
+_STRUCTURAL = re.compile(rb'[{}\[\]"]')
+_STRING_BODY = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+
+
+class ObjectScanner:
+    """
+    Finds where top-level JSON objects/arrays end in data that arrives in
+    pieces. Its place (bracket depth, inside a string or not) is kept
+    between calls, so each byte is scanned once however many reads an
+    object spans.
+
+        scanner = ObjectScanner()
+        ends = scanner.scan(buf)     # buf grew since the last call
+        del buf[:n]; scanner.discard(n)
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.pos = 0  # next byte of the buffer to scan
+
+    def scan(self, buf) -> List[int]:
+        """End offsets (exclusive) of the top-level objects completed in buf since the last call."""
+        ends = []
+        pos, depth, size = self.pos, self.depth, len(buf)
+        while True:
+            if self.in_string:
+                pos = _STRING_BODY.match(buf, pos).end()
+                if pos >= size or buf[pos] != 0x22:
+                    break  # the string goes on past the data read so far
+                pos += 1
+                self.in_string = False
+            m = _STRUCTURAL.search(buf, pos)
+            if not m:
+                pos = size
+                break
+            pos = m.end()
+            ch = buf[pos - 1]
+            if ch == 0x22:  # '"'
+                self.in_string = True
+            elif ch in (0x7B, 0x5B):  # '{' or '['
+                depth += 1
+            elif depth > 1:
+                depth -= 1
+            elif depth == 1:
+                depth = 0
+                ends.append(pos)
+            # else: a stray closing bracket between objects; ignore it
+        self.pos, self.depth = pos, depth
+        return ends
+
+    def discard(self, n: int):
+        """The first n bytes (all scanned) were dropped from the buffer."""
+        self.pos -= n
+
+
+def find_object_ends(buf) -> List[int]:
+    """
+    Return the end offset (exclusive) of every complete top-level JSON
+    object/array in buf. A trailing partial object is simply not reported.
+    """
+    return ObjectScanner().scan(buf)
+
+def iter_complete_objects(f, offset: int, chunk_size: int = READ_CHUNK):
+    """
+    Yield (raw_bytes, end_offset) for each complete top-level object that
+    starts at or after `offset`. A partial trailing object (Gemini still
+    writing) is left in the file for the next pass, so `end_offset` is always
+    a safe place to resume from.
+    """
+    f.seek(offset)
+    buf = bytearray()
+    base = offset
+    scanner = ObjectScanner()
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        buf += chunk
+        start = 0
+        for end in scanner.scan(buf):
+            yield bytes(buf[start:end]), base + end
+            start = end
+        if start:
+            del buf[:start]
+            scanner.discard(start)
+            base += start
+
+
+# ---------- generations ----------
+# Processing never truncates log.jsonl in place. Under the log lock it is
+# renamed to log.jsonl.<N> (N increasing), which takes a moment, and the
+# generation is then read without the lock. Gemini CLI keeps its write
+# stream open, so it may go on appending to the renamed file until it is
+# restarted; readers therefore checkpoint per file *inode*, which a rename
+# does not change, and keep reading generations by offset like the live log.
+
+def generation_paths(log_path: Path) -> List[Tuple[int, Path]]:
+    """Existing generations of log_path as (number, path), oldest first."""
+    gens = []
+    for path in log_path.parent.glob(log_path.name + ".*"):
+        suffix = path.name[len(log_path.name) + 1:]
+        if suffix.isdigit():
+            gens.append((int(suffix), path))
+    return sorted(gens)
+
+
+def rotate(log_path: Path) -> Optional[Path]:
+    """
+    Rename a non-empty log_path to its next generation and return the new
+    path (None if there was nothing to rotate). Call with the log lock held.
+    """
+    try:
+        if log_path.stat().st_size == 0:
+            return None
+    except FileNotFoundError:
+        return None
+    gens = generation_paths(log_path)
+    number = gens[-1][0] + 1 if gens else 1
+    target = log_path.with_name(f"{log_path.name}.{number}")
+    os.rename(log_path, target)
+    return target
+
+
+def is_sealed(log_path: Path, generation: Path) -> bool:
+    """
+    True once nothing should still be appended to a generation: a newer
+    generation exists, or the writer has started a new log_path.
+    """
+    gens = [path for _, path in generation_paths(log_path)]
+    if generation in gens and gens[-1] != generation:
+        return True
+    try:
+        return log_path.stat().st_ino != generation.stat().st_ino
+    except FileNotFoundError:
+        return False
+
+
+def pending_files(log_path: Path, files: Dict[str, dict],
+                  adopt_generations: bool = True) -> List[Tuple[Path, str, bool]]:
+    """
+    List the files to read as (path, key, restarted): generations oldest
+    first, then log_path itself.
+
+    `files` is the caller's checkpoint table, {inode: {"offset", "size"}},
+    and is updated in place: a file seen for the first time starts at
+    offset 0, one that shrank (truncated in place) is reset to 0, and
+    entries for files that no longer exist are dropped. `restarted` is True
+    in both of those cases. Generations never seen before are skipped
+    unless adopt_generations is set (the watcher only follows files it saw
+    as log_path; the processor must read every pending generation).
+    """
+    candidates = [path for _, path in generation_paths(log_path)] + [log_path]
+    result = []
+    live = set()
+    for path in candidates:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        key = str(st.st_ino)
+        live.add(key)
+        entry = files.get(key)
+        restarted = False
+        if entry is None:
+            if path != log_path and not adopt_generations:
+                continue
+            entry = files[key] = {"offset": 0, "size": 0}
+            restarted = True
+        elif st.st_size < entry["size"] or st.st_size < entry["offset"]:
+            entry["offset"] = 0
+            restarted = True
+        entry["size"] = st.st_size
+        result.append((path, key, restarted))
+    for key in list(files):
+        if key not in live:
+            del files[key]
+    return result
+
+
+# ---------- new session requests ----------
+# Rotating the log does not start a new session by itself: Gemini goes on
+# appending to the renamed generation, so no new log_path appears for
+# pending_files to report. truncate.py therefore also writes a marker
+# holding a fresh token; a reader that sees a token other than the one in
+# its checkpoint starts a new stream (new session folder) and records it.
+
+def new_session_marker(log_path: Path) -> Path:
+    return log_path.with_name(".new-session")
+
+
+def request_new_session(log_path: Path) -> str:
+    """Ask running (and future) readers of log_path to start a new stream."""
+    token = str(time.time_ns())
+    marker = new_session_marker(log_path)
+    temp = marker.with_suffix(".tmp")
+    temp.write_text(token, encoding="utf-8")
+    temp.replace(marker)
+    return token
+
+
+def new_session_token(log_path: Path) -> Optional[str]:
+    """The token of the latest new session request, None if there was none."""
+    try:
+        return new_session_marker(log_path).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,206 @@
+"""
+Counters, gauges and latency histograms shared by the processors and
+server.py, rendered in the Prometheus text exposition format.
+
+Each process records into the module-level REGISTRY. server.py serves its
+own registry at /metrics together with the *.prom files the processors
+dump next to it (the node_exporter "textfile" convention), so one scrape
+covers the whole pipeline. Stdlib only.
+
+    PARSE = metrics.histogram("api_processor_parse_seconds", "Decoding one log record")
+    with PARSE.time():
+        ...
+    metrics.REGISTRY.write(Path("process-api-requests.prom"))
+"""
+
+from __future__ import annotations
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# Upper bounds in seconds: 50µs up to 10s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.values: Dict[tuple, object] = {}
+
+    def samples(self) -> List[str]:
+        """One line per label set; subclasses with structured values override this."""
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in self.values.items()]
+
+    def render(self) -> str:
+        with self.lock:
+            lines = self.samples()
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n" + "".join(
+            line + "\n" for line in lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[_labels(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                # [count per bucket (last is +Inf), sum, count]
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the with-block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+    def quantile(self, q: float, **labels) -> float:
+        """Approximate quantile: the upper bound of the bucket it falls in."""
+        with self.lock:
+            series = self.values.get(_labels(labels))
+            if not series:
+                return 0.0
+            counts, _, count = series
+            rank = q * count
+            seen = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                seen += n
+                if seen >= rank:
+                    return bound
+        return float("inf")
+
+
+@contextmanager
+def timed_lock(lock, histogram: Histogram, **labels):
+    """Hold `lock` (anything usable in a with-statement), observing how long acquiring it took."""
+    start = time.perf_counter()
+    with lock:
+        histogram.observe(time.perf_counter() - start, **labels)
+        yield
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Metric] = {}
+
+    def _get(self, cls, name: str, help: str, **kwargs) -> Metric:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "".join(metric.render() for metric in metrics)
+
+    def write(self, path: Path):
+        """Dump the registry to a .prom file (atomically) for server.py to pick up."""
+        temp_file = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        temp_file.write_text(self.render(), encoding="utf-8")
+        temp_file.replace(path)
+
+    def summary(self) -> List[str]:
+        """One console line per histogram series: count, mean and approximate p50/p99."""
+        lines = []
+        with self.lock:
+            histograms = [m for m in self.metrics.values() if isinstance(m, Histogram)]
+        for metric in histograms:
+            with metric.lock:
+                items = [(key, series[1], series[2]) for key, series in metric.values.items()]
+            for key, total, count in items:
+                if not count:
+                    continue
+                labels = dict(key)
+                p50, p99 = metric.quantile(0.5, **labels), metric.quantile(0.99, **labels)
+                lines.append(f"{metric.name}{_format_labels(key)}: n={count} "
+                             f"mean={total / count * 1000:.2f}ms p50<={p50 * 1000:g}ms p99<={p99 * 1000:g}ms")
+        return lines
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
@@ -0,0 +1,114 @@
+"""
+One decode pass over the telemetry log, fanned out to pluggable sinks.
+
+The reader (process-api-requests.py) decodes every log object once into a
+TelemetryRecord and hands it to each sink in turn; sinks never parse the
+log themselves. All sinks share the reader's checkpoint: before the
+reader saves a file offset it calls flush(), so nothing a sink was handed
+is lost or repeated across a restart. A sink with state of its own (the
+session log sink's current folder) keeps it in the same checkpoint under
+its name.
+
+    pipeline = Pipeline([ApiSessionSink(...), rollups.RollupsSink(path)])
+    pipeline.restore(state.get("sinks", {}))
+    pipeline.feed(records)
+    pipeline.flush()
+    state["sinks"] = pipeline.state()
+
+Stdlib only.
+"""
+
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Set
+
+from telemetryrecord import TelemetryRecord
+
+
+class Sink:
+    """
+    Base class for pipeline outputs; override what applies.
+
+    `events` is the set of event names the sink acts on (None: all of
+    them). The reader uses the union to decide which records it must
+    decode in full. A sink that sets `accepts_parsed` also takes records
+    whose JSON string attributes (request_text, ...) were already parsed,
+    which lets the parallel reader do that in its workers.
+    """
+
+    name = "sink"
+    events: Optional[Set[str]] = None
+    accepts_parsed = False
+
+    def handle(self, record: TelemetryRecord):
+        """Take one decoded record."""
+
+    def restart(self):
+        """log.jsonl was replaced or truncated; the next record starts a new stream."""
+
+    def flush(self):
+        """Make everything handled so far durable; the checkpoint is saved next."""
+
+    def close(self):
+        self.flush()
+
+    def state(self) -> dict:
+        """What to keep in the shared checkpoint."""
+        return {}
+
+    def restore(self, state: dict):
+        """Resume from what state() returned last run."""
+
+
+class Pipeline:
+    def __init__(self, sinks: List[Sink]):
+        self.sinks = sinks
+
+    @staticmethod
+    def _union(sinks: List[Sink]) -> Optional[Set[str]]:
+        wanted: Set[str] = set()
+        for sink in sinks:
+            if sink.events is None:
+                return None
+            wanted |= sink.events
+        return wanted
+
+    @property
+    def events(self) -> Optional[Set[str]]:
+        """Event names any sink acts on, or None if one takes everything."""
+        return self._union(self.sinks)
+
+    @property
+    def raw_events(self) -> Optional[Set[str]]:
+        """Event names some sink needs exactly as logged (None: all of them)."""
+        return self._union([sink for sink in self.sinks if not sink.accepts_parsed])
+
+    def feed(self, records: Iterable[dict]) -> int:
+        """Decode each raw record once and hand it to every sink. Returns the count."""
+        sinks = self.sinks
+        count = 0
+        for raw in records:
+            record = TelemetryRecord(raw)
+            for sink in sinks:
+                sink.handle(record)
+            count += 1
+        return count
+
+    def restart(self):
+        for sink in self.sinks:
+            sink.restart()
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def state(self) -> Dict[str, dict]:
+        states = {sink.name: sink.state() for sink in self.sinks}
+        return {name: state for name, state in states.items() if state}
+
+    def restore(self, state: Dict[str, dict]):
+        for sink in self.sinks:
+            sink.restore(state.get(sink.name, {}))
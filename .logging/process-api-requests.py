@@ -1,7 +1,7 @@
 #!/usr/bin/env -S uv run --script
 # /// script
 # requires-python = ">=3.10"
-# dependencies = ["ijson>=3.2.3", "filelock>=3.12.0"]
+# dependencies = ["ijson>=3.2.3", "filelock>=3.12.0", "watchfiles>=0.21"]
 # ///
 """
 Gemini CLI API Request Processor
@@ -13,7 +13,19 @@ Usage:
     uv run .logging/process-api-requests.py [options]
 
 Options:
-    --no-clear          Don't clear the log file after processing
+    --no-clear          Process log.jsonl in place instead of rotating it to log.jsonl.<N>
+    --follow            Keep running and process new records as they arrive
+    --max-delay SEC     Longest wait before new records reach session files (--follow, default: 1.0)
+    --compact           Fold appended session segments into their base files and exit
+    --no-dedup          Store request_text in full instead of referencing a turn store
+    --inflate           Rewrite all sessions in the plain format (full request_text) and exit
+    --max-buffer-mb N   Memory budget for buffered sessions before the least recently used is written (default: 256)
+    --parallel [N]      Decode the log with N worker processes (default: all cores)
+    --store sqlite      Keep sessions in sessions.db instead of JSON files (see sessiondb.py)
+    --import-files      Copy the session files in --output-dir into sessions.db and exit
+    --export            Write sessions.db's sessions to --output-dir as JSON files and exit
+    --session-logs      Also write watcher.py's session logs from the same read (one decode, one checkpoint)
+    --reindex           Rebuild the search index (search.db), stats (rollups.json) and session registry from all sessions and exit
     --output-dir PATH   Output directory (default: .logging)
     --verbose          Enable verbose debug output
     --help             Show this help message
@@ -23,90 +35,113 @@ from __future__ import annotations
 import json
 import argparse
 import re
+import time
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional, Any
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 import ijson
 from filelock import FileLock, Timeout
 
+from logstream import (ObjectScanner, generation_paths, is_sealed, iter_complete_objects, new_session_marker,
+                       new_session_token, pending_files, rotate)
+import metrics
+import rollups
+import searchindex
+import sessiondb
+import sessionregistry
+import sessionstore
+import telemetryrecord
+from pipeline import Pipeline, Sink
+from sessionlogs import SessionLogSink, WriterPool
+
 # ---------- Configuration ----------
 BASE = Path(".")
 LOG_FILE = BASE / ".logging" / "log.jsonl"
 LOCK_FILE = BASE / ".logging" / ".process.lock"
+RUN_LOCK_FILE = BASE / ".logging" / ".process-run.lock"
+PROCESS_STATE_FILE = BASE / ".logging" / ".process-state.json"
+SEARCH_DB = BASE / ".logging" / "search.db"
+ROLLUPS_FILE = BASE / ".logging" / "rollups.json"
+# Session store for --store sqlite
+SESSIONS_DB = BASE / ".logging" / "sessions.db"
+# Metrics dump, served by server.py's /metrics
+METRICS_FILE = BASE / ".logging" / "process-api-requests.prom"
+
+# watcher.py's checkpoint; a generation it is still reading is kept
+WATCHER_STATE_FILE = BASE / ".logging" / ".state.json"
+
+# Memory budget for sessions buffered during one run (estimated from record sizes)
+DEFAULT_BUFFER_MB = 256
+DEFAULT_BUFFER_BYTES = DEFAULT_BUFFER_MB * 1024 * 1024
 DEFAULT_OUTPUT_DIR = BASE / ".logging" / "requests"
+# watcher.py's human-readable logs, written with --session-logs
+SESSION_LOGS_DIR = BASE / ".logging" / "sessions"
 
 # Event types we care about
 EVENT_REQUEST = "gemini_cli.api_request"
 EVENT_RESPONSE = "gemini_cli.api_response"
 EVENT_ERROR = "gemini_cli.api_error"
+EVENT_KINDS = {EVENT_REQUEST: "request", EVENT_RESPONSE: "response", EVENT_ERROR: "error"}
+API_EVENTS = (EVENT_REQUEST, EVENT_RESPONSE, EVENT_ERROR)
+EVENT_TOOL_CALL = "gemini_cli.tool_call"
+
+# ---------- Metrics ----------
+RECORDS = metrics.counter("api_processor_records_total", "Log records read, by event kind")
+PARSE_SECONDS = metrics.histogram("api_processor_parse_seconds", "Decoding one log record (serial path)")
+NORMALIZE_SECONDS = metrics.histogram("api_processor_normalize_seconds", "Parsing the JSON string fields of one API event")
+WRITE_SECONDS = metrics.histogram("api_processor_write_seconds", "Writing one buffered session to its file")
+INDEX_SECONDS = metrics.histogram("api_processor_index_seconds", "Indexing one buffered session for search")
+STATE_SAVE_SECONDS = metrics.histogram("api_processor_state_save_seconds", "Saving the processing checkpoint")
+SESSION_LOG_WRITE_SECONDS = metrics.histogram("api_processor_session_log_write_seconds",
+                                              "Writing one session log's buffer to disk (--session-logs)")
+LOCK_WAIT_SECONDS = metrics.histogram("api_processor_lock_wait_seconds", "Waiting to acquire a file lock")
+BACKLOG_BYTES = metrics.gauge("api_processor_backlog_bytes", "Bytes not yet read from log.jsonl and its generations")
+LAST_PASS = metrics.gauge("api_processor_last_pass_timestamp_seconds", "Unix time the last processing pass finished")
+
+def dump_metrics():
+    """Record the backlog and write METRICS_FILE."""
+    files = load_process_state()["files"]
+    backlog = 0
+    for path in [LOG_FILE] + [path for _, path in generation_paths(LOG_FILE)]:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        backlog += max(st.st_size - files.get(str(st.st_ino), {}).get("offset", 0), 0)
+    BACKLOG_BYTES.set(backlog)
+    LAST_PASS.set(time.time())
+    try:
+        metrics.REGISTRY.write(METRICS_FILE)
+    except OSError as e:
+        print(f"⚠️  Warning: Could not write {METRICS_FILE.name}: {e}")
 
 # ---------- Helper Functions ----------
 def timestamp_now() -> str:
     """Return current timestamp in YYYY-MM-DD_HH-mm-ss format."""
     return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
-def get_existing_sessions(output_dir: Path) -> Dict[str, Path]:
+def get_existing_sessions(output_dir: Path) -> sessionregistry.SessionRegistry:
     """
-    Scan output directory for existing session files.
-    Returns dict mapping session_id -> file_path
+    The session registry of the output directory (session_id -> file),
+    which follows renames made by server.py. Built from the session files
+    the first time.
     """
     output_dir.mkdir(parents=True, exist_ok=True)
-    sessions = {}
-
-    # Pattern: YYYY-MM-DD_HH-MM-SS-{session-id}.json
-    pattern = re.compile(r'(\d{4})-(\d{2})-(\d{2})_(\d{2})-(\d{2})-(\d{2})-(.+)\.json')
-
-    for file_path in output_dir.glob("*.json"):
-        match = pattern.match(file_path.name)
-        if match:
-            session_id = match.group(7)  # Group 7 captures the session ID
-            sessions[session_id] = file_path
-
-    return sessions
+    return sessionregistry.SessionRegistry(output_dir).refresh()
 
 def load_session_file(file_path: Path) -> List[dict]:
-    """Load existing session data from file."""
+    """Load an existing logical session (base file plus appended segment)."""
     if not file_path.exists():
         return []
 
     try:
-        with file_path.open("r", encoding="utf-8") as f:
-            return json.load(f)
+        return sessionstore.load_session(file_path)
     except Exception as e:
         print(f"⚠️  Warning: Could not load {file_path.name}: {e}")
         return []
 
-def extract_attributes(record: dict) -> dict:
-    """Extract attributes from OTLP-style record."""
-    return record.get("attributes", {}) if isinstance(record.get("attributes"), dict) else {}
-
-def get_prompt_id(attrs: dict) -> Optional[str]:
-    """Extract prompt_id from attributes."""
-    return attrs.get("prompt_id")
-
-def get_session_id(attrs: dict) -> Optional[str]:
-    """Extract session.id from attributes."""
-    return attrs.get("session.id")
-
-def get_event_timestamp(record: dict) -> Optional[str]:
-    """Extract timestamp from record."""
-    # Try attributes first (where event.timestamp actually is)
-    attrs = extract_attributes(record)
-    timestamp = attrs.get("event.timestamp")
-    if timestamp:
-        return timestamp
-    # Fallbacks for other formats
-    return (record.get("timestamp") or
-            record.get("event_timestamp") or
-            record.get("time"))
-
-def get_event_name(record: dict) -> Optional[str]:
-    """Extract event name from record."""
-    attrs = extract_attributes(record)
-    return attrs.get("event.name") or record.get("event") or record.get("name")
-
 def parse_json_fields(attrs: dict, fields: List[str], verbose: bool = False) -> dict:
     """
     Parse JSON string fields into objects for cleaner output.
@@ -145,52 +180,133 @@ JSON_STRING_FIELDS = [
 
 # ---------- Event Processing ----------
 def save_session_data(session_id: str, session_data: dict, first_timestamp: str,
-                     existing_sessions: dict, output_dir: Path, verbose: bool) -> Path:
+                     registry: sessionregistry.SessionRegistry, output_dir: Path, verbose: bool,
+                     dedup: bool = True) -> tuple:
     """
-    Save session data to file.
-    Handles both new and existing session files.
+    Save session data to file; returns (file path, whether it was created).
+    New sessions get a base file; for existing ones only the entries touched
+    in this run are appended to the session's segment, and the segment is
+    compacted into the base once it grows large enough. With dedup, request
+    turns are moved into the session's content-addressed turn store first.
+    The registry lock is held throughout, so server.py can't rename or
+    delete the file in between.
     """
-    # Convert dict to list format
-    data_list = list(session_data.values())
-
-    # Determine output file path
-    if session_id in existing_sessions:
-        # Update existing file
-        output_file = existing_sessions[session_id]
-        if verbose:
-            print(f"   💾 Updating: {output_file.name}")
+    with registry.locked():
+        output_file = registry.path(session_id)
+        if output_file is None:
+            # Create new file
+            if verbose:
+                print(f"   💾 Creating new session file")
+            output_file = save_session_file(list(session_data.values()), session_id, first_timestamp or "", output_dir, dedup)
+            registry.add(session_id, output_file.name, first_timestamp)
+            return output_file, True
 
-        # For existing files, just overwrite with updated data
-        temp_file = output_file.with_suffix(".tmp")
-        with temp_file.open("w", encoding="utf-8") as f:
-            json.dump(data_list, f, ensure_ascii=False, indent=2)
-        temp_file.replace(output_file)
-    else:
-        # Create new file
         if verbose:
-            print(f"   💾 Creating new session file")
-        output_file = save_session_file(data_list, session_id, first_timestamp or "", output_dir)
-
-    return output_file
-
-def process_log_file(log_path: Path, output_dir: Path, verbose: bool = False) -> Dict[str, any]:
-    """
-    Parse log file and extract API events grouped by session.
-    Processes records in order and creates/updates session files as needed.
-
-    Returns:
-        Dict with processing statistics
-    """
-    if not log_path.exists():
-        print(f"❌ Log file not found: {log_path}")
-        return {}
-
-    # Get existing sessions
-    existing_sessions = get_existing_sessions(output_dir)
-    print(f"📂 Found {len(existing_sessions)} existing session file(s)")
+            print(f"   💾 Appending {len(session_data)} entr{'y' if len(session_data) == 1 else 'ies'} to: {output_file.name}")
+
+        if dedup:
+            sessionstore.dedup_entries(output_file, session_data.values())
+        deltas = []
+        for prompt_id, entry in session_data.items():
+            delta = {"prompt_id": prompt_id}
+            delta.update((slot, value) for slot, value in entry.items() if value is not None)
+            deltas.append(delta)
+        sessionstore.append_deltas(output_file, deltas)
+
+        if sessionstore.needs_compaction(output_file):
+            if verbose:
+                print(f"   🗜  Compacting: {output_file.name}")
+            sessionstore.compact(output_file)
+        registry.touch(session_id)
+    return output_file, False
+
+def compact_sessions(output_dir: Path, verbose: bool = False) -> int:
+    """Fold every session segment in output_dir into its base file."""
+    compacted = 0
+    for session_file in sorted(output_dir.glob("*.json")):
+        if sessionstore.compact(session_file):
+            compacted += 1
+            if verbose:
+                print(f"   🗜  Compacted: {session_file.name}")
+    return compacted
+
+def inflate_sessions(output_dir: Path, verbose: bool = False) -> int:
+    """Rewrite every session in output_dir in the plain format (full request_text, no sidecars)."""
+    inflated = 0
+    for session_file in sorted(output_dir.glob("*.json")):
+        if sessionstore.inflate_session(session_file):
+            inflated += 1
+            if verbose:
+                print(f"   🎈 Inflated: {session_file.name}")
+    return inflated
+
+def stored_sessions(output_dir: Path, store: str = "files"):
+    """Yield (filename, entries with request_text not inflated) for every stored session."""
+    if store == "sqlite":
+        with sessiondb.SessionDB(SESSIONS_DB) as db:
+            for filename in sorted(db.sessions().values()):
+                yield filename, db.load(filename, inflate=False)
+        return
+    for session_file in sorted(output_dir.glob("*.json")):
+        yield session_file.name, sessionstore.load_session(session_file, inflate=False)
+
+def reindex_sessions(output_dir: Path, verbose: bool = False, store: str = "files") -> int:
+    """Rebuild the search index, the stats rollups and (for files) the session registry from every stored session."""
+    if store == "files":
+        with get_existing_sessions(output_dir).locked() as registry:
+            registry.rebuild()
+    count = 0
+    aggregates = rollups.Rollups(ROLLUPS_FILE)
+    aggregates.clear()
+    with searchindex.SearchIndex(SEARCH_DB) as search:
+        search.clear()
+        for filename, entries in stored_sessions(output_dir, store):
+            search.index_entries(filename, {
+                sessionstore.entry_prompt_id(entry) or f"#{i}": entry for i, entry in enumerate(entries)
+            })
+            for entry in entries:
+                attrs = next((entry[slot] for slot in sessionstore.ENTRY_SLOTS if entry.get(slot)), {})
+                aggregates.add_entry(attrs.get("session.id") or Path(filename).stem, entry)
+            count += 1
+            if verbose:
+                print(f"   🔎 Indexed: {filename}")
+    aggregates.save()
+    return count
+
+def import_sessions(output_dir: Path, verbose: bool = False, dedup: bool = True) -> int:
+    """Copy every session file in output_dir into SESSIONS_DB (sessions already there are merged)."""
+    imported = 0
+    with sessiondb.SessionDB(SESSIONS_DB) as db:
+        for session_file in sorted(output_dir.glob("*.json")):
+            session_id = db.import_file(session_file, dedup)
+            if session_id is None:
+                print(f"⚠️  Warning: No session id in {session_file.name}; skipped")
+                continue
+            imported += 1
+            if verbose:
+                print(f"   📥 Imported: {session_file.name}")
+    return imported
+
+def export_sessions(output_dir: Path, verbose: bool = False) -> int:
+    """Write the sessions in SESSIONS_DB that changed since the last export as JSON files."""
+    with sessiondb.SessionDB(SESSIONS_DB) as db:
+        written = db.export(output_dir)
+        # Register the files so processing with the file store appends to them
+        with get_existing_sessions(output_dir).locked() as registry:
+            for path in written:
+                session_id = db.session_id(path.name)
+                if registry.session_id(path.name) == session_id:
+                    registry.touch(session_id)
+                else:
+                    registry.add(session_id, path.name)
+    if verbose:
+        for path in written:
+            print(f"   📤 Exported: {path.name}")
+    return len(written)
 
-    # Stats
-    stats = {
+def new_stats() -> dict:
+    """Empty processing statistics."""
+    return {
         "total_records": 0,
         "requests": 0,
         "responses": 0,
@@ -198,147 +314,560 @@ def process_log_file(log_path: Path, output_dir: Path, verbose: bool = False) ->
         "skipped": 0,
         "sessions_processed": 0,
         "sessions_updated": 0,
-        "sessions_created": 0
+        "sessions_created": 0,
+        "session_files": [],
     }
 
-    # Current session tracking
-    current_session_id = None
-    current_session_data = {}  # prompt_id -> {prompt_id, request, response, error}
-    current_session_first_timestamp = None
-    session_files_written = []
+class SessionBuffers:
+    """
+    Entries collected in this run, one buffer per session id, kept in LRU
+    order. Interleaved sessions stay in memory instead of being written on
+    every switch; the least recently used session is written out when the
+    estimated size of all buffers exceeds the budget, and the rest when
+    flush_all() is called at the end of the run.
+    """
 
-    print(f"📖 Reading log file: {log_path}")
-    print(f"⏳ Processing events...")
+    def __init__(self, save, budget_bytes: int):
+        self._save = save          # save(session_id, buffer) writes one session
+        self._budget = budget_bytes
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self._total = 0
+
+    def touch(self, session_id: str) -> tuple:
+        """Return (buffer, created) for session_id and mark it most recently used."""
+        buf = self._sessions.get(session_id)
+        if buf is not None:
+            self._sessions.move_to_end(session_id)
+            return buf, False
+        buf = {"data": {}, "tools": {}, "first_timestamp": None, "bytes": 0}
+        self._sessions[session_id] = buf
+        return buf, True
+
+    def charge(self, session_id: str, nbytes: int):
+        """Account for nbytes added to a session; evict others if over budget."""
+        self._sessions[session_id]["bytes"] += nbytes
+        self._total += nbytes
+        # Never evict the session that is being written to
+        while self._total > self._budget and len(self._sessions) > 1:
+            oldest_id, oldest = self._sessions.popitem(last=False)
+            self._total -= oldest["bytes"]
+            self._save(oldest_id, oldest)
+
+    def flush_all(self):
+        while self._sessions:
+            session_id, buf = self._sessions.popitem(last=False)
+            self._total -= buf["bytes"]
+            self._save(session_id, buf)
+
+def estimate_size(attrs: dict) -> int:
+    """Rough in-memory size of a record, from its string attributes (before JSON parsing)."""
+    return 64 * len(attrs) + sum(len(v) for v in attrs.values() if isinstance(v, str))
+
+class ApiSessionSink(Sink):
+    """
+    Groups API events by session and writes the touched session files,
+    indexing them for search along with the session's tool calls. Records are handled in order and may
+    interleave several sessions; each session is written once per flush()
+    unless it has to be evicted to stay within buffer_bytes. Counts go to
+    self.stats (see new_stats()).
+    """
 
-    with log_path.open("rb") as f:
-        try:
-            records = ijson.items(f, "", multiple_values=True)
-
-            for record in records:
-                stats["total_records"] += 1
-
-                # Progress indicator
-                if verbose and stats["total_records"] % 100 == 0:
-                    print(f"   Processed {stats['total_records']} records...")
-
-                # Extract metadata
-                event_name = get_event_name(record)
-                attrs = extract_attributes(record)
-                prompt_id = get_prompt_id(attrs)
-                session_id = get_session_id(attrs)
-                timestamp = get_event_timestamp(record)
-
-                # Skip records without session_id or prompt_id
-                if not session_id or not prompt_id:
-                    stats["skipped"] += 1
-                    continue
-
-                # Check if session changed
-                if current_session_id is not None and session_id != current_session_id:
-                    # Save current session before switching
-                    if current_session_data:
-                        file_path = save_session_data(
-                            current_session_id,
-                            current_session_data,
-                            current_session_first_timestamp,
-                            existing_sessions,
-                            output_dir,
-                            verbose
-                        )
-                        session_files_written.append(file_path)
-                        stats["sessions_processed"] += 1
-
-                        if current_session_id in existing_sessions:
-                            stats["sessions_updated"] += 1
-                        else:
-                            stats["sessions_created"] += 1
-
-                    # Reset for new session
-                    current_session_data = {}
-                    current_session_first_timestamp = None
-
-                # Set current session
-                if current_session_id != session_id:
-                    current_session_id = session_id
-                    print(f"🔄 Processing session: {session_id}")
-
-                    # Load existing data if session file exists
-                    if session_id in existing_sessions:
-                        print(f"   ↪ Appending to existing session file")
-                        existing_data = load_session_file(existing_sessions[session_id])
-                        # Convert list to dict keyed by prompt_id
-                        for entry in existing_data:
-                            # Extract prompt_id from request, response, or error attributes
-                            entry_prompt_id = None
-                            if entry.get("request") and "prompt_id" in entry["request"]:
-                                entry_prompt_id = entry["request"]["prompt_id"]
-                            elif entry.get("response") and "prompt_id" in entry["response"]:
-                                entry_prompt_id = entry["response"]["prompt_id"]
-                            elif entry.get("error") and "prompt_id" in entry["error"]:
-                                entry_prompt_id = entry["error"]["prompt_id"]
-
-                            if entry_prompt_id:
-                                current_session_data[entry_prompt_id] = entry
-
-                # Track first timestamp for this session
-                if current_session_first_timestamp is None and timestamp:
-                    current_session_first_timestamp = timestamp
-
-                # Initialize entry if needed
-                if prompt_id not in current_session_data:
-                    current_session_data[prompt_id] = {
-                        "request": None,
-                        "response": None,
-                        "error": None
-                    }
-
-                # Process based on event type (parse JSON fields before storing)
-                if event_name == EVENT_REQUEST:
-                    current_session_data[prompt_id]["request"] = parse_json_fields(attrs, JSON_STRING_FIELDS, verbose)
-                    stats["requests"] += 1
-                    if verbose:
-                        print(f"   ✓ Request: {prompt_id}")
-
-                elif event_name == EVENT_RESPONSE:
-                    current_session_data[prompt_id]["response"] = parse_json_fields(attrs, JSON_STRING_FIELDS, verbose)
-                    stats["responses"] += 1
-                    if verbose:
-                        print(f"   ✓ Response: {prompt_id}")
-
-                elif event_name == EVENT_ERROR:
-                    current_session_data[prompt_id]["error"] = parse_json_fields(attrs, JSON_STRING_FIELDS, verbose)
-                    stats["errors"] += 1
-                    if verbose:
-                        print(f"   ✓ Error: {prompt_id}")
-                else:
-                    stats["skipped"] += 1
-
-            # Save final session
-            if current_session_id and current_session_data:
-                file_path = save_session_data(
-                    current_session_id,
-                    current_session_data,
-                    current_session_first_timestamp,
-                    existing_sessions,
-                    output_dir,
-                    verbose
-                )
-                session_files_written.append(file_path)
-                stats["sessions_processed"] += 1
-
-                if current_session_id in existing_sessions:
-                    stats["sessions_updated"] += 1
-                else:
-                    stats["sessions_created"] += 1
+    name = "api_sessions"
+    events = {*API_EVENTS, EVENT_TOOL_CALL}
+    accepts_parsed = True
+
+    def __init__(self, output_dir: Path, existing_sessions: sessionregistry.SessionRegistry, verbose: bool = False,
+                 dedup: bool = True, buffer_bytes: int = DEFAULT_BUFFER_BYTES):
+        self.output_dir = output_dir
+        self.existing_sessions = existing_sessions
+        self.verbose = verbose
+        self.dedup = dedup
+        self.stats = new_stats()
+        # Only entries touched since the last flush are buffered; existing
+        # sessions are appended to, not reloaded
+        self.buffers = SessionBuffers(self._save_buffer, buffer_bytes)
+        self.search = None  # opened by the first save after a flush
+
+    def store(self, session_id: str, buf: dict) -> tuple:
+        """Write one buffered session; returns (session file name, whether it is new)."""
+        file_path, is_new = save_session_data(
+            session_id,
+            buf["data"],
+            buf["first_timestamp"],
+            self.existing_sessions,
+            self.output_dir,
+            self.verbose,
+            self.dedup
+        )
+        if file_path not in self.stats["session_files"]:
+            self.stats["session_files"].append(file_path)
+        return file_path.name, is_new
+
+    def session_filename(self, session_id: str) -> Optional[str]:
+        """Name of the session's stored file, if it has one."""
+        path = self.existing_sessions.path(session_id)
+        return path.name if path else None
+
+    def _save_buffer(self, session_id: str, buf: dict):
+        """Save one buffered session, index it (and its tool calls) for search and count it."""
+        if buf["data"]:
+            with WRITE_SECONDS.time():
+                filename, is_new = self.store(session_id, buf)
+        else:
+            # Only tool calls: they belong to entries saved earlier, if any
+            filename, is_new = self.session_filename(session_id), False
+            if filename is None or not buf["tools"]:
+                return
+        if self.search is None:
+            self.search = searchindex.SearchIndex(SEARCH_DB)
+        with INDEX_SECONDS.time():
+            self.search.index_entries(filename, buf["data"])
+            self.search.index_tool_calls(filename, buf["tools"])
+        if not buf["data"]:
+            return
+        stats = self.stats
+        stats["sessions_processed"] += 1
+        if is_new:
+            stats["sessions_created"] += 1
+        else:
+            stats["sessions_updated"] += 1
+
+    def handle(self, record: telemetryrecord.TelemetryRecord):
+        stats = self.stats
+        stats["total_records"] += 1
+
+        # Progress indicator
+        if self.verbose and stats["total_records"] % 100 == 0:
+            print(f"   Processed {stats['total_records']} records...")
+
+        # Extract metadata
+        attrs = record.attributes
+        prompt_id = record.prompt_id
+        session_id = record.session_id
+        timestamp = record.timestamp
+
+        # Skip records without session_id or prompt_id
+        if not session_id or not prompt_id:
+            stats["skipped"] += 1
+            RECORDS.inc(kind="skipped")
+            return
+
+        buf, created = self.buffers.touch(session_id)
+        if created:
+            print(f"🔄 Processing session: {session_id}")
+            if session_id in self.existing_sessions:
+                print(f"   ↪ Appending to existing session file")
+        session_data = buf["data"]  # prompt_id -> {request, response, error}
+
+        # Track first timestamp for this session
+        if buf["first_timestamp"] is None and timestamp:
+            buf["first_timestamp"] = timestamp
+
+        if record.event == EVENT_TOOL_CALL:
+            # Not stored, only indexed for search under its prompt_id
+            buf["tools"].setdefault(prompt_id, []).append(attrs)
+            RECORDS.inc(kind="tool_call")
+            self.buffers.charge(session_id, estimate_size(attrs))
+            return
+
+        # Other events (user_prompt, ...) share the prompt_id but never
+        # create an entry: one with every slot empty can't be matched by a
+        # later delta once written
+        kind = EVENT_KINDS.get(record.event)
+        if kind is None:
+            stats["skipped"] += 1
+            RECORDS.inc(kind="skipped")
+            return
+
+        # Initialize entry if needed
+        if prompt_id not in session_data:
+            session_data[prompt_id] = {
+                "request": None,
+                "response": None,
+                "error": None
+            }
+
+        # Parse JSON fields before storing
+        with NORMALIZE_SECONDS.time():
+            session_data[prompt_id][kind] = parse_json_fields(attrs, JSON_STRING_FIELDS, self.verbose)
+        stats[kind + "s"] += 1
+        RECORDS.inc(kind=kind)
+        if self.verbose:
+            print(f"   ✓ {kind.capitalize()}: {prompt_id}")
+
+        self.buffers.charge(session_id, estimate_size(attrs))
+
+    def flush(self):
+        # Save every buffered session
+        self.buffers.flush_all()
+        # Detached first, so an interrupted close is never closed again
+        search, self.search = self.search, None
+        if search is not None:
+            search.close()
+
+class SqliteSessionSink(ApiSessionSink):
+    """ApiSessionSink for --store sqlite: sessions go to SESSIONS_DB, one transaction per flush()."""
+
+    def __init__(self, db_path: Path, verbose: bool = False, dedup: bool = True,
+                 buffer_bytes: int = DEFAULT_BUFFER_BYTES):
+        self.db = sessiondb.SessionDB(db_path)
+        super().__init__(db_path.parent, self.db.sessions(), verbose, dedup, buffer_bytes)
+
+    def store(self, session_id: str, buf: dict) -> tuple:
+        filename, is_new = self.db.upsert(session_id, buf["data"], buf["first_timestamp"], self.dedup)
+        self.existing_sessions[session_id] = filename
+        if self.verbose:
+            print(f"   💾 {'Created' if is_new else 'Updated'} {filename} in {SESSIONS_DB.name}")
+        return filename, is_new
+
+    def session_filename(self, session_id: str) -> Optional[str]:
+        return self.existing_sessions.get(session_id)
+
+    def flush(self):
+        self.buffers.flush_all()
+        self.db.commit()
+        super().flush()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+def session_sink(store: str, output_dir: Path, verbose: bool = False, dedup: bool = True,
+                 buffer_bytes: int = DEFAULT_BUFFER_BYTES) -> ApiSessionSink:
+    """The sink that stores sessions: JSON files in output_dir, or SESSIONS_DB with store="sqlite"."""
+    if store == "sqlite":
+        api = SqliteSessionSink(SESSIONS_DB, verbose, dedup, buffer_bytes)
+        print(f"📂 Found {len(api.existing_sessions)} existing session(s) in {SESSIONS_DB}")
+    else:
+        api = ApiSessionSink(output_dir, get_existing_sessions(output_dir), verbose, dedup, buffer_bytes)
+        print(f"📂 Found {len(api.existing_sessions)} existing session file(s)")
+    return api
+
+def build_pipeline(api: ApiSessionSink, session_logs: bool = False) -> Pipeline:
+    """The sinks fed by one read of the log: API sessions, stats and optionally watcher.py's session logs."""
+    sinks = [api, rollups.RollupsSink(ROLLUPS_FILE, EVENT_KINDS)]
+    if session_logs:
+        sinks.append(SessionLogSink(SESSION_LOGS_DIR, WriterPool(SESSION_LOG_WRITE_SECONDS)))
+    return Pipeline(sinks)
+
+# ---------- Parallel Parsing ----------
+
+def slim_record(record: dict, events: Optional[set] = None, raw_events: Optional[set] = None) -> dict:
+    """
+    Reduce a record to what the pipeline's sinks use (see Pipeline.events
+    and .raw_events; both None keeps every record whole). API events go
+    out with JSON string fields already parsed unless a sink needs them as
+    logged. Other records keep only the attributes that affect session
+    grouping, so they are cheap to send back from a worker.
+    """
+    decoded = telemetryrecord.TelemetryRecord(record)
+    attrs = decoded.attributes
+    slim = {k: record[k] for k in telemetryrecord.FALLBACK_KEYS if k in record}
+    event = decoded.event
+    if raw_events is None or event in raw_events:
+        slim["attributes"] = attrs
+    elif event in API_EVENTS:
+        slim["attributes"] = parse_json_fields(attrs, JSON_STRING_FIELDS)
+    elif events is None or event in events:
+        slim["attributes"] = attrs
+    else:
+        # Skipped records keep only what decoding them needs
+        slim["attributes"] = {k: attrs[k] for k in telemetryrecord.CORE_ATTRIBUTES if k in attrs}
+    return slim
 
+def parse_byte_range(job: tuple) -> tuple:
+    """
+    Worker: decode the objects in [start, end) of the log file into slim
+    records. Returns (records, warnings for the malformed objects skipped,
+    bytes up to the end of the last object, whether the range ended between
+    objects); the warnings are printed only if the range is used.
+    """
+    import mmap
+    path, start, end, events, raw_events = job
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        chunk = mm[start:end]
+    records = []
+    warnings = []
+    prev = 0
+    scanner = ObjectScanner()
+    for obj_end in scanner.scan(chunk):
+        try:
+            records.append(slim_record(next(ijson.items(chunk[prev:obj_end], "")), events, raw_events))
         except Exception as e:
-            print(f"⚠️  Warning: Error parsing log file: {e}")
-            if verbose:
-                import traceback
-                traceback.print_exc()
+            warnings.append(f"⚠️  Warning: Skipping malformed record at byte {start + prev} of {Path(path).name}: {e}")
+        prev = obj_end
+    return records, warnings, prev, scanner.depth == 0 and not scanner.in_string
+
+# A '}' ending a line and a '{' starting the next. Nested values are
+# separated by commas and strings can't hold a raw newline, so in well-formed
+# JSON this only occurs between top-level objects, pretty-printed or one per line
+OBJECT_BOUNDARY = re.compile(rb'\}[ \t\r]*\n(?=\{)')
+# Smallest byte range handed to a worker
+MIN_RANGE_BYTES = 1024 * 1024
+
+def split_ranges(buf, parts: int, min_bytes: Optional[int] = None) -> List[tuple]:
+    """
+    Cut buf into about `parts` byte ranges at likely object boundaries
+    (OBJECT_BOUNDARY), found by a search from each target offset rather
+    than a scan of the whole file. The workers check each cut.
+    """
+    size = len(buf)
+    target = max(min_bytes or MIN_RANGE_BYTES, size // parts + 1)
+    ranges = []
+    start = 0
+    while size - start > target:
+        m = OBJECT_BOUNDARY.search(buf, start + target)
+        if not m:
+            break
+        ranges.append((start, m.start() + 1))
+        start = m.start() + 1
+    ranges.append((start, size))
+    return ranges
+
+def iter_records_parallel(log_path: Path, workers: int, verbose: bool = False,
+                          entry: Optional[dict] = None, pipeline: Optional[Pipeline] = None):
+    """
+    Yield slim records in file order, decoded by a pool of worker processes.
+
+    The memory-mapped file is cut into byte ranges at likely object
+    boundaries (no serial scan of the whole file); the ranges are decoded
+    in parallel and the results consumed in order, so the output matches
+    the serial path. A range that turns out to end inside an object is
+    decoded again together with the next one. A trailing partial object is
+    left alone. If given, entry["offset"] follows the end of the last
+    object consumed, and records are slimmed to what the pipeline's sinks use.
+    """
+    import mmap
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    if log_path.stat().st_size == 0:
+        return
+    with log_path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # A few ranges per worker keeps them busy when record sizes vary
+        ranges = split_ranges(mm, workers * 4)
+    if verbose:
+        print(f"   ⚡ {len(ranges)} range(s) across {workers} worker(s)")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        events, raw_events = (pipeline.events, pipeline.raw_events) if pipeline else (None, None)
+
+        def submit(start, end):
+            return (start, end), pool.submit(parse_byte_range, (str(log_path), start, end, events, raw_events))
+
+        pending = deque(submit(start, end) for start, end in ranges)
+        while pending:
+            (start, end), future = pending.popleft()
+            records, warnings, consumed, clean = future.result()
+            if not clean and pending:
+                # Not an object boundary after all: the next range started mid-object
+                (_, next_end), _ = pending.popleft()
+                pending.appendleft(submit(start, next_end))
+                continue
+            for warning in warnings:
+                print(warning)
+            yield from records
+            if entry is not None:
+                entry["offset"] = start + consumed
+
+# ---------- Log Generations ----------
+def load_process_state() -> dict:
+    """
+    Load the processor's checkpoints: {"files": {inode: {"offset", "size"}}}
+    for log.jsonl and its rotated generations, and the token of the last
+    new session request it acted on.
+    """
+    if PROCESS_STATE_FILE.exists():
+        try:
+            state = json.loads(PROCESS_STATE_FILE.read_text(encoding="utf-8"))
+            if "files" in state:
+                return state
+        except Exception:
+            pass
+    return {"files": {}, "new_session": new_session_token(LOG_FILE)}
+
+def save_process_state(state: dict):
+    with STATE_SAVE_SECONDS.time():
+        temp_file = PROCESS_STATE_FILE.with_suffix(".tmp")
+        temp_file.write_text(json.dumps(state, indent=2), encoding="utf-8")
+        temp_file.replace(PROCESS_STATE_FILE)
+
+def has_unread(path: Path, offset: int) -> bool:
+    """True if anything but trailing whitespace follows offset."""
+    with path.open("rb") as f:
+        f.seek(offset)
+        return bool(f.read(4096).strip())
+
+def records_from(path: Path, entry: dict, workers: int = 0, verbose: bool = False,
+                 pipeline: Optional[Pipeline] = None):
+    """
+    Yield the records of the complete objects in `path` after
+    entry["offset"], advancing the offset as they are consumed. Malformed
+    objects are reported and skipped.
+    """
+    if workers > 0 and entry["offset"] == 0:
+        yield from iter_records_parallel(path, workers, verbose, entry, pipeline)
+        return
+    with path.open("rb") as f:
+        for raw, end in iter_complete_objects(f, entry["offset"]):
+            try:
+                with PARSE_SECONDS.time():
+                    record = next(ijson.items(raw, ""))
+            except Exception as e:
+                print(f"⚠️  Warning: Skipping malformed record at byte {entry['offset']} of {path.name}: {e}")
+                record = None
+            if record is not None:
+                yield record
+            entry["offset"] = end
+
+def process_log_file(output_dir: Path, verbose: bool = False, dedup: bool = True,
+                     buffer_bytes: int = DEFAULT_BUFFER_BYTES, workers: int = 0,
+                     rotate_log: bool = True, session_logs: bool = False, store: str = "files") -> Dict[str, any]:
+    """
+    Rotate log.jsonl into a new generation (holding the log lock only for
+    the rename), then process every pending generation and whatever the
+    live log holds. With workers > 0 unread files are decoded by that many
+    processes; with session_logs the same pass writes watcher.py's
+    session logs. Sessions are stored as `store` ("files" or "sqlite").
+
+    Returns:
+        Dict with processing statistics
+    """
+    api = session_sink(store, output_dir, verbose, dedup, buffer_bytes)
+
+    if rotate_log:
+        print(f"🔒 Acquiring file lock...")
+        with metrics.timed_lock(FileLock(LOCK_FILE, timeout=10), LOCK_WAIT_SECONDS, name="log"):
+            generation = rotate(LOG_FILE)
+        if generation:
+            print(f"🔄 Rotated {LOG_FILE.name} to {generation.name}")
+
+    pipeline = build_pipeline(api, session_logs)
+    state = load_process_state()
+    pipeline.restore(state.get("sinks", {}))
+    print(f"⏳ Processing events...")
+    try:
+        process_pending(state, pipeline, verbose, workers)
+    finally:
+        pipeline.close()
+    dump_metrics()
+    return api.stats
 
-    stats["session_files"] = session_files_written
-    return stats
+def watcher_done(key: str, offset: int) -> bool:
+    """
+    False while watcher.py's checkpoint has the file with inode `key` read
+    to less than `offset`. The watcher only reads generations it followed
+    as log.jsonl, so a file its checkpoint doesn't list is not waited for.
+    """
+    try:
+        files = json.loads(WATCHER_STATE_FILE.read_text(encoding="utf-8")).get("files", {})
+    except FileNotFoundError:
+        return True
+    except (ValueError, AttributeError):
+        return False  # mid-write or unreadable: decide on the next pass
+    entry = files.get(key)
+    return entry is None or entry.get("offset", 0) >= offset
+
+def process_pending(state: dict, pipeline: Pipeline, verbose: bool = False, workers: int = 0):
+    """
+    Feed everything not yet read from the rotated generations (oldest
+    first) and from log.jsonl itself through the pipeline. Reads are
+    lock-free; after each file the sinks are flushed and the checkpoint
+    (file offsets plus sink state) saved. Generations that are sealed and
+    fully read, by this processor and by watcher.py, are deleted.
+    """
+    files = state["files"]
+    token = new_session_token(LOG_FILE)
+    if token != state.get("new_session"):
+        # truncate.py asked for a new session
+        pipeline.restart()
+        state["new_session"] = token
+        state["sinks"] = pipeline.state()
+        save_process_state(state)
+    for path, key, restarted in pending_files(LOG_FILE, files):
+        entry = files[key]
+        if restarted:
+            # A new or truncated file starts a new stream for the sinks
+            pipeline.restart()
+        unread = has_unread(path, entry["offset"])
+        if unread and (verbose or path != LOG_FILE):
+            where = f" from byte {entry['offset']:,}" if entry["offset"] else ""
+            print(f"📖 Reading {path.name}{where}")
+        if unread or restarted:
+            try:
+                pipeline.feed(records_from(path, entry, workers, verbose, pipeline))
+            except Exception as e:
+                # Whatever was read before the error is still saved
+                print(f"⚠️  Warning: Error parsing log file: {e}")
+                if verbose:
+                    import traceback
+                    traceback.print_exc()
+            pipeline.flush()
+            state["sinks"] = pipeline.state()
+            save_process_state(state)
+
+        if path != LOG_FILE and is_sealed(LOG_FILE, path):
+            # Leave it until watcher.py has read it too
+            if watcher_done(key, entry["offset"]):
+                if has_unread(path, entry["offset"]):
+                    print(f"⚠️  Warning: {path.name} ends with an incomplete record; discarding it")
+                path.unlink()
+                del files[key]
+                save_process_state(state)
+                if verbose:
+                    print(f"🧹 Removed processed generation: {path.name}")
+
+# ---------- Follow Mode ----------
+def follow(output_dir: Path, max_delay: float, verbose: bool = False, dedup: bool = True,
+           buffer_bytes: int = DEFAULT_BUFFER_BYTES, session_logs: bool = False, store: str = "files") -> int:
+    """
+    Keep running and process records as Gemini appends them.
+
+    Progress is checkpointed per file as a byte offset in PROCESS_STATE_FILE,
+    so each pass only reads what is new. The log is never rotated in this
+    mode, and no lock is needed to read it; pending generations left by
+    earlier batch runs (or truncate.py) are processed as well. With
+    session_logs this replaces running watcher.py alongside.
+    """
+    from watchfiles import watch
+
+    state = load_process_state()
+    totals = new_stats()
+    log_path = str(LOG_FILE.resolve())
+    marker_path = str(new_session_marker(LOG_FILE).resolve())
+
+    print(f"👀 Following {LOG_FILE} (max delay {max_delay:.1f}s, Ctrl+C to stop)")
+    api = session_sink(store, output_dir, verbose, dedup, buffer_bytes)
+    pipeline = build_pipeline(api, session_logs)
+    pipeline.restore(state.get("sinks", {}))
+    print()
+
+    def run_pass():
+        stats = api.stats = new_stats()
+        process_pending(state, pipeline, verbose)
+        dump_metrics()
+        if not stats["total_records"]:
+            return
+        for key in totals:
+            if key != "session_files":
+                totals[key] += stats[key]
+        print(f"✓ {stats['total_records']} new record(s), "
+              f"{stats['sessions_processed']} session file(s) written")
+
+    try:
+        run_pass()
+        for changes in watch(LOG_FILE.parent, debounce=int(max_delay * 1000), recursive=False,
+                             watch_filter=lambda change, path: path in (log_path, marker_path)
+                             or path.startswith(log_path + ".")):
+            run_pass()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.close()
+
+    print(f"\n👋 Stopped following. {totals['total_records']} record(s), "
+          f"{totals['sessions_created']} new / {totals['sessions_updated']} updated session write(s)")
+    return 0
 
 def format_output(grouped_events: Dict[str, Dict[str, any]], parse_json: bool = True, verbose: bool = False) -> List[dict]:
     """
@@ -372,7 +901,8 @@ def format_output(grouped_events: Dict[str, Dict[str, any]], parse_json: bool =
 
     return output
 
-def save_session_file(data: List[dict], session_id: str, first_timestamp: str, output_dir: Path) -> Path:
+def save_session_file(data: List[dict], session_id: str, first_timestamp: str, output_dir: Path,
+                      dedup: bool = False) -> Path:
     """
     Save session data to file.
     Filename format: {first_timestamp}-{session_id}.json
@@ -390,24 +920,14 @@ def save_session_file(data: List[dict], session_id: str, first_timestamp: str, o
 
     output_file = output_dir / f"{timestamp_str}-{session_id}.json"
 
-    # Write to temp file first, then replace (atomic operation)
-    temp_file = output_file.with_suffix(".tmp")
-
-    with temp_file.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    if dedup:
+        sessionstore.dedup_entries(output_file, data)
 
-    temp_file.replace(output_file)
+    # Write to temp file first, then replace (atomic operation)
+    sessionstore.write_base(output_file, data)
 
     return output_file
 
-def clear_log_file(log_path: Path, verbose: bool = False):
-    """Clear the log file content."""
-    if verbose:
-        print(f"🧹 Clearing log file: {log_path}")
-
-    with log_path.open("w", encoding="utf-8") as f:
-        f.write("")  # Truncate to empty
-
 def print_summary(stats: dict):
     """Print processing summary."""
     print("\n" + "="*60)
@@ -428,6 +948,12 @@ def print_summary(stats: dict):
             size = file_path.stat().st_size
             print(f"   - {file_path.name} ({size:,} bytes)")
 
+    timings = metrics.REGISTRY.summary()
+    if timings:
+        print(f"\n⏱  Timings (full dump in {METRICS_FILE.name}):")
+        for line in timings:
+            print(f"   {line}")
+
     print("="*60)
 
 # ---------- Main Function ----------
@@ -446,7 +972,7 @@ def main():
     parser.add_argument(
         "--no-clear",
         action="store_true",
-        help="Don't clear the log file after processing"
+        help="Process log.jsonl in place instead of rotating it into a new generation"
     )
     parser.add_argument(
         "--output-dir",
@@ -464,46 +990,150 @@ def main():
         action="store_true",
         help="Keep JSON strings as-is (don't parse to objects)"
     )
+    parser.add_argument(
+        "--follow", "-f",
+        action="store_true",
+        help="Keep running and process new records incrementally (never clears the log)"
+    )
+    parser.add_argument(
+        "--max-delay",
+        type=float,
+        default=1.0,
+        help="With --follow: longest wait in seconds before new records are written (default: 1.0)"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Fold appended session segments into their base files and exit"
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Store full request_text in every entry instead of turn references"
+    )
+    parser.add_argument(
+        "--inflate",
+        action="store_true",
+        help="Rewrite all sessions in the plain format (full request_text, no sidecar files) and exit"
+    )
+    parser.add_argument(
+        "--reindex",
+        action="store_true",
+        help="Rebuild the search index (search.db), stats (rollups.json) and session registry from all session files and exit"
+    )
+    parser.add_argument(
+        "--max-buffer-mb",
+        type=float,
+        default=DEFAULT_BUFFER_MB,
+        help=f"Memory budget for interleaved sessions buffered in one run (default: {DEFAULT_BUFFER_MB})"
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        nargs="?",
+        const=0,
+        default=None,
+        metavar="N",
+        help="Decode the log with N worker processes (default when given without N: all cores)"
+    )
+    parser.add_argument(
+        "--store",
+        choices=("files", "sqlite"),
+        default="files",
+        help=f"Where sessions are kept: JSON files in --output-dir (default) or {SESSIONS_DB}"
+    )
+    parser.add_argument(
+        "--import-files",
+        action="store_true",
+        help=f"Copy the session files in --output-dir into {SESSIONS_DB} and exit"
+    )
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help=f"Write the sessions in {SESSIONS_DB} to --output-dir as JSON files and exit"
+    )
+    parser.add_argument(
+        "--session-logs",
+        action="store_true",
+        help=f"Also write watcher.py's prompts/responses/tools logs to {SESSION_LOGS_DIR} from the same read"
+    )
 
     args = parser.parse_args()
+    dedup = not args.no_dedup
+    workers = 0
+    if args.parallel is not None:
+        import os
+        workers = args.parallel or os.cpu_count() or 1
+    buffer_bytes = int(args.max_buffer_mb * 1024 * 1024)
 
     print("🚀 Gemini CLI API Request Processor")
     print("="*60)
 
-    # Check if log file exists
-    if not LOG_FILE.exists():
+    if args.compact:
+        compacted = compact_sessions(args.output_dir, args.verbose)
+        print(f"🗜  Compacted {compacted} session file(s)")
+        return 0
+
+    if args.inflate:
+        inflated = inflate_sessions(args.output_dir, args.verbose)
+        print(f"🎈 Inflated {inflated} session file(s)")
+        return 0
+
+    if args.reindex:
+        indexed = reindex_sessions(args.output_dir, args.verbose, args.store)
+        print(f"🔎 Indexed {indexed} session(s) into {SEARCH_DB} and {ROLLUPS_FILE}")
+        return 0
+
+    if args.import_files:
+        imported = import_sessions(args.output_dir, args.verbose, dedup)
+        print(f"📥 Imported {imported} session file(s) into {SESSIONS_DB}")
+        return 0
+
+    if args.export:
+        if not SESSIONS_DB.exists():
+            print(f"❌ Error: {SESSIONS_DB} not found (sessions are only stored there with --store sqlite)")
+            return 1
+        exported = export_sessions(args.output_dir, args.verbose)
+        print(f"📤 Exported {exported} changed session(s) to {args.output_dir}")
+        return 0
+
+    if args.follow:
+        try:
+            with metrics.timed_lock(FileLock(RUN_LOCK_FILE, timeout=10), LOCK_WAIT_SECONDS, name="run"):
+                return follow(args.output_dir, args.max_delay, args.verbose, dedup, buffer_bytes,
+                              args.session_logs, args.store)
+        except Timeout:
+            print(f"❌ Error: Another processor is already running (could not acquire {RUN_LOCK_FILE.name})")
+            return 1
+
+    # Check if there is anything to process
+    generations = generation_paths(LOG_FILE)
+    if not LOG_FILE.exists() and not generations:
         print(f"❌ Error: Log file not found: {LOG_FILE}")
         print(f"   Make sure Gemini CLI has run with telemetry enabled.")
         return 1
 
-    # Check if log file is empty
-    if LOG_FILE.stat().st_size == 0:
+    if not generations and LOG_FILE.stat().st_size == 0:
         print(f"⚠️  Warning: Log file is empty: {LOG_FILE}")
         print(f"   No data to process.")
         return 0
 
-    # Acquire file lock
-    lock = FileLock(LOCK_FILE, timeout=10)
+    # Only one processor at a time; the log lock is taken just to rotate
+    run_lock = FileLock(RUN_LOCK_FILE, timeout=10)
 
     try:
-        print(f"🔒 Acquiring file lock...")
-        with lock:
-            print(f"✓ Lock acquired\n")
+        with metrics.timed_lock(run_lock, LOCK_WAIT_SECONDS, name="run"):
+            if args.no_clear:
+                print(f"⚠️  Log file NOT rotated (--no-clear specified)\n")
 
-            # Process log file
-            stats = process_log_file(LOG_FILE, args.output_dir, args.verbose)
+            stats = process_log_file(args.output_dir, args.verbose, dedup, buffer_bytes, workers,
+                                     rotate_log=not args.no_clear, session_logs=args.session_logs,
+                                     store=args.store)
 
             if stats.get('sessions_processed', 0) == 0:
-                print(f"\n⚠️  No sessions found in log file.")
+                print(f"\n⚠️  No new sessions found in log file.")
                 return 0
 
-            # Clear log file if requested
-            if not args.no_clear:
-                clear_log_file(LOG_FILE, args.verbose)
-                print(f"\n✓ Log file cleared")
-            else:
-                print(f"\n⚠️  Log file NOT cleared (--no-clear specified)")
-
             # Print summary
             print_summary(stats)
 
@@ -522,11 +1152,6 @@ def main():
             traceback.print_exc()
         return 1
 
-    finally:
-        # Release lock (happens automatically with context manager)
-        if lock.is_locked:
-            print(f"\n🔓 Releasing file lock...")
-
 if __name__ == "__main__":
     import sys
     sys.exit(main())
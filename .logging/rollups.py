@@ -0,0 +1,334 @@
+"""
+Aggregate statistics (rollups) over processed API events.
+
+process-api-requests.py adds every request/response/error event it
+processes (through RollupsSink); server.py answers /api/stats from the saved file without
+touching the session files. Each rollup holds counts, token sums, error
+types and a latency sketch, and is kept:
+
+    totals    everything
+    models    per model
+    sessions  per session id (ids survive session renames)
+    series    per hour bucket ("YYYY-MM-DDTHH") and model
+
+The latency sketch is a log-bucketed histogram: quantiles come out within
+SKETCH_ACCURACY relative error and sketches merge by adding counts, so
+day buckets and filtered totals are built from the hourly ones. Hour
+buckets older than SERIES_HOURLY_DAYS (before the newest bucket) are
+folded into day buckets to keep the file small. Stdlib only.
+"""
+
+from __future__ import annotations
+import json
+import math
+import re
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pipeline import Sink
+from sessionindex import TOKEN_FIELDS
+
+ROLLUPS_VERSION = 1
+
+SKETCH_ACCURACY = 0.01
+_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+SERIES_HOURLY_DAYS = 14
+QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+_HOUR = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}")
+
+
+def new_rollup() -> dict:
+    return {
+        "requests": 0,
+        "responses": 0,
+        "errors": 0,
+        "tokens": dict.fromkeys(TOKEN_FIELDS, 0),
+        "errorTypes": {},
+        "latency": {"count": 0, "sum": 0, "max": 0, "sketch": {}},
+    }
+
+
+# ---------- latency sketch ----------
+
+def sketch_add(sketch: Dict[str, int], value: float, count: int = 1):
+    """Count a value (ms; anything under 1 counts as 1) into its bucket."""
+    key = str(math.ceil(math.log(max(value, 1)) / _LOG_GAMMA))
+    sketch[key] = sketch.get(key, 0) + count
+
+
+def sketch_quantile(sketch: Dict[str, int], q: float) -> Optional[float]:
+    total = sum(sketch.values())
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for key in sorted(sketch, key=int):
+        seen += sketch[key]
+        if seen > rank:
+            return round(2 * _GAMMA ** int(key) / (_GAMMA + 1), 1)
+    return None
+
+
+def merge(into: dict, rollup: dict):
+    """Add rollup's counts into `into`."""
+    for name in ("requests", "responses", "errors"):
+        into[name] += rollup[name]
+    for name, value in rollup["tokens"].items():
+        into["tokens"][name] = into["tokens"].get(name, 0) + value
+    for name, value in rollup["errorTypes"].items():
+        into["errorTypes"][name] = into["errorTypes"].get(name, 0) + value
+    latency, other = into["latency"], rollup["latency"]
+    latency["count"] += other["count"]
+    latency["sum"] += other["sum"]
+    latency["max"] = max(latency["max"], other["max"])
+    for key, count in other["sketch"].items():
+        latency["sketch"][key] = latency["sketch"].get(key, 0) + count
+
+
+def view(rollup: dict) -> dict:
+    """The public form of a rollup: derived rates and quantiles instead of the sketch."""
+    latency = rollup["latency"]
+    completed = rollup["responses"] + rollup["errors"]
+    result = {
+        "requests": rollup["requests"],
+        "responses": rollup["responses"],
+        "errors": rollup["errors"],
+        "errorRate": round(rollup["errors"] / completed, 4) if completed else 0.0,
+        "tokens": rollup["tokens"],
+        "errorTypes": rollup["errorTypes"],
+        "latencyMs": {
+            "count": latency["count"],
+            "mean": round(latency["sum"] / latency["count"], 1) if latency["count"] else None,
+            "max": latency["max"] if latency["count"] else None,
+        },
+    }
+    for name, q in QUANTILES.items():
+        result["latencyMs"][name] = sketch_quantile(latency["sketch"], q)
+    for name in ("first", "last"):
+        if name in rollup:
+            result[name] = rollup[name]
+    return result
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def add_event(rollup: dict, kind: str, attrs: dict):
+    """Count one event ("request", "response" or "error") into a rollup."""
+    if kind == "request":
+        rollup["requests"] += 1
+        return
+    if kind == "response":
+        rollup["responses"] += 1
+        for name, attr in TOKEN_FIELDS.items():
+            value = _number(attrs.get(attr))
+            if value:
+                rollup["tokens"][name] += int(value)
+    else:
+        rollup["errors"] += 1
+        error_type = str(attrs.get("error_type") or attrs.get("status_code") or "unknown")
+        rollup["errorTypes"][error_type] = rollup["errorTypes"].get(error_type, 0) + 1
+    duration = _number(attrs.get("duration_ms"))
+    if duration is not None and duration >= 0:
+        latency = rollup["latency"]
+        latency["count"] += 1
+        latency["sum"] += duration
+        latency["max"] = max(latency["max"], duration)
+        sketch_add(latency["sketch"], duration)
+
+
+def empty() -> dict:
+    return {"version": ROLLUPS_VERSION, "totals": new_rollup(), "models": {}, "sessions": {}, "series": {}}
+
+
+def load(path: Path) -> dict:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("version") == ROLLUPS_VERSION:
+            return data
+    except (FileNotFoundError, ValueError, AttributeError):
+        pass
+    return empty()
+
+
+class Rollups:
+    """The rollups file, updated in memory by add() and written by save()."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.data = load(path)
+
+    def clear(self):
+        self.data = empty()
+
+    def add(self, kind: str, session_id: str, timestamp: Optional[str], attrs: dict):
+        model = attrs.get("model") or "unknown"
+        data = self.data
+        add_event(data["totals"], kind, attrs)
+        add_event(data["models"].setdefault(model, new_rollup()), kind, attrs)
+        session = data["sessions"].get(session_id)
+        if session is None:
+            session = data["sessions"][session_id] = new_rollup()
+        add_event(session, kind, attrs)
+        if timestamp:
+            timestamp = str(timestamp)
+            if "first" not in session or timestamp < session["first"]:
+                session["first"] = timestamp
+            if timestamp > session.get("last", ""):
+                session["last"] = timestamp
+            if _HOUR.match(timestamp):
+                bucket = data["series"].setdefault(timestamp[:13], {})
+                add_event(bucket.setdefault(model, new_rollup()), kind, attrs)
+
+    def add_entry(self, session_id: str, entry: dict):
+        """Count a stored session entry ({request, response, error}) as its events."""
+        for kind in ("request", "response", "error"):
+            attrs = entry.get(kind)
+            if attrs:
+                self.add(kind, session_id, attrs.get("event.timestamp"), attrs)
+
+    def compact_series(self):
+        """Fold hour buckets older than SERIES_HOURLY_DAYS into day buckets."""
+        series = self.data["series"]
+        hours = [key for key in series if len(key) == 13]
+        if not hours:
+            return
+        newest = datetime.strptime(max(hours), "%Y-%m-%dT%H")
+        cutoff = (newest - timedelta(days=SERIES_HOURLY_DAYS)).strftime("%Y-%m-%dT%H")
+        for key in hours:
+            if key < cutoff:
+                day = series.setdefault(key[:10], {})
+                for model, rollup in series.pop(key).items():
+                    merge(day.setdefault(model, new_rollup()), rollup)
+
+    def save(self):
+        self.compact_series()
+        temp_file = self.path.with_suffix(".tmp")
+        temp_file.write_text(json.dumps(self.data), encoding="utf-8")
+        temp_file.replace(self.path)
+
+
+class RollupsSink(Sink):
+    """
+    Pipeline sink counting API events as they are read. `kinds` maps event
+    names to "request", "response" or "error"; like the session files,
+    only events with a session id and prompt_id count. The file is loaded
+    on the first event after a flush, so a concurrent --reindex is not
+    overwritten with stale totals.
+    """
+
+    name = "rollups"
+    accepts_parsed = True
+
+    def __init__(self, path: Path, kinds: Dict[str, str]):
+        self.path = path
+        self.kinds = kinds
+        self.events = set(kinds)
+        self.rollups: Optional[Rollups] = None
+
+    def handle(self, record):
+        kind = self.kinds.get(record.event)
+        if kind is None or not record.session_id or not record.prompt_id:
+            return
+        if self.rollups is None:
+            self.rollups = Rollups(self.path)
+        self.rollups.add(kind, record.session_id, record.timestamp, record.attributes)
+
+    def flush(self):
+        if self.rollups is not None:
+            self.rollups.save()
+            self.rollups = None
+
+
+# ---------- reporting ----------
+
+def report(data: dict, params: Dict[str, List[str]]) -> dict:
+    """
+    Stats for /api/stats, filtered by query parameters:
+
+        model         one model only
+        from, to      bucket range (inclusive, "YYYY-MM-DD[THH]"); totals
+                      then come from the series instead of all-time counts
+        bucket        series granularity, hour (default) or day
+        session       a session id: that session's rollup only
+
+    Returns {"totals", "models", "series"} (or {"session"}); raises
+    ValueError on bad parameters and LookupError for an unknown session.
+    """
+    def param(name, default=None):
+        return params.get(name, [default])[-1]
+
+    if param("session"):
+        session = data["sessions"].get(param("session"))
+        if session is None:
+            raise LookupError(f"No stats for session {param('session')}")
+        return {"session": view(session)}
+
+    model = param("model")
+    since, until = param("from"), param("to")
+    bucket = param("bucket", "hour")
+    if bucket not in ("hour", "day"):
+        raise ValueError(f"Unknown bucket: {bucket}")
+    if until and "T" not in until:
+        until += "T23"  # a bare date includes the whole day
+
+    totals = new_rollup()
+    models: Dict[str, dict] = {}
+    series: Dict[str, dict] = {}
+    for key in sorted(data["series"]):
+        # Day buckets (folded history) cover the whole day
+        if (since and key < since[:len(key)]) or (until and key > until[:len(key)]):
+            continue
+        point = series.setdefault(key if bucket == "hour" else key[:10], new_rollup())
+        for name, rollup in data["series"][key].items():
+            if model and name != model:
+                continue
+            merge(point, rollup)
+            if since or until:
+                merge(totals, rollup)
+                merge(models.setdefault(name, new_rollup()), rollup)
+
+    if not (since or until):
+        if model:
+            totals = data["models"].get(model) or new_rollup()
+            models = {model: totals} if model in data["models"] else {}
+        else:
+            totals, models = data["totals"], data["models"]
+
+    return {
+        "totals": view(totals),
+        "models": {name: view(rollup) for name, rollup in sorted(models.items())},
+        "series": [{"bucket": key, **view(point)} for key, point in series.items()],
+    }
+
+
+class RollupsCache:
+    """Read-side cache of the rollups file, reloaded when it changes. Thread-safe."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.sig = None
+        self.data = empty()
+
+    def get(self) -> tuple:
+        """(data, signature); the signature is None while there is no file yet."""
+        with self.lock:
+            try:
+                st = self.path.stat()
+                sig = [st.st_mtime_ns, st.st_size]
+            except FileNotFoundError:
+                sig = None
+            if sig != self.sig:
+                self.data = load(self.path)
+                self.sig = sig
+            return self.data, self.sig
@@ -0,0 +1,235 @@
+"""
+Full-text search over processed sessions (SQLite FTS5, stdlib only).
+
+process-api-requests.py indexes every entry it writes; server.py answers
+/api/search from the same database. One document is kept per
+(session file, prompt_id, field):
+
+    request   text of the user/tool turns this request added
+    response  model text from response_text
+    tools     function calls/responses (names and arguments) from either side,
+              and the name and function_args of gemini_cli.tool_call events
+    error     error message, type and status code
+
+request_text repeats the whole conversation, so only turns not yet seen in
+that session are indexed (tracked by turn hash in the `turns` table; with a
+deduplicated request_text those are exactly the turns stored inline). A document
+is replaced when its entry is written again, except tools, which only gains
+lines: tool calls are indexed apart from the entry, and each write of it
+brings only its new turns. The database runs in WAL mode
+so the server can query while the processor writes.
+"""
+
+from __future__ import annotations
+import json
+import re
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import sessionstore
+
+FIELDS = ("request", "response", "tools", "error")
+TOOL_KEYS = ("functionCall", "functionResponse")
+TOOL_CALL_ATTRS = ("function_name", "function_args")
+ERROR_ATTRS = ("error", "error_type", "status_code")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    prompt_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    UNIQUE (file, prompt_id, field)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5(text, tokenize = 'unicode61 remove_diacritics 2');
+CREATE TABLE IF NOT EXISTS turns (
+    file TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (file, hash)
+) WITHOUT ROWID;
+"""
+
+
+def collect_text(value, text: List[str], tools: List[str]):
+    """Gather "text" strings into text and function call/response payloads into tools."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in TOOL_KEYS:
+                tools.append(json.dumps(item, ensure_ascii=False))
+            elif key == "text" and isinstance(item, str):
+                text.append(item)
+            else:
+                collect_text(item, text, tools)
+    elif isinstance(value, list):
+        for item in value:
+            collect_text(item, text, tools)
+
+
+def parse_maybe_json(value):
+    """request_text/response_text are JSON strings when processed with --raw."""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return {"text": value}
+    return value
+
+
+def match_query(q: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every word must match, the last as a prefix."""
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class SearchIndex:
+    def __init__(self, db_path: Path, readonly: bool = False):
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        else:
+            self.conn = sqlite3.connect(db_path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.conn.commit()
+        self.conn.close()
+
+    def close(self):
+        """Commit and close."""
+        self.conn.commit()
+        self.conn.close()
+
+    # ---------- writing ----------
+    def _put(self, file: str, prompt_id: str, field: str, text: str, merge: bool = False):
+        """Store a document; with merge, add its lines to the current one instead of replacing it."""
+        row = self.conn.execute("SELECT id FROM docs WHERE file = ? AND prompt_id = ? AND field = ?",
+                                (file, prompt_id, field)).fetchone()
+        if row:
+            doc_id = row[0]
+            if merge:
+                old = self.conn.execute("SELECT text FROM entries WHERE rowid = ?", (doc_id,)).fetchone()
+                if old:
+                    lines = old[0].split("\n")
+                    lines += [line for line in text.split("\n") if line not in lines]
+                    text = "\n".join(lines)
+            self.conn.execute("DELETE FROM entries WHERE rowid = ?", (doc_id,))
+        else:
+            doc_id = self.conn.execute("INSERT INTO docs (file, prompt_id, field) VALUES (?, ?, ?)",
+                                       (file, prompt_id, field)).lastrowid
+        self.conn.execute("INSERT INTO entries (rowid, text) VALUES (?, ?)", (doc_id, text))
+
+    def _new_turns(self, file: str, request_text) -> list:
+        """The turns of request_text not yet indexed for this session."""
+        request_text = parse_maybe_json(request_text)
+        if sessionstore.is_deduplicated(request_text):
+            turns = sessionstore.inline_turns(request_text)
+        elif isinstance(request_text, list):
+            turns = request_text
+        else:
+            return [request_text]
+        new = []
+        for turn in turns:
+            cur = self.conn.execute("INSERT OR IGNORE INTO turns (file, hash) VALUES (?, ?)",
+                                    (file, sessionstore.turn_hash(turn)))
+            # Model turns repeat earlier responses, which are indexed as such
+            if cur.rowcount and not (isinstance(turn, dict) and turn.get("role") == "model"):
+                new.append(turn)
+        return new
+
+    def index_entries(self, file: str, entries: Dict[str, dict]):
+        """Index the slots present in {prompt_id: entry} for a session file."""
+        for prompt_id, entry in entries.items():
+            text: List[str] = []
+            tools: List[str] = []
+            request = entry.get("request")
+            if request:
+                collect_text(self._new_turns(file, request.get("request_text")), text, tools)
+                if text:
+                    self._put(file, prompt_id, "request", "\n".join(text))
+            response = entry.get("response")
+            if response:
+                response_text: List[str] = []
+                collect_text(parse_maybe_json(response.get("response_text")), response_text, tools)
+                if response_text:
+                    self._put(file, prompt_id, "response", "\n".join(response_text))
+            if tools:
+                self._put(file, prompt_id, "tools", "\n".join(tools), merge=True)
+            error = entry.get("error")
+            if error:
+                parts = [str(error[attr]) for attr in ERROR_ATTRS if error.get(attr) is not None]
+                if parts:
+                    self._put(file, prompt_id, "error", "\n".join(parts))
+
+    def index_tool_calls(self, file: str, tool_calls: Dict[str, List[dict]]):
+        """Add {prompt_id: [tool_call attributes]} to the tools documents of a session file."""
+        for prompt_id, calls in tool_calls.items():
+            lines = []
+            for attrs in calls:
+                for attr in TOOL_CALL_ATTRS:
+                    value = attrs.get(attr)
+                    if value is not None and value != "":
+                        lines.append(value if isinstance(value, str) else json.dumps(value, ensure_ascii=False))
+            if lines:
+                self._put(file, prompt_id, "tools", "\n".join(lines), merge=True)
+
+    def index_session(self, session_file: Path):
+        """(Re)index a whole session file from scratch."""
+        self.remove_file(session_file.name)
+        entries = sessionstore.load_session(session_file, inflate=False)
+        self.index_entries(session_file.name, {
+            sessionstore.entry_prompt_id(entry) or f"#{i}": entry for i, entry in enumerate(entries)
+        })
+
+    def clear(self):
+        self.conn.execute("DELETE FROM entries")
+        self.conn.execute("DELETE FROM docs")
+        self.conn.execute("DELETE FROM turns")
+
+    def remove_file(self, file: str):
+        self.conn.execute("DELETE FROM entries WHERE rowid IN (SELECT id FROM docs WHERE file = ?)", (file,))
+        self.conn.execute("DELETE FROM docs WHERE file = ?", (file,))
+        self.conn.execute("DELETE FROM turns WHERE file = ?", (file,))
+
+    def rename_file(self, old: str, new: str):
+        self.conn.execute("UPDATE docs SET file = ? WHERE file = ?", (new, old))
+        self.conn.execute("UPDATE turns SET file = ? WHERE file = ?", (new, old))
+
+    # ---------- querying ----------
+    def search(self, q: str, limit: int = 20, field: Optional[str] = None) -> List[dict]:
+        """
+        Ranked hits, best first, at most one per (file, prompt_id):
+        [{"filename", "promptId", "field", "score", "snippet"}].
+        """
+        query = match_query(q)
+        if not query:
+            return []
+        sql = ("SELECT d.file, d.prompt_id, d.field, bm25(entries), "
+               "snippet(entries, 0, '[', ']', '…', 12) "
+               "FROM entries JOIN docs d ON d.id = entries.rowid WHERE entries MATCH ?")
+        args: list = [query]
+        if field:
+            sql += " AND d.field = ?"
+            args.append(field)
+        # bm25() is lower for better matches; fetch extra rows since one
+        # entry can match in several fields
+        sql += " ORDER BY bm25(entries) LIMIT ?"
+        args.append(limit * len(FIELDS))
+        hits: Dict[Tuple[str, str], dict] = {}
+        for file, prompt_id, hit_field, rank, snippet in self.conn.execute(sql, args):
+            key = (file, prompt_id)
+            if key not in hits:
+                hits[key] = {"filename": file, "promptId": prompt_id, "field": hit_field,
+                             "score": round(-rank, 3), "snippet": snippet}
+            if len(hits) >= limit:
+                break
+        return list(hits.values())
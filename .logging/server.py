@@ -1,7 +1,7 @@
 #!/usr/bin/env -S uv run --script
 # /// script
 # requires-python = ">=3.10"
-# dependencies = []
+# dependencies = ["watchfiles>=0.21"]
 # ///
 """
 Simple HTTP server for API Request Viewer
@@ -9,20 +9,86 @@ Simple HTTP server for API Request Viewer
 Serves the .logging directory with CORS headers enabled and automatically
 opens the viewer in your default browser.
 
+Requests are handled by a pool of worker threads (--workers) with
+HTTP/1.1 keep-alive, so a large session download doesn't block
+/api/files or other viewer tabs. Idle keep-alive connections wait on a
+selector rather than a worker, so open tabs don't use up the pool.
+
 Usage:
-    uv run .logging/server.py [port]
+    uv run .logging/server.py [port] [--workers N] [--store files|sqlite] [--no-browser]
     python .logging/server.py [port]
 
 Default port: 8000
 """
 
+import io
+import os
 import sys
 import json
+import uuid
+import hashlib
 import re
+import argparse
+import queue
+import selectors
+import socket
+import threading
+import time
 import webbrowser
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 from pathlib import Path
-from urllib.parse import unquote, quote
+from urllib.parse import unquote, quote, urlsplit, parse_qs
+
+import httpcompress
+import metrics
+import rollups
+import sessionevents
+import searchindex
+import sessiondb
+import sessionindex
+import sessionregistry
+import sessionstore
+
+# Worker threads serving requests, and how long an idle keep-alive
+# connection stays open (also the limit for a read or write that stalls)
+DEFAULT_WORKERS = 32
+KEEPALIVE_TIMEOUT = 5
+
+# Most byte ranges honoured in one Range header (more and the whole body is sent)
+MAX_RANGES = 16
+
+# Server-Sent Events: heartbeat interval (seconds) and client reconnect delay
+EVENT_HEARTBEAT = 15
+EVENT_RETRY_MS = 3000
+
+# Entries returned by /api/sessions/<file>/entries when no limit is given, and the cap
+DEFAULT_WINDOW = 50
+MAX_WINDOW = 1000
+
+# Metadata index for /api/files
+INDEX_FILE = Path(__file__).parent / '.session-index.json'
+# Full-text search index written by process-api-requests.py
+SEARCH_DB = Path(__file__).parent / 'search.db'
+MAX_SEARCH_HITS = 200
+# Aggregate stats written by process-api-requests.py
+ROLLUPS_FILE = Path(__file__).parent / 'rollups.json'
+# Sessions written by process-api-requests.py --store sqlite (served with --store sqlite)
+SESSIONS_DB = Path(__file__).parent / 'sessions.db'
+# Rewritten by the processors on every run: compressed in memory rather than
+# leaving a stale .gz/.br/.zst next to each version
+VOLATILE_FILES = {INDEX_FILE.name, ROLLUPS_FILE.name}
+
+# /metrics also serves the processors' dumps (*.prom) found here
+METRICS_DIR = Path(__file__).parent
+API_ROUTES = {'/api/files', '/api/search', '/api/stats', '/api/events', '/api/sessions/rename',
+              '/api/sessions/delete', '/metrics'}
+HTTP_REQUESTS = metrics.counter('api_server_requests_total', 'HTTP requests handled, by route, method and status')
+HTTP_SECONDS = metrics.histogram('api_server_request_seconds', 'Time to handle an HTTP request (event streams excluded)')
+LOCK_WAIT_SECONDS = metrics.histogram('api_server_lock_wait_seconds', 'Waiting for the session events lock')
+EVENT_STREAMS = metrics.gauge('api_server_event_streams', 'Open /api/events streams')
+IDLE_CONNECTIONS = metrics.gauge('api_server_idle_connections', 'Keep-alive connections waiting for their next request')
 
 
 def to_kebab_case(text):
@@ -122,71 +188,738 @@ def build_session_filename(timestamp, session_id, title=None):
     return f"{timestamp}-{session_id}.json"
 
 
+def parse_ranges(header, size):
+    """
+    Parse a Range header against a body of `size` bytes into inclusive
+    (start, end) pairs. Returns None if the header should be ignored
+    (malformed, not bytes, too many ranges) and [] if nothing is satisfiable.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    for part in spec.split(','):
+        first, dash, last = part.strip().partition('-')
+        if not dash:
+            return None
+        try:
+            if not first:
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length <= 0 or size == 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            start = int(first)
+            end = int(last) if last else None
+        except ValueError:
+            return None
+        if start < 0 or (end is not None and end < start):
+            return None
+        if end is None:
+            end = size - 1
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def route_of(path):
+    """Metrics label for a request path (bounded: one per endpoint, not per file)."""
+    path = unquote(urlsplit(path).path)
+    if path in API_ROUTES:
+        return path
+    if re.fullmatch(r'/api/sessions/[^/]+/entries', path):
+        return '/api/sessions/entries'
+    if path.startswith('/requests/'):
+        return '/requests'
+    return '/api/other' if path.startswith('/api/') else 'static'
+
+
+def make_etag(sig):
+    """Strong ETag from a file signature ([mtime_ns, size, ...])."""
+    return '"' + '-'.join(f'{n:x}' for n in sig) + '"'
+
+
+def update_search(change):
+    """Apply change(search_index) to the search database, if there is one."""
+    if SEARCH_DB.exists():
+        with searchindex.SearchIndex(SEARCH_DB) as search:
+            change(search)
+
+
+def session_signature(session_file):
+    """Signature of a stored session for ETags (falsy if there is no such session)."""
+    if STORE == 'sqlite':
+        if not SESSIONS_DB.exists():
+            return None
+        with sessiondb.SessionDB(SESSIONS_DB, readonly=True) as db:
+            return db.signature(session_file.name)
+    return sessionindex.signature(session_file)
+
+
+def read_session_window(session_file, start, limit, inflate=True):
+    """(entries, total) for a window of a stored session; limit -1 reads to the end."""
+    if STORE == 'sqlite':
+        with sessiondb.SessionDB(SESSIONS_DB, readonly=True) as db:
+            return db.window(session_file.name, start, limit, inflate)
+    if limit < 0:
+        entries = sessionstore.load_session(session_file, inflate)
+        return entries[start:], len(entries)
+    return sessionstore.read_window(session_file, start, limit, inflate)
+
+
+def select_fields(entry, fields):
+    """Project an entry onto fields like 'response' or 'request.model'."""
+    selected = {}
+    for field in fields:
+        slot, _, attr = field.partition('.')
+        value = entry.get(slot)
+        if not attr:
+            selected[slot] = value
+        elif value is None:
+            selected.setdefault(slot, None)
+        else:
+            if selected.get(slot) is None:
+                selected[slot] = {}
+            if attr in value:
+                selected[slot][attr] = value[attr]
+    return selected
+
+
+def describe_session(json_file):
+    """Build the /api/files record for a session file (None if the name doesn't parse)."""
+    parsed = parse_session_filename(json_file.name)
+    if not parsed:
+        return None
+    timestamp_str = parsed['timestamp']
+    year, month, day = timestamp_str.split('_')[0].split('-')
+    time_part = timestamp_str.split('_')[1]
+    hour, minute, second = time_part.split('-')
+    timestamp = f"{year}-{month}-{day}T{hour}:{minute}:{second}"
+
+    record = {
+        'filename': json_file.name,
+        'timestamp': timestamp,
+        'sessionId': None,
+        'title': parsed['title'],
+        'size': sessionstore.logical_size(json_file)
+    }
+    try:
+        # Session ID (from the first request), entry count and token totals
+        record.update(sessionindex.summarize(sessionstore.load_session(json_file, inflate=False)))
+    except Exception:
+        # If we can't read the file, use title as fallback
+        record['sessionId'] = parsed['title']
+    # A renamed file has a title instead of the id in its name; the registry knows it
+    session_id = SESSION_REGISTRY.refresh().session_id(json_file.name)
+    if session_id:
+        record['sessionId'] = session_id
+    return record
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTPServer that handles requests on a fixed pool of worker threads.
+
+    A worker serves one request and lets go of the connection. Between
+    requests a keep-alive connection is parked on a selector, watched by a
+    poller thread, and handed back to the pool once it is readable (or
+    closed after KEEPALIVE_TIMEOUT idle), so the number of open viewers
+    isn't capped by the number of workers.
+    """
+
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS):
+        super().__init__(server_address, handler_class)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+        self.selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ)
+        self._parking = []              # handlers waiting to be parked, from the workers
+        self._parking_lock = threading.Lock()
+        self._idle = {}                 # parked handler -> deadline (poller thread only)
+        self._closing = False
+        self._poller = threading.Thread(target=self._poll, name='http-poller', daemon=True)
+        self._poller.start()
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._serve, None, request, client_address)
+
+    def _open(self, request, client_address):
+        """
+        A handler set up for a new connection. BaseRequestHandler.__init__
+        would serve the connection to its end, so it is done by hand here.
+        """
+        # Headers and body go out as separate writes; don't let Nagle hold the body back
+        request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+        handler.request, handler.client_address, handler.server = request, client_address, self
+        handler.directory = os.getcwd()
+        handler.setup()
+        return handler
+
+    def _serve(self, handler, request=None, client_address=None):
+        """Worker: handle the next request on a connection, then park or close it."""
+        try:
+            if handler is None:
+                handler = self._open(request, client_address)
+            handler.close_connection = True
+            handler.handle_one_request()
+            if not handler.close_connection and not self._closing:
+                if self._pipelined(handler):
+                    self.pool.submit(self._serve, handler)
+                else:
+                    with self._parking_lock:
+                        self._parking.append(handler)
+                    self._wake()
+                return
+        except Exception:
+            self.handle_error(request or handler.request, client_address or handler.client_address)
+        self._close(handler, request)
+
+    @staticmethod
+    def _pipelined(handler):
+        """Whether the next request is already in the handler's read buffer (the selector can't see it)."""
+        sock = handler.connection
+        sock.setblocking(False)
+        try:
+            return bool(handler.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            sock.settimeout(handler.timeout)
+
+    def _close(self, handler, request=None):
+        if handler is not None:
+            try:
+                handler.finish()
+            except OSError:
+                pass
+            request = handler.request
+        if request is not None:
+            self.shutdown_request(request)
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass  # full: the poller has wakeups pending anyway
+
+    def _poll(self):
+        """Poller thread: dispatch readable parked connections, close idle ones."""
+        while not self._closing:
+            timeout = None
+            if self._idle:
+                timeout = max(0.0, min(self._idle.values()) - time.monotonic())
+            for key, _ in self.selector.select(timeout):
+                if key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+                handler = key.data
+                self.selector.unregister(key.fileobj)
+                del self._idle[handler]
+                try:
+                    self.pool.submit(self._serve, handler)
+                except RuntimeError:
+                    self._close(handler)  # shutting down
+            with self._parking_lock:
+                parking, self._parking = self._parking, []
+            deadline = time.monotonic() + KEEPALIVE_TIMEOUT
+            for handler in parking:
+                self.selector.register(handler.connection, selectors.EVENT_READ, handler)
+                self._idle[handler] = deadline
+            now = time.monotonic()
+            for handler in [h for h, d in self._idle.items() if d <= now]:
+                self.selector.unregister(handler.connection)
+                del self._idle[handler]
+                self._close(handler)
+            IDLE_CONNECTIONS.set(len(self._idle))
+        for handler in self._idle:
+            self._close(handler)
+        self._idle.clear()
+        self.selector.close()
+
+    def server_close(self):
+        super().server_close()
+        self._closing = True
+        self._wake()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+ROLLUPS = rollups.RollupsCache(ROLLUPS_FILE)
+# "files" (requests/*.json) or "sqlite" (SESSIONS_DB); set in main()
+STORE = 'files'
+# session id -> file for requests/, shared with process-api-requests.py
+SESSION_REGISTRY = sessionregistry.SessionRegistry(Path('requests'))
+SESSION_INDEX = sessionindex.SessionIndex(INDEX_FILE, describe_session)
+# Created in main() once the worker count is known
+SESSION_EVENTS = None
+
+
 class CORSRequestHandler(SimpleHTTPRequestHandler):
     """HTTP request handler with CORS headers enabled."""
 
+    # Keep connections open between requests; every response sets Content-Length
+    protocol_version = 'HTTP/1.1'
+    # Give up on a request that stalls halfway (idle connections are parked, see PooledHTTPServer)
+    timeout = KEEPALIVE_TIMEOUT
+    # ETag for the response being sent (added by end_headers)
+    etag = None
+    # perf_counter() when the current request line was read, and its status
+    started = None
+    status = None
+
+    def handle_one_request(self):
+        """Handle one request and record its route, status and duration."""
+        self.started = None
+        self.status = None
+        super().handle_one_request()
+        if self.started is None or self.status is None:
+            return  # idle connection closed
+        route = route_of(getattr(self, 'path', ''))
+        HTTP_REQUESTS.inc(route=route, method=self.command or '-', status=self.status)
+        if route != '/api/events':
+            HTTP_SECONDS.observe(time.perf_counter() - self.started, route=route)
+
+    def parse_request(self):
+        # Timing starts here so time spent idle on a keep-alive connection isn't counted
+        self.started = time.perf_counter()
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        self.status = code
+        super().send_response(code, message)
+
     def end_headers(self):
-        """Add CORS headers to all responses."""
+        """Add CORS and caching headers to all responses."""
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, PUT, DELETE, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
+        # Browsers may cache, but must revalidate with the ETag each time
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if self.etag:
+            self.send_header('ETag', self.etag)
+            self.etag = None
         super().end_headers()
 
-    def do_GET(self):
-        """Handle GET requests, including API endpoints."""
-        # API endpoint to list JSON files
-        if self.path == '/api/files':
+    def accepted_encoding(self):
+        """Content-Encoding to use for this request (None for identity)."""
+        return httpcompress.negotiate(self.headers.get('Accept-Encoding'))
+
+    def not_modified(self, etag, mtime=None):
+        """Send 304 Not Modified if the client's cached copy is current."""
+        if_none_match = self.headers.get('If-None-Match')
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_none_match is not None:
+            # Weak comparison, as If-None-Match requires
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            fresh = '*' in tags or etag in tags
+        elif if_modified_since and mtime is not None:
+            try:
+                fresh = int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                fresh = False
+        else:
+            fresh = False
+        if not fresh:
+            return False
+        self.send_response(304)
+        self.etag = etag
+        self.end_headers()
+        return True
+
+    def send_head(self):
+        """
+        Serve static files with an ETag, answer If-None-Match with 304, send
+        JSON/HTML compressed when the client accepts it, and honour Range.
+        The body is written here (via sendfile), so files return None.
+        """
+        path = Path(self.translate_path(self.path))
+        if not path.is_file() or self.path.endswith('/'):
+            return super().send_head()
+
+        st = path.stat()
+        etag = make_etag([st.st_mtime_ns, st.st_size])
+        content_type = self.guess_type(str(path))
+        encoding = self.accepted_encoding()
+        if not (httpcompress.is_compressible(content_type) and st.st_size >= httpcompress.MIN_SIZE):
+            encoding = None
+        if self.not_modified(httpcompress.tag(etag, encoding), st.st_mtime):
+            return None
+        body_file = path
+        if encoding and (path.name in VOLATILE_FILES or path.name.startswith('.')):
+            try:
+                body = httpcompress.memory_variant(path, encoding, st.st_mtime_ns, path.read_bytes)
+            except OSError:
+                self.send_error(404, 'File not found')
+                return None
+            self.send_body(io.BytesIO(body), len(body), content_type,
+                           httpcompress.tag(etag, encoding), st.st_mtime, encoding)
+            return None
+        if encoding:
+            try:
+                body_file = httpcompress.cached_variant(path, encoding, st.st_mtime_ns, path.read_bytes)
+                etag = httpcompress.tag(etag, encoding)
+            except OSError:
+                encoding = None  # can't write the cache; serve it uncompressed
+        try:
+            f = body_file.open('rb')
+        except OSError:
+            self.send_error(404, 'File not found')
+            return None
+        with f:
+            self.send_body(f, os.fstat(f.fileno()).st_size, content_type, etag, st.st_mtime, encoding)
+        return None
+
+    def if_range_matches(self, etag, mtime):
+        """False if an If-Range validator says the client's partial copy is stale."""
+        validator = self.headers.get('If-Range')
+        if not validator:
+            return True
+        validator = validator.strip()
+        if validator.startswith(('"', 'W/')):
+            return validator == etag  # strong comparison; weak tags never match
+        try:
+            return int(mtime) == int(parsedate_to_datetime(validator).timestamp())
+        except (TypeError, ValueError):
+            return False
+
+    def send_body(self, f, size, content_type, etag, mtime, encoding=None):
+        """
+        Send a response body from binary file object f (size bytes): the
+        whole of it, or the byte ranges asked for with Range as a 206
+        (multipart/byteranges for several). File contents go out with
+        zero-copy sendfile where the platform supports it.
+        """
+        ranges = None
+        if self.headers.get('Range') and self.if_range_matches(etag, mtime):
+            ranges = parse_ranges(self.headers['Range'], size)
+        if ranges == []:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        def common_headers():
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.send_header('Last-Modified', self.date_time_string(mtime))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.etag = etag
+
+        head_only = self.command == 'HEAD'
+        if not ranges:
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Length', str(size))
+            common_headers()
+            self.end_headers()
+            if not head_only and size:
+                self.connection.sendfile(f, 0, size)
+            return
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            self.send_response(206)
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.send_header('Content-Length', str(end - start + 1))
+            common_headers()
             self.end_headers()
+            if not head_only:
+                self.connection.sendfile(f, start, end - start + 1)
+            return
 
-            # Get all JSON files from requests/ folder
+        boundary = uuid.uuid4().hex
+        parts = [((f'\r\n--{boundary}\r\nContent-Type: {content_type}\r\n'
+                   f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode(), start, end)
+                 for start, end in ranges]
+        closing = f'\r\n--{boundary}--\r\n'.encode()
+        length = sum(len(head) + end - start + 1 for head, start, end in parts) + len(closing)
+        self.send_response(206)
+        self.send_header('Content-type', f'multipart/byteranges; boundary={boundary}')
+        self.send_header('Content-Length', str(length))
+        common_headers()
+        self.end_headers()
+        if head_only:
+            return
+        for head, start, end in parts:
+            self.wfile.write(head)
+            self.connection.sendfile(f, start, end - start + 1)
+        self.wfile.write(closing)
+
+    def do_GET(self):
+        """Handle GET requests, including API endpoints."""
+        # API endpoint to list JSON files
+        url = urlsplit(self.path)
+        if url.path == '/api/files':
+            # Session metadata comes from the index, kept current by
+            # SESSION_EVENTS; only new or changed files are read
             requests_dir = Path('requests')
-            if requests_dir.exists():
-                files = []
-                for json_file in sorted(requests_dir.glob('*.json'), reverse=True):
-                    stat = json_file.stat()
-
-                    # Parse filename to extract timestamp and title
-                    parsed = parse_session_filename(json_file.name)
-                    if parsed:
-                        timestamp_str = parsed['timestamp']
-                        year, month, day = timestamp_str.split('_')[0].split('-')
-                        time_part = timestamp_str.split('_')[1]
-                        hour, minute, second = time_part.split('-')
-                        timestamp = f"{year}-{month}-{day}T{hour}:{minute}:{second}"
-                        
-                        # Extract session ID from JSON content
-                        session_id = None
-                        try:
-                            with json_file.open('r', encoding='utf-8') as f:
-                                data = json.load(f)
-                                # Get session.id from first request
-                                if data and len(data) > 0:
-                                    first_item = data[0]
-                                    if 'request' in first_item and first_item['request']:
-                                        session_id = first_item['request'].get('session.id')
-                        except Exception:
-                            # If we can't read the file, use title as fallback
-                            session_id = parsed['title']
-
-                        files.append({
-                            'filename': json_file.name,
-                            'timestamp': timestamp,
-                            'sessionId': session_id,
-                            'title': parsed['title'],
-                            'size': stat.st_size
-                        })
-
-                self.wfile.write(json.dumps(files).encode())
+            if STORE == 'sqlite' or requests_dir.exists():
+                files, etag = SESSION_INDEX.listing(requests_dir)
             else:
-                self.wfile.write(b'[]')
+                files, etag = [], '"empty"'
+            params = parse_qs(url.query)
+            if params:
+                # Filtered/paginated listing; without parameters the plain array is returned
+                try:
+                    files = sessionindex.query(files, params)
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                    return
+                etag = etag[:-1] + '-' + hashlib.sha1(url.query.encode()).hexdigest()[:8] + '"'
+            encoding = self.accepted_encoding()
+            etag = httpcompress.tag(etag, encoding)
+            if self.not_modified(etag):
+                return
+            self.etag = etag
+            self.send_json(files, encoding=encoding)
+            return
+
+        if url.path == '/api/search':
+            self.send_search(parse_qs(url.query))
+            return
+
+        if url.path == '/api/stats':
+            self.send_stats(url.query)
+            return
+
+        if url.path == '/api/events':
+            self.send_events()
+            return
+
+        if url.path == '/metrics':
+            self.send_metrics()
+            return
+
+        match = re.fullmatch(r'/api/sessions/([^/\\]+\.json)/entries', unquote(url.path))
+        if match:
+            self.send_entries(Path('requests') / match.group(1), parse_qs(url.query))
+            return
+
+        # Sessions with segments or a turn store (or in the database) are
+        # merged and inflated into the usual JSON array
+        session_file = self.session_file_for(self.path)
+        if session_file and (STORE == 'sqlite' or sessionstore.has_sidecars(session_file)):
+            self.send_session(session_file)
             return
 
         # Default file serving
         super().do_GET()
 
+    def do_HEAD(self):
+        """Handle HEAD requests; merged sessions report the headers a GET would send."""
+        session_file = self.session_file_for(self.path)
+        if session_file and (STORE == 'sqlite' or sessionstore.has_sidecars(session_file)):
+            self.send_session(session_file)
+            return
+        super().do_HEAD()
+
+    def session_file_for(self, url_path):
+        """Map a /requests/<name>.json URL to its file, or None for anything else (e.g. dot files)."""
+        path = unquote(urlsplit(url_path).path)
+        match = re.fullmatch(r'/requests/([^/.][^/]*\.json)', path)
+        if not match:
+            return None
+        return Path('requests') / match.group(1)
+
+    def send_session(self, session_file):
+        """
+        Send the logical session (base + segment, turns inflated). The
+        compressed form of a session file is cached on disk, so a cache hit
+        skips merging; sessions from the database are compressed per request.
+        """
+        sig = session_signature(session_file)
+        if not sig:
+            self.send_error(404, 'File not found')
+            return
+        mtime_ns = max(sig[0::2])
+        mtime = mtime_ns / 1e9
+        encoding = self.accepted_encoding()
+        etag = httpcompress.tag(make_etag(sig), encoding)
+        if self.not_modified(etag, mtime):
+            return
+
+        def render():
+            entries, _ = read_session_window(session_file, 0, -1)
+            return json.dumps(entries, ensure_ascii=False, indent=2).encode('utf-8')
+
+        if encoding and STORE == 'sqlite':
+            body = httpcompress.compress(render(), encoding)
+            self.send_body(io.BytesIO(body), len(body), 'application/json', etag, mtime, encoding)
+            return
+        if encoding:
+            try:
+                variant = httpcompress.cached_variant(session_file, encoding, mtime_ns, render)
+            except OSError:
+                variant = None  # can't write the cache; send it uncompressed
+                encoding = None
+                etag = make_etag(sig)
+            if variant:
+                with variant.open('rb') as f:
+                    self.send_body(f, os.fstat(f.fileno()).st_size, 'application/json', etag, mtime, encoding)
+                return
+        body = render()
+        self.send_body(io.BytesIO(body), len(body), 'application/json', etag, mtime)
+
+    def send_search(self, params):
+        """
+        Ranked full-text hits: /api/search?q=read_file&limit=20&field=tools
+        Each hit names the session file and prompt_id it was found in.
+        """
+        q = params.get('q', [''])[-1]
+        field = params.get('field', [None])[-1]
+        if field and field not in searchindex.FIELDS:
+            self.send_error(400, f"field must be one of {', '.join(searchindex.FIELDS)}")
+            return
+        try:
+            limit = min(max(int(params.get('limit', ['20'])[-1]), 1), MAX_SEARCH_HITS)
+        except ValueError:
+            self.send_error(400, 'limit must be an integer')
+            return
+        hits = []
+        if SEARCH_DB.exists():
+            search = searchindex.SearchIndex(SEARCH_DB, readonly=True)
+            try:
+                hits = search.search(q, limit, field)
+            finally:
+                search.conn.close()
+        self.send_json({'query': q, 'hits': hits}, encoding=self.accepted_encoding())
+
+    def send_stats(self, query):
+        """
+        Token, latency and error rollups: /api/stats?model=...&from=...&to=...&bucket=day
+        or /api/stats?session=<session id>. Served from rollups.json as
+        maintained by the processor; session files are not read.
+        """
+        data, sig = ROLLUPS.get()
+        encoding = self.accepted_encoding()
+        etag = make_etag((sig or [0, 0]) + [int(hashlib.sha1(query.encode()).hexdigest()[:8], 16)])
+        etag = httpcompress.tag(etag, encoding)
+        if self.not_modified(etag):
+            return
+        try:
+            stats = rollups.report(data, parse_qs(query))
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        except LookupError as e:
+            self.send_error(404, str(e))
+            return
+        self.etag = etag
+        self.send_json(stats, encoding=encoding)
+
+    def send_metrics(self):
+        """Prometheus text format: this server's metrics plus the processors' dumps."""
+        EVENT_STREAMS.set(len(SESSION_EVENTS.subscribers))
+        parts = [metrics.REGISTRY.render()]
+        for path in sorted(METRICS_DIR.glob('*.prom')):
+            try:
+                parts.append(path.read_text(encoding='utf-8'))
+            except OSError:
+                continue  # replaced mid-read; the next scrape gets it
+        body = ''.join(parts).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self):
+        """
+        Stream session created/updated/renamed/deleted events
+        (text/event-stream) until the client goes away.
+        """
+        sub = SESSION_EVENTS.subscribe(self.headers.get('Last-Event-ID'))
+        if sub is None:
+            self.send_error(503, 'Too many event streams')
+            return
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            self.wfile.write(f'retry: {EVENT_RETRY_MS}\n\n'.encode())
+            while True:
+                try:
+                    event = sub.get(timeout=EVENT_HEARTBEAT)
+                except queue.Empty:
+                    self.wfile.write(b': keep-alive\n\n')
+                    continue
+                if event is None:
+                    break
+                self.wfile.write(sessionevents.format_event(event))
+        except (ConnectionError, OSError):
+            pass  # client went away
+        finally:
+            SESSION_EVENTS.unsubscribe(sub)
+
+    def send_entries(self, session_file, params):
+        """
+        Send a window of a session's entries:
+        /api/sessions/<file>/entries?offset=0&limit=50&fields=request.model,response
+        Only the requested entries are read, using the session's offset index
+        (or the database's entry order).
+        """
+        sig = session_signature(session_file)
+        if not sig:
+            self.send_error(404, 'File not found')
+            return
+        try:
+            offset = int(params.get('offset', ['0'])[-1])
+            limit = min(max(int(params.get('limit', [str(DEFAULT_WINDOW)])[-1]), 1), MAX_WINDOW)
+            fields = [f for f in params.get('fields', [''])[-1].split(',') if f]
+            if offset < 0:
+                raise ValueError
+        except ValueError:
+            self.send_error(400, 'offset and limit must be non-negative integers')
+            return
+        if any(f.partition('.')[0] not in sessionstore.ENTRY_SLOTS for f in fields):
+            self.send_error(400, f"fields must name {', '.join(sessionstore.ENTRY_SLOTS)} or their attributes")
+            return
+
+        encoding = self.accepted_encoding()
+        query = urlsplit(self.path).query
+        etag = make_etag(sig)[:-1] + '-' + hashlib.sha1(query.encode()).hexdigest()[:8] + '"'
+        etag = httpcompress.tag(etag, encoding)
+        if self.not_modified(etag):
+            return
+
+        # Turn references only need resolving if request_text is returned
+        inflate = not fields or 'request' in fields or 'request.request_text' in fields
+        entries, total = read_session_window(session_file, offset, limit, inflate)
+        if fields:
+            entries = [select_fields(entry, fields) for entry in entries]
+        self.etag = etag
+        self.send_json({'offset': offset, 'limit': limit, 'total': total, 'entries': entries},
+                       encoding=encoding)
+
+    def send_json(self, data, status=200, encoding=None):
+        """Send a JSON response with an explicit length (required for keep-alive)."""
+        body = json.dumps(data).encode()
+        if encoding:
+            body = httpcompress.compress(body, encoding)
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_PUT(self):
         """Handle PUT requests for API endpoints."""
         # API endpoint to rename session file
@@ -229,26 +962,33 @@ class CORSRequestHandler(SimpleHTTPRequestHandler):
                 old_path = requests_dir / current_filename
                 new_path = requests_dir / new_filename
 
-                if not old_path.exists():
+                if not session_signature(old_path):
                     self.send_error(404, 'File not found')
                     return
 
-                if new_path.exists() and new_path != old_path:
+                if session_signature(new_path) and new_path != old_path:
                     self.send_error(409, 'File with that name already exists')
                     return
 
-                old_path.rename(new_path)
+                with metrics.timed_lock(SESSION_EVENTS.lock, LOCK_WAIT_SECONDS, op='rename'):
+                    if STORE == 'sqlite':
+                        with sessiondb.SessionDB(SESSIONS_DB) as db:
+                            db.rename(old_path.name, new_path.name)
+                    else:
+                        # The processor holds the registry lock while it writes a session
+                        with SESSION_REGISTRY.locked():
+                            sessionstore.rename_session(old_path, new_path)
+                            SESSION_REGISTRY.rename(old_path.name, new_path.name, new_title.strip())
+                        httpcompress.discard_variants(old_path)
+                    update_search(lambda search: search.rename_file(old_path.name, new_path.name))
+                    SESSION_EVENTS.sync(renamed=(old_path.name, new_path.name))
 
                 # Return success with new filename
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                response = {
+                self.send_json({
                     'success': True,
                     'newFilename': new_filename,
                     'title': new_title
-                }
-                self.wfile.write(json.dumps(response).encode())
+                })
 
             except json.JSONDecodeError:
                 self.send_error(400, 'Invalid JSON')
@@ -293,22 +1033,28 @@ class CORSRequestHandler(SimpleHTTPRequestHandler):
                     self.send_error(400, 'Invalid file path')
                     return
 
-                if not file_path.exists():
+                if not session_signature(file_path):
                     self.send_error(404, 'File not found')
                     return
 
-                # Delete the file
-                file_path.unlink()
+                # Delete the file (and any appended segment)
+                with metrics.timed_lock(SESSION_EVENTS.lock, LOCK_WAIT_SECONDS, op='delete'):
+                    if STORE == 'sqlite':
+                        with sessiondb.SessionDB(SESSIONS_DB) as db:
+                            db.delete(file_path.name)
+                    else:
+                        with SESSION_REGISTRY.locked():
+                            sessionstore.delete_session(file_path)
+                            SESSION_REGISTRY.remove(file_path.name)
+                        httpcompress.discard_variants(file_path)
+                    update_search(lambda search: search.remove_file(file_path.name))
+                    SESSION_EVENTS.sync()
 
                 # Return success
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                response = {
+                self.send_json({
                     'success': True,
                     'message': 'Session deleted successfully'
-                }
-                self.wfile.write(json.dumps(response).encode())
+                })
 
             except json.JSONDecodeError:
                 self.send_error(400, 'Invalid JSON')
@@ -323,41 +1069,64 @@ class CORSRequestHandler(SimpleHTTPRequestHandler):
     def do_OPTIONS(self):
         """Handle OPTIONS requests for CORS preflight."""
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def log_message(self, format, *args):
         """Customize log messages to be more concise."""
-        if args[1] == '200':
-            # Only log non-200 responses to reduce noise
+        if args[1] in ('200', '206'):
+            # Only log unsuccessful responses to reduce noise
             return
         super().log_message(format, *args)
 
 
 def main():
     # Fix encoding for Windows console
-    import io
     if sys.platform == "win32":
         sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
         sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-    # Parse port from command line args
-    port = 8000
-    if len(sys.argv) > 1:
-        try:
-            port = int(sys.argv[1])
-        except ValueError:
-            print(f"Invalid port number: {sys.argv[1]}")
-            print("Usage: python server.py [port]")
-            sys.exit(1)
+    parser = argparse.ArgumentParser(description="Serve the API Request Viewer")
+    parser.add_argument("port", nargs="?", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Worker threads handling connections (default: {DEFAULT_WORKERS})"
+    )
+    parser.add_argument(
+        "--store",
+        choices=("files", "sqlite"),
+        default="files",
+        help="Serve sessions from requests/*.json (default) or from sessions.db (process-api-requests.py --store sqlite)"
+    )
+    parser.add_argument(
+        "--no-browser",
+        action="store_true",
+        help="Don't open the viewer in a browser"
+    )
+    args = parser.parse_args()
+    port = args.port
 
     # Change to .logging directory
     script_dir = Path(__file__).parent
-    import os
     os.chdir(script_dir)
 
     # Create server
     server_address = ('localhost', port)
-    httpd = HTTPServer(server_address, CORSRequestHandler)
+    httpd = PooledHTTPServer(server_address, CORSRequestHandler, args.workers)
+
+    # Session listing from the files or the database (watched via its directory)
+    global STORE, SESSION_INDEX, SESSION_EVENTS
+    STORE = args.store
+    watch_dir = Path('requests')
+    if STORE == 'sqlite':
+        SESSION_INDEX = sessiondb.SessionListing(SESSIONS_DB)
+        watch_dir = SESSIONS_DB.parent
+
+    # Live session events; streams may use at most half of the workers
+    SESSION_EVENTS = sessionevents.SessionEvents(SESSION_INDEX, watch_dir, max(1, args.workers // 2))
+    SESSION_EVENTS.start()
 
     # Print startup message
     url = f'http://localhost:{port}/api-viewer.html'
@@ -366,19 +1135,23 @@ def main():
     print('='*60)
     print(f'Server running at: http://localhost:{port}')
     print(f'Viewer URL: {url}')
+    print(f'Workers: {args.workers}')
+    print(f'Sessions: {SESSIONS_DB.name if STORE == "sqlite" else "requests/"}')
     print('\nPress Ctrl+C to stop the server')
     print('='*60)
 
     # Open browser
-    print('\n📱 Opening browser...')
-    webbrowser.open(url)
+    if not args.no_browser:
+        print('\n📱 Opening browser...')
+        webbrowser.open(url)
 
     # Run server
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         print('\n\n👋 Shutting down server...')
-        httpd.shutdown()
+        SESSION_EVENTS.close()
+        httpd.server_close()
         print('✅ Server stopped')
 
 
@@ -0,0 +1,340 @@
+"""
+SQLite storage for processed sessions (optional; stdlib only).
+
+With --store sqlite, process-api-requests.py writes sessions into
+sessions.db instead of requests/*.json, and server.py serves /api/files,
+/requests/<file>.json and the entries API from it. Each session keeps the
+filename it would have on disk, so URLs, search hits and renames look the
+same in both stores, and export() writes the JSON files on demand.
+
+    sessions  one row per session id: filename, first timestamp and the
+              listing summary (entry count, size, models, tokens), kept
+              up to date by upsert()
+    entries   one row per (session_id, prompt_id): the request, response
+              and error slots as JSON, the timestamp and model of the
+              entry and its latest stage (event), in first-seen order (seq)
+    turns     conversation turns by hash; request_text is stored as
+              {"$turns": [...]} as in sessionstore's turn store
+
+upsert() only runs statements; the caller commits, so one processor flush
+is one transaction. The database runs in WAL mode so the server reads
+while the processor writes.
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import sessionstore
+from sessionindex import TOKEN_FIELDS
+
+ENTRY_SLOTS = sessionstore.ENTRY_SLOTS
+# How long a writer waits for another one (processor vs. rename/delete)
+BUSY_TIMEOUT = 10.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    first_timestamp TEXT,
+    updated_ns INTEGER NOT NULL,
+    entries INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0,
+    models TEXT NOT NULL DEFAULT '[]',
+    tokens TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS entries (
+    session_id TEXT NOT NULL,
+    prompt_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    timestamp TEXT,
+    model TEXT,
+    event TEXT,
+    request TEXT,
+    response TEXT,
+    error TEXT,
+    PRIMARY KEY (session_id, prompt_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_seq ON entries (session_id, seq);
+CREATE INDEX IF NOT EXISTS entries_timestamp ON entries (timestamp);
+CREATE INDEX IF NOT EXISTS entries_model ON entries (model);
+CREATE INDEX IF NOT EXISTS entries_event ON entries (event);
+CREATE TABLE IF NOT EXISTS turns (
+    session_id TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    turn TEXT NOT NULL,
+    PRIMARY KEY (session_id, hash)
+) WITHOUT ROWID;
+"""
+
+# Slots are merged like sessionstore deltas: a slot that is set replaces
+# the stored one, an unset slot keeps it
+UPSERT = """
+INSERT INTO entries (session_id, prompt_id, seq, timestamp, model, event, request, response, error)
+VALUES (?1, ?2, (SELECT coalesce(max(seq), -1) + 1 FROM entries WHERE session_id = ?1), ?3, ?4,
+        CASE WHEN ?7 IS NOT NULL THEN 'error' WHEN ?6 IS NOT NULL THEN 'response'
+             WHEN ?5 IS NOT NULL THEN 'request' END,
+        ?5, ?6, ?7)
+ON CONFLICT (session_id, prompt_id) DO UPDATE SET
+    timestamp = coalesce(timestamp, excluded.timestamp),
+    model = coalesce(excluded.model, model),
+    request = coalesce(excluded.request, request),
+    response = coalesce(excluded.response, response),
+    error = coalesce(excluded.error, error),
+    event = CASE WHEN coalesce(excluded.error, error) IS NOT NULL THEN 'error'
+                 WHEN coalesce(excluded.response, response) IS NOT NULL THEN 'response'
+                 WHEN coalesce(excluded.request, request) IS NOT NULL THEN 'request' END
+"""
+
+SUMMARY = """
+UPDATE sessions SET
+    updated_ns = ?2,
+    entries = (SELECT count(*) FROM entries WHERE session_id = ?1),
+    size = (SELECT coalesce(sum(coalesce(length(request), 0) + coalesce(length(response), 0)
+                                + coalesce(length(error), 0)), 0) FROM entries WHERE session_id = ?1),
+    models = (SELECT json_group_array(model) FROM (SELECT DISTINCT model FROM entries
+                                                   WHERE session_id = ?1 AND model IS NOT NULL ORDER BY model)),
+    tokens = (SELECT json_object({tokens}) FROM entries WHERE session_id = ?1)
+WHERE session_id = ?1
+""".format(tokens=", ".join(
+    f"'{name}', coalesce(sum(CAST(json_extract(response, '$.{attr}') AS INTEGER)), 0)"
+    for name, attr in TOKEN_FIELDS.items()))
+
+_FILENAME = re.compile(r"(\d{4})-(\d{2})-(\d{2})_(\d{2})-(\d{2})-(\d{2})-(.+)\.json")
+
+
+def session_filename(first_timestamp: Optional[str], session_id: str) -> str:
+    """{first_timestamp}-{session_id}.json, as process-api-requests.py names session files."""
+    try:
+        stamp = datetime.fromisoformat((first_timestamp or "").replace("Z", "+00:00")).strftime("%Y-%m-%d_%H-%M-%S")
+    except ValueError:
+        stamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return f"{stamp}-{session_id}.json"
+
+
+def _dump(value) -> Optional[str]:
+    return None if value is None else json.dumps(value, ensure_ascii=False)
+
+
+def _entry(row) -> dict:
+    return {slot: None if value is None else json.loads(value) for slot, value in zip(ENTRY_SLOTS, row)}
+
+
+class SessionDB:
+    def __init__(self, db_path: Path, readonly: bool = False):
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+        else:
+            self.conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.conn.commit()
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        """Commit and close."""
+        self.conn.commit()
+        self.conn.close()
+
+    # ---------- writing ----------
+    def _dedup(self, session_id: str, entries: Iterable[dict]):
+        """Store new request turns and reference the known ones (entries are modified in place)."""
+        known = None
+        for entry in entries:
+            request = entry.get("request")
+            if not request or not isinstance(request.get("request_text"), list):
+                continue
+            if known is None:
+                known = {row[0] for row in self.conn.execute(
+                    "SELECT hash FROM turns WHERE session_id = ?", (session_id,))}
+            request["request_text"], new = sessionstore.dedup_turns(request["request_text"], known)
+            self.conn.executemany("INSERT INTO turns (session_id, hash, turn) VALUES (?, ?, ?)",
+                                  [(session_id, key, _dump(turn)) for key, turn in new])
+
+    def upsert(self, session_id: str, entries: Dict[str, dict], first_timestamp: Optional[str] = None,
+               dedup: bool = True, filename: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Merge {prompt_id: entry} into a session, creating it (named
+        `filename`, or after its first timestamp) if needed. Returns
+        (filename, created).
+        """
+        row = self.conn.execute("SELECT filename FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        created = row is None
+        if created:
+            filename = filename or session_filename(first_timestamp, session_id)
+            self.conn.execute("INSERT INTO sessions (session_id, filename, first_timestamp, updated_ns) "
+                              "VALUES (?, ?, ?, ?)", (session_id, filename, first_timestamp, time.time_ns()))
+        else:
+            filename = row[0]
+        if dedup:
+            self._dedup(session_id, entries.values())
+        rows = []
+        for prompt_id, entry in entries.items():
+            attrs = next((entry[slot] for slot in ENTRY_SLOTS if entry.get(slot)), {})
+            model = next((entry[slot].get("model") for slot in reversed(ENTRY_SLOTS)
+                          if entry.get(slot) and entry[slot].get("model")), None)
+            rows.append((session_id, prompt_id, attrs.get("event.timestamp"), model,
+                         *(_dump(entry.get(slot)) for slot in ENTRY_SLOTS)))
+        self.conn.executemany(UPSERT, rows)
+        self.conn.execute(SUMMARY, (session_id, time.time_ns()))
+        return filename, created
+
+    def rename(self, old: str, new: str) -> bool:
+        cur = self.conn.execute("UPDATE sessions SET filename = ?, updated_ns = ? WHERE filename = ?",
+                                (new, time.time_ns(), old))
+        return cur.rowcount > 0
+
+    def delete(self, filename: str) -> bool:
+        session_id = self.session_id(filename)
+        if session_id is None:
+            return False
+        for table in ("entries", "turns", "sessions"):
+            self.conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+        return True
+
+    # ---------- reading ----------
+    def session_id(self, filename: str) -> Optional[str]:
+        row = self.conn.execute("SELECT session_id FROM sessions WHERE filename = ?", (filename,)).fetchone()
+        return row[0] if row else None
+
+    def sessions(self) -> Dict[str, str]:
+        """{session_id: filename} for every stored session."""
+        return dict(self.conn.execute("SELECT session_id, filename FROM sessions"))
+
+    def signature(self, filename: str) -> Optional[list]:
+        """[updated_ns, size] of a session (None if there is no such session)."""
+        row = self.conn.execute("SELECT updated_ns, size FROM sessions WHERE filename = ?", (filename,)).fetchone()
+        return list(row) if row else None
+
+    def listing(self) -> List[Tuple[list, dict]]:
+        """(signature, /api/files record) per session, newest filename first."""
+        result = []
+        for filename, session_id, updated_ns, entries, size, models, tokens in self.conn.execute(
+                "SELECT filename, session_id, updated_ns, entries, size, models, tokens "
+                "FROM sessions ORDER BY filename DESC"):
+            match = _FILENAME.fullmatch(filename)
+            if not match:
+                continue
+            year, month, day, hour, minute, second, title = match.groups()
+            result.append(([updated_ns, size], {
+                "filename": filename,
+                "timestamp": f"{year}-{month}-{day}T{hour}:{minute}:{second}",
+                "sessionId": session_id,
+                "title": title,
+                "size": size,
+                "models": json.loads(models),
+                "entries": entries,
+                "tokens": json.loads(tokens),
+            }))
+        return result
+
+    def window(self, filename: str, start: int = 0, limit: int = -1,
+               inflate: bool = True) -> Tuple[List[dict], int]:
+        """(entries[start:start + limit], total entries) of a session; limit -1 means all."""
+        row = self.conn.execute("SELECT session_id, entries FROM sessions WHERE filename = ?",
+                                (filename,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(filename)
+        session_id, total = row
+        entries = [_entry(r) for r in self.conn.execute(
+            "SELECT request, response, error FROM entries WHERE session_id = ? ORDER BY seq LIMIT ? OFFSET ?",
+            (session_id, limit, start))]
+        if inflate and any(e["request"] and sessionstore.is_deduplicated(e["request"].get("request_text"))
+                           for e in entries):
+            turns = {key: json.loads(turn) for key, turn in self.conn.execute(
+                "SELECT hash, turn FROM turns WHERE session_id = ?", (session_id,))}
+            sessionstore.inflate_entries(None, entries, turns)
+        return entries, total
+
+    def load(self, filename: str, inflate: bool = True) -> List[dict]:
+        """The whole session, as sessionstore.load_session() returns it."""
+        return self.window(filename, inflate=inflate)[0]
+
+    # ---------- moving between stores ----------
+    def import_file(self, session_file: Path, dedup: bool = True) -> Optional[str]:
+        """Copy a requests/*.json session in, keeping its filename. Returns the session id."""
+        entries = sessionstore.load_session(session_file)
+        session_id = next((entry[slot].get("session.id") for entry in entries for slot in ENTRY_SLOTS
+                           if entry.get(slot) and entry[slot].get("session.id")), None)
+        if not session_id:
+            return None
+        keyed = {sessionstore.entry_prompt_id(entry) or f"#{i}": entry for i, entry in enumerate(entries)}
+        first = next((entry[slot].get("event.timestamp") for entry in entries for slot in ENTRY_SLOTS
+                      if entry.get(slot) and entry[slot].get("event.timestamp")), None)
+        self.upsert(session_id, keyed, first, dedup, filename=session_file.name)
+        return session_id
+
+    def export(self, output_dir: Path) -> List[Path]:
+        """
+        Write sessions changed since their last export as plain JSON
+        session files (the format without the store) in output_dir.
+        """
+        output_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+        for filename, updated_ns in self.conn.execute("SELECT filename, updated_ns FROM sessions").fetchall():
+            path = output_dir / filename
+            try:
+                if path.stat().st_mtime_ns >= updated_ns:
+                    continue
+            except FileNotFoundError:
+                pass
+            sessionstore.write_base(path, self.load(filename))
+            for sidecar in (sessionstore.segment_path(path), sessionstore.turns_path(path)):
+                sidecar.unlink(missing_ok=True)
+            written.append(path)
+        return written
+
+
+class SessionListing:
+    """
+    /api/files records from sessions.db, with the interface of
+    sessionindex.SessionIndex (refresh/listing/snapshot) so server.py and
+    SessionEvents use either store the same way. Thread-safe.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.rows: List[Tuple[list, dict]] = []
+        self.etag: Optional[str] = None
+        self.watched = False
+
+    def refresh(self, requests_dir: Optional[Path] = None) -> Tuple[List[dict], str]:
+        """Records, newest filename first, and an ETag for the listing (requests_dir is ignored)."""
+        with self.lock:
+            if self.db_path.exists():
+                with SessionDB(self.db_path, readonly=True) as db:
+                    self.rows = db.listing()
+            else:
+                self.rows = []
+            state = json.dumps([(record["filename"], sig) for sig, record in self.rows])
+            self.etag = '"' + hashlib.sha1(state.encode()).hexdigest()[:20] + '"'
+            return [record for _, record in self.rows], self.etag
+
+    def listing(self, requests_dir: Optional[Path] = None) -> Tuple[List[dict], str]:
+        """refresh(), or the result of the last one while the database is watched."""
+        with self.lock:
+            if self.watched and self.etag is not None:
+                return [record for _, record in self.rows], self.etag
+        return self.refresh(requests_dir)
+
+    def snapshot(self) -> Dict[str, tuple]:
+        with self.lock:
+            return {record["filename"]: (sig, record) for sig, record in self.rows}
@@ -0,0 +1,178 @@
+"""
+Live session change events for server.py's /api/events (Server-Sent Events).
+
+SessionEvents keeps its own snapshot of the session index and, on every
+sync(), turns the difference into created / updated / renamed / deleted
+events that are fanned out to subscriber queues. sync() runs when
+requests/ changes on disk (watchfiles if installed, otherwise a stat poll
+of the index) and directly from the rename/delete handlers, which also
+hold `lock` across the filesystem change so a rename is reported as one
+"renamed" event rather than a delete and a create.
+
+Event ids are "<boot>.<n>"; a client reconnecting with Last-Event-ID gets
+the events it missed, or a "reset" event (reload everything) when they are
+no longer in the history or the server has restarted. Stdlib only.
+"""
+
+from __future__ import annotations
+import json
+import queue
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+HISTORY = 256          # events kept for Last-Event-ID resumption
+QUEUE_SIZE = 1024      # events buffered per subscriber before it is reset
+POLL_INTERVAL = 1.0    # seconds between index scans without watchfiles
+
+
+class Subscriber:
+    def __init__(self, backlog: List[tuple]):
+        self.queue: "queue.Queue[Optional[tuple]]" = queue.Queue(QUEUE_SIZE)
+        self.overflowed = False
+        for event in backlog:
+            self.queue.put_nowait(event)
+
+    def get(self, timeout: float) -> Optional[tuple]:
+        """Next (id, type, data) event; raises queue.Empty on timeout, None when closed."""
+        if self.overflowed:
+            self.overflowed = False
+            while True:
+                try:
+                    if self.queue.get_nowait() is None:
+                        return None
+                except queue.Empty:
+                    break
+            return ("", "reset", {})
+        return self.queue.get(timeout=timeout)
+
+
+def format_event(event: tuple) -> bytes:
+    """Encode an (id, type, data) event in the text/event-stream format."""
+    event_id, event_type, data = event
+    lines = f"id: {event_id}\n" if event_id else ""
+    lines += f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+    return lines.encode("utf-8")
+
+
+class SessionEvents:
+    def __init__(self, index, requests_dir: Path, max_subscribers: int):
+        self.index = index
+        self.requests_dir = requests_dir
+        self.max_subscribers = max_subscribers
+        self.boot = format(int(time.time()), "x")
+        self.next_id = 1
+        self.history: deque = deque(maxlen=HISTORY)
+        self.subscribers: set = set()
+        self.known: Optional[Dict[str, Tuple[list, dict]]] = None
+        # Held across a rename/delete and the sync that reports it
+        self.lock = threading.RLock()
+        self.stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    # ---------- producing ----------
+    def sync(self, renamed: Optional[Tuple[str, str]] = None):
+        """Refresh the index and publish what changed since the last sync."""
+        with self.lock:
+            self.index.refresh(self.requests_dir)
+            current = self.index.snapshot()
+            if self.known is None:
+                self.known = current
+                return
+            removed = [name for name in self.known if name not in current]
+            added = [name for name in current if name not in self.known]
+            updated = [name for name in current
+                       if name in self.known and self.known[name][0] != current[name][0]]
+            if renamed and renamed[0] in removed and renamed[1] in added:
+                removed.remove(renamed[0])
+                added.remove(renamed[1])
+                self.publish("renamed", {"from": renamed[0], "to": renamed[1], "file": current[renamed[1]][1]})
+            for name in removed:
+                self.publish("deleted", {"filename": name})
+            for name in added:
+                self.publish("created", {"file": current[name][1]})
+            for name in updated:
+                self.publish("updated", {"file": current[name][1]})
+            self.known = current
+
+    def publish(self, event_type: str, data: dict):
+        with self.lock:
+            event = (f"{self.boot}.{self.next_id}", event_type, data)
+            self.next_id += 1
+            self.history.append(event)
+            for sub in self.subscribers:
+                try:
+                    sub.queue.put_nowait(event)
+                except queue.Full:
+                    sub.overflowed = True
+
+    def watch(self):
+        """
+        Run sync() on every change to requests/ until close(). Meanwhile the
+        index is marked watched, so /api/files serves its last refresh.
+        """
+        try:
+            from watchfiles import watch
+        except ImportError:
+            watch = None
+        self.safe_sync()
+        self.index.watched = True
+        try:
+            while not self.stop.is_set():
+                if watch is None or not self.requests_dir.is_dir():
+                    self.stop.wait(POLL_INTERVAL)
+                    self.safe_sync()
+                    continue
+                for _ in watch(self.requests_dir, stop_event=self.stop, recursive=False, debounce=200):
+                    self.safe_sync()
+        finally:
+            self.index.watched = False
+
+    def safe_sync(self):
+        # A file can vanish mid-scan; the next change or poll picks up the rest
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"⚠️  Session events: {e}")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.watch, name="session-events", daemon=True)
+        self.thread.start()
+
+    # ---------- consuming ----------
+    def subscribe(self, last_event_id: Optional[str] = None) -> Optional[Subscriber]:
+        """Register a stream (None if there are too many), replaying missed events."""
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+            backlog = []
+            if last_event_id:
+                boot, _, number = last_event_id.partition(".")
+                oldest = int(self.history[0][0].split(".")[1]) if self.history else self.next_id
+                if boot != self.boot or not number.isdigit() or int(number) + 1 < oldest:
+                    backlog = [("", "reset", {})]
+                else:
+                    backlog = [e for e in self.history if int(e[0].split(".")[1]) > int(number)]
+            sub = Subscriber(backlog)
+            self.subscribers.add(sub)
+            return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+    def close(self):
+        """Stop watching and end every stream."""
+        self.stop.set()
+        with self.lock:
+            for sub in self.subscribers:
+                try:
+                    sub.queue.put_nowait(None)
+                except queue.Full:
+                    sub.overflowed = True
+                    sub.queue.get_nowait()
+                    sub.queue.put_nowait(None)
+        if self.thread:
+            self.thread.join(timeout=5)
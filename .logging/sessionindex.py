@@ -0,0 +1,235 @@
+"""
+Persistent metadata index for the session files in requests/.
+
+Listing sessions used to mean json.load() on every file. The index keeps
+one record per session filename together with the (mtime, size) of the
+base file and its segment, and only files whose signature changed are
+read again, so a refresh costs one stat per file.
+
+The record itself is built by a caller-supplied `describe(path)`; this
+module only adds summarize() for the fields that come from the content.
+Stdlib only.
+"""
+
+from __future__ import annotations
+import base64
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import sessionstore
+
+INDEX_VERSION = 1
+
+TOKEN_FIELDS = {
+    "input": "input_token_count",
+    "output": "output_token_count",
+    "cached": "cached_content_token_count",
+    "thoughts": "thoughts_token_count",
+    "total": "total_token_count",
+}
+
+
+def signature(session_file: Path) -> list:
+    """[mtime_ns, size] of the base file and its segment (if any)."""
+    sig = []
+    for path in (session_file, sessionstore.segment_path(session_file)):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        sig += [st.st_mtime_ns, st.st_size]
+    return sig
+
+
+def summarize(entries: List[dict]) -> dict:
+    """Session id, models, entry count and token totals of a logical session."""
+    session_id = None
+    if entries and entries[0].get("request"):
+        session_id = entries[0]["request"].get("session.id")
+    models = set()
+    tokens = dict.fromkeys(TOKEN_FIELDS, 0)
+    for entry in entries:
+        for slot in sessionstore.ENTRY_SLOTS:
+            if entry.get(slot) and entry[slot].get("model"):
+                models.add(entry[slot]["model"])
+        response = entry.get("response") or {}
+        for name, attr in TOKEN_FIELDS.items():
+            try:
+                tokens[name] += int(response.get(attr) or 0)
+            except (TypeError, ValueError):
+                pass
+    return {"sessionId": session_id, "models": sorted(models), "entries": len(entries), "tokens": tokens}
+
+
+# ---------- listing queries ----------
+
+def token_total(record: dict) -> int:
+    tokens = record.get("tokens") or {}
+    return tokens.get("total") or tokens.get("input", 0) + tokens.get("output", 0)
+
+
+SORT_KEYS = {
+    "name": lambda r: r["filename"],
+    "timestamp": lambda r: r["timestamp"],
+    "size": lambda r: r["size"],
+    "tokens": token_total,
+    "entries": lambda r: r.get("entries", 0),
+}
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def encode_cursor(key, filename: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([key, filename]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        key, filename = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return key, filename
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def query(records: List[dict], params: Dict[str, List[str]]) -> dict:
+    """
+    Filter, sort and page listing records by query parameters:
+
+        from, to      timestamp range (inclusive, "YYYY-MM-DD[THH:MM:SS]")
+        title         case-insensitive title substring
+        session       session id (or prefix)
+        model         model name
+        sort, order   name|timestamp|size|tokens|entries, asc|desc (default name desc)
+        limit, cursor page size (default 100) and the nextCursor of the previous page
+
+    Returns {"files", "total", "nextCursor"}; raises ValueError on bad parameters.
+    """
+    def param(name, default=None):
+        return params.get(name, [default])[-1]
+
+    since, until = param("from"), param("to")
+    title = (param("title") or "").lower()
+    session, model = param("session"), param("model")
+    sort, order = param("sort", "name"), param("order", "desc")
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort: {sort}")
+    if order not in ("asc", "desc"):
+        raise ValueError(f"Unknown order: {order}")
+    try:
+        limit = min(max(int(param("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+
+    if until and "T" not in until:
+        until += "T23:59:59"  # a bare date includes the whole day
+    matches = [
+        r for r in records
+        if (not since or r["timestamp"] >= since)
+        and (not until or r["timestamp"] <= until)
+        and (not title or title in (r.get("title") or "").lower())
+        and (not session or (r.get("sessionId") or "").startswith(session))
+        and (not model or model in r.get("models", ()))
+    ]
+
+    key = SORT_KEYS[sort]
+    reverse = order == "desc"
+    matches.sort(key=lambda r: (key(r), r["filename"]), reverse=reverse)
+    start = 0
+    if param("cursor"):
+        after = decode_cursor(param("cursor"))
+        # Keyset pagination: resume after the last item of the previous page
+        start = next((i for i, r in enumerate(matches)
+                      if ((key(r), r["filename"]) < tuple(after) if reverse
+                          else (key(r), r["filename"]) > tuple(after))), len(matches))
+    page = matches[start:start + limit]
+    next_cursor = None
+    if start + limit < len(matches):
+        last = page[-1]
+        next_cursor = encode_cursor(key(last), last["filename"])
+    return {"files": page, "total": len(matches), "nextCursor": next_cursor}
+
+
+class SessionIndex:
+    """
+    Records for requests/*.json, refreshed incrementally and saved to
+    index_file whenever something changed. Safe to share between threads.
+
+    refresh() still stats every file. While `watched` is set, something
+    (SessionEvents) calls refresh() on every change to requests/, so
+    listing() returns the records of the last refresh without a scan.
+    """
+
+    def __init__(self, index_file: Path, describe: Callable[[Path], dict]):
+        self.index_file = index_file
+        self.describe = describe
+        self.lock = threading.Lock()
+        self.records: Dict[str, dict] = self._load()
+        self.etag = self._etag()
+        self.watched = False
+        self._listing: Optional[List[dict]] = None
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            return json.loads(self.index_file.read_text(encoding="utf-8"))["files"]
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            pass
+        return {}
+
+    def _save(self):
+        temp_file = self.index_file.with_suffix(".tmp")
+        temp_file.write_text(json.dumps({"version": INDEX_VERSION, "files": self.records}), encoding="utf-8")
+        temp_file.replace(self.index_file)
+
+    def _etag(self) -> str:
+        """Strong ETag for the listing: a digest of every filename and signature."""
+        state = json.dumps(sorted((name, r["sig"]) for name, r in self.records.items()))
+        return '"' + hashlib.sha1(state.encode()).hexdigest()[:20] + '"'
+
+    def snapshot(self) -> Dict[str, tuple]:
+        """{filename: (signature, record)} for every session currently indexed."""
+        with self.lock:
+            return {name: (r["sig"], r["record"]) for name, r in self.records.items()
+                    if r["record"] is not None}
+
+    def refresh(self, requests_dir: Path) -> Tuple[List[dict], str]:
+        """
+        Bring the index up to date. Returns the records, newest filename
+        first, and an ETag that changes whenever any session file does.
+        """
+        with self.lock:
+            changed = False
+            seen = set()
+            for session_file in requests_dir.glob("*.json"):
+                name = session_file.name
+                sig = signature(session_file)
+                if not sig:
+                    continue  # removed since the glob
+                seen.add(name)
+                cached = self.records.get(name)
+                if cached and cached["sig"] == sig:
+                    continue
+                # describe() returns None for files that are not sessions;
+                # that is cached too so they are not read again
+                self.records[name] = {"sig": sig, "record": self.describe(session_file)}
+                changed = True
+            for name in list(self.records):
+                if name not in seen:
+                    del self.records[name]
+                    changed = True
+            if changed or self._listing is None:
+                if changed:
+                    self._save()
+                    self.etag = self._etag()
+                self._listing = [self.records[name]["record"] for name in sorted(self.records, reverse=True)
+                                 if self.records[name]["record"] is not None]
+            return list(self._listing), self.etag
+
+    def listing(self, requests_dir: Path) -> Tuple[List[dict], str]:
+        """refresh(), or the result of the last one while the index is watched."""
+        with self.lock:
+            if self.watched and self._listing is not None:
+                return list(self._listing), self.etag
+        return self.refresh(requests_dir)
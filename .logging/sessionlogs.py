@@ -0,0 +1,208 @@
+"""
+Human-readable session logs, written from decoded telemetry records.
+
+    sessions/<YYYY-MM-DD_HH-mm-ss>/
+        prompts.log      gemini_cli.user_prompt
+        responses.log    gemini_cli.api_response
+        tools.log        gemini_cli.tool_call
+
+A new folder is opened when the session id changes and after restart()
+(a new or truncated log.jsonl). SessionLogSink is the pipeline sink used
+by both watcher.py and process-api-requests.py --session-logs; appends go
+through a WriterPool that keeps handles open and batches writes. Stdlib
+only.
+"""
+
+from __future__ import annotations
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from pipeline import Sink
+from telemetryrecord import TelemetryRecord
+
+# Events written to the session logs; everything else is skipped
+ROUTED_EVENTS = {"gemini_cli.user_prompt", "gemini_cli.api_response", "gemini_cli.tool_call"}
+
+# Session log writer pool
+FLUSH_INTERVAL = 1.0      # seconds a buffered line may wait before being written
+FLUSH_BYTES = 64 * 1024   # flush one file's buffer once it grows past this
+IDLE_CLOSE = 30.0         # close handles that have not been written for this long
+
+
+def ts_folder(val) -> str:
+    """Return 'YYYY-MM-DD_HH-mm-ss' from ISO string or epoch (ms/sec)."""
+    if isinstance(val, (int, float)):
+        return datetime.fromtimestamp(val/1000 if val > 1e12 else val).strftime("%Y-%m-%d_%H-%M-%S")
+    if isinstance(val, str):
+        try:
+            dt = datetime.fromisoformat(val.replace("Z", "+00:00"))
+            return dt.strftime("%Y-%m-%d_%H-%M-%S")
+        except Exception:
+            pass
+    return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
+
+def open_session_folder(base: Path, stamp: str, suffix_bump: int = 0) -> Path:
+    """Create a timestamped session folder; bump suffix if same-second collision."""
+    folder = base / (f"{stamp}__{suffix_bump}" if suffix_bump else stamp)
+    i = suffix_bump
+    while folder.exists():
+        i += 1
+        folder = base / f"{stamp}__{i}"
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+
+class WriterPool:
+    """
+    Keeps per-session log handles open and batches appends.
+
+    Each file gets its own buffer, written once it passes FLUSH_BYTES; due()
+    reports when the oldest buffered line has waited FLUSH_INTERVAL. Handles
+    are closed on session rollover (close(folder)), after IDLE_CLOSE seconds
+    without writes, and all at once on shutdown (close()). Each buffer
+    write is observed by `write_seconds` (a metrics.Histogram) if given.
+    """
+
+    def __init__(self, write_seconds=None):
+        self._handles = {}   # path -> open text handle
+        self._buffers = {}   # path -> [pending chunks, pending byte count]
+        self._last_used = {} # path -> monotonic time of last write
+        self._oldest = None  # monotonic time of the oldest unflushed chunk
+        self._write_seconds = write_seconds
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._buffers)
+
+    def write(self, path: Path, text: str):
+        now = time.monotonic()
+        buf = self._buffers.setdefault(path, [[], 0])
+        buf[0].append(text)
+        buf[1] += len(text)
+        self._last_used[path] = now
+        if self._oldest is None:
+            self._oldest = now
+        if buf[1] >= FLUSH_BYTES:
+            self._flush_path(path)
+
+    def due(self) -> bool:
+        return self._oldest is not None and time.monotonic() - self._oldest >= FLUSH_INTERVAL
+
+    def flush(self):
+        for path in list(self._buffers):
+            self._flush_path(path)
+        self._oldest = None
+
+    def close_idle(self):
+        cutoff = time.monotonic() - IDLE_CLOSE
+        for path in [p for p, t in self._last_used.items() if t < cutoff]:
+            self._close_path(path)
+
+    def close(self, folder: Optional[Path] = None):
+        """Flush and close every handle, or only those under `folder`."""
+        for path in list(self._last_used):
+            if folder is None or path.parent == folder:
+                self._close_path(path)
+        if not self._buffers:
+            self._oldest = None
+
+    def _flush_path(self, path: Path):
+        chunks, _ = self._buffers.pop(path, ([], 0))
+        if not chunks:
+            return
+        start = time.perf_counter()
+        f = self._handles.get(path)
+        if f is None:
+            f = self._handles[path] = path.open("a", encoding="utf-8")
+        f.write("".join(chunks))
+        f.flush()
+        if self._write_seconds is not None:
+            self._write_seconds.observe(time.perf_counter() - start)
+
+    def _close_path(self, path: Path):
+        self._flush_path(path)
+        f = self._handles.pop(path, None)
+        if f is not None:
+            f.close()
+        self._last_used.pop(path, None)
+
+
+# `head` is "[<stamp>] session=<id>"
+def format_prompt(r: TelemetryRecord, head: str) -> str:
+    prompt = r.get("prompt") or ""
+    return f"{head}\n{prompt.rstrip()}\n---\n"
+
+def format_resp(r: TelemetryRecord, head: str) -> str:
+    resp = r.get("response_text") or ""
+    return (f"{head} model={r.model or ''} "
+            f"tokens(in={r.get('input_token_count', '')},out={r.get('output_token_count', '')})\n{resp.rstrip()}\n---\n")
+
+def format_tool(r: TelemetryRecord, head: str) -> str:
+    tool_args = r.get("function_args") or {}
+    try:
+        args_s = json.dumps(tool_args, ensure_ascii=False)
+    except Exception:
+        args_s = str(tool_args)
+    return (f"{head} tool={r.get('function_name') or ''} "
+            f"success={r.get('success', '')} duration_ms={r.get('duration_ms', '')}\nargs={args_s}\n---\n")
+
+ROUTES = {
+    "gemini_cli.user_prompt": ("prompts.log", format_prompt),
+    "gemini_cli.api_response": ("responses.log", format_resp),
+    "gemini_cli.tool_call": ("tools.log", format_tool),
+}
+
+
+class SessionLogSink(Sink):
+    name = "session_logs"
+    events = ROUTED_EVENTS
+
+    def __init__(self, base: Path, writers: Optional[WriterPool] = None):
+        self.base = base
+        self.writers = writers or WriterPool()
+        self.current_sid: Optional[str] = None
+        self.folder: Optional[Path] = None
+        base.mkdir(parents=True, exist_ok=True)
+
+    def handle(self, record: TelemetryRecord):
+        route = ROUTES.get(record.event)
+        if route is None:
+            return
+        sid = record.session_id or "unknown"
+        stamp = ts_folder(record.timestamp)
+
+        # rotate session folder on session id change or if none yet
+        if sid != self.current_sid or self.folder is None:
+            if self.folder is not None:
+                self.writers.close(self.folder)
+            # new folder based on this record's timestamp
+            self.folder = open_session_folder(self.base, stamp)
+            self.current_sid = sid
+
+        filename, fmt = route
+        self.writers.write(self.folder / filename, fmt(record, f"[{stamp}] session={sid}"))
+
+    def restart(self):
+        # A new or truncated log.jsonl → next record opens a new folder
+        if self.folder is not None:
+            self.writers.close(self.folder)
+        self.current_sid = None
+        self.folder = None
+
+    def flush(self):
+        self.writers.flush()
+
+    def close(self):
+        self.writers.close()
+
+    def state(self) -> dict:
+        return {"current_sid": self.current_sid,
+                "session_folder": str(self.folder) if self.folder else None}
+
+    def restore(self, state: dict):
+        self.current_sid = state.get("current_sid")
+        self.folder = Path(state["session_folder"]) if state.get("session_folder") else None
@@ -0,0 +1,333 @@
+"""
+Persistent session registry for the session files in requests/.
+
+Maps each session id to its file, so the processor finds a session again
+after server.py has renamed its file to a title (which drops the id from
+the name), and the server can tell which session a file holds without
+reading it:
+
+    requests/.registry        snapshot: {"seq": n, "sessions": {id: record}}
+    requests/.registry.jsonl  journal: one change per line, {"seq", "id", ...}
+    requests/.registry.lock   held by whoever changes either of them
+
+A record is {"file", "title", "first_timestamp", "updated"}; a journal line
+carries the fields it sets, or "deleted". Changes are appended to the
+journal under the lock and folded into the snapshot (written to a temp
+file and replaced) once the journal passes COMPACT_BYTES. Readers don't
+lock: refresh() costs a stat while nothing changed, and reads only the new
+journal lines when something did. Every line has the next sequence number,
+so a reader that raced a compaction notices the gap and reloads.
+
+The names don't end in .json, so globs for session files skip them. If
+neither file exists, the registry is rebuilt from the session files,
+reading the id from each file's entries.
+
+    registry = SessionRegistry(Path("requests"))
+    with registry.locked():
+        path = registry.path(session_id)
+        ...
+        registry.add(session_id, path.name, first_timestamp)
+
+Uses filelock if installed, else an equivalent lock on the same file
+(fcntl/msvcrt), so server.py still runs with the stdlib only.
+"""
+
+from __future__ import annotations
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import sessionstore
+
+try:
+    from filelock import FileLock
+except ImportError:
+    FileLock = None
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(fd):
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+    def _unlock(fd):
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+SNAPSHOT_NAME = ".registry"
+JOURNAL_NAME = ".registry.jsonl"
+LOCK_NAME = ".registry.lock"
+
+# Fold the journal into the snapshot once it grows past this
+COMPACT_BYTES = 256 * 1024
+LOCK_TIMEOUT = 10  # seconds
+
+# {timestamp}-{session id or title}.json
+FILENAME_RE = re.compile(r'\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}-(.+)\.json$')
+
+
+def now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def read_session_id(session_file: Path) -> tuple:
+    """(session id, first timestamp) of a session file, from its entries or else its name."""
+    try:
+        entries = sessionstore.load_session(session_file, inflate=False)
+    except Exception:
+        entries = []
+    for entry in entries:
+        for slot in sessionstore.ENTRY_SLOTS:
+            attrs = entry.get(slot)
+            if attrs and attrs.get("session.id"):
+                return attrs["session.id"], attrs.get("event.timestamp")
+    match = FILENAME_RE.match(session_file.name)
+    return (match.group(1) if match else None), None
+
+
+class LockFile:
+    """
+    Reentrant exclusive lock on a lock file, for when filelock is missing.
+    Takes the same OS lock as filelock, so the two exclude each other.
+    """
+
+    def __init__(self, path: Path, timeout: float = LOCK_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._fd = None
+        self._depth = 0
+
+    def __enter__(self):
+        if self._depth == 0:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                try:
+                    _try_lock(fd)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        os.close(fd)
+                        raise TimeoutError(f"Could not lock {self.path} within {self.timeout}s")
+                    time.sleep(0.05)
+            self._fd = fd
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            _unlock(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+
+class SessionRegistry:
+    def __init__(self, directory: Path, timeout: float = LOCK_TIMEOUT):
+        self.directory = directory
+        self.snapshot_file = directory / SNAPSHOT_NAME
+        self.journal_file = directory / JOURNAL_NAME
+        self.lock = (FileLock or LockFile)(directory / LOCK_NAME, timeout=timeout)
+        self._mutex = threading.RLock()   # between threads of one process (server.py)
+        self.sessions: Dict[str, dict] = {}
+        self.files: Dict[str, str] = {}   # filename -> session id
+        self.seq = 0
+        self._snapshot_sig = None
+        self._offset = 0                  # journal bytes applied
+        self._loaded = False
+
+    # ---------- reading ----------
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self.sessions
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def get(self, session_id: str) -> Optional[dict]:
+        return self.sessions.get(session_id)
+
+    def path(self, session_id: str) -> Optional[Path]:
+        """The session's file, if it is registered and still exists."""
+        record = self.sessions.get(session_id)
+        if record is None:
+            return None
+        session_file = self.directory / record["file"]
+        return session_file if session_file.exists() else None
+
+    def session_id(self, filename: str) -> Optional[str]:
+        return self.files.get(filename)
+
+    def refresh(self) -> "SessionRegistry":
+        """Catch up with changes made by other processes."""
+        with self._mutex:
+            return self._refresh()
+
+    def _refresh(self) -> "SessionRegistry":
+        try:
+            st = self.snapshot_file.stat()
+            sig = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            sig = None
+        if sig is None and not self.journal_file.exists():
+            if self.directory.is_dir():
+                with self.lock:
+                    if not (self.snapshot_file.exists() or self.journal_file.exists()):
+                        self.rebuild()
+                        return self
+                return self._refresh()
+            self._reset()
+            return self
+        if not self._loaded or sig != self._snapshot_sig:
+            self._load_snapshot(sig)
+        if not self._read_journal():
+            # Lines went missing under us (compacted in between): start over
+            self._load_snapshot(sig)
+            self._read_journal()
+        return self
+
+    def _reset(self):
+        self.sessions, self.files, self.seq = {}, {}, 0
+        self._snapshot_sig, self._offset, self._loaded = None, 0, False
+
+    def _load_snapshot(self, sig):
+        self._reset()
+        try:
+            data = json.loads(self.snapshot_file.read_bytes())
+            self.sessions = data["sessions"]
+            self.seq = data["seq"]
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            pass
+        self.files = {record["file"]: sid for sid, record in self.sessions.items()}
+        self._snapshot_sig = sig
+        self._loaded = True
+
+    def _read_journal(self) -> bool:
+        """Apply journal lines past the current offset; False if one is missing."""
+        try:
+            with self.journal_file.open("rb") as f:
+                if os.fstat(f.fileno()).st_size < self._offset:
+                    return False  # emptied by a compaction
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            self._offset = 0
+            return True
+        end = data.rfind(b"\n") + 1  # a line still being written waits for the next refresh
+        for line in data[:end].splitlines():
+            try:
+                change = json.loads(line)
+            except ValueError:
+                return False  # not at a line start: the journal was replaced
+            if change["seq"] <= self.seq:
+                continue  # already in the snapshot
+            if change["seq"] != self.seq + 1:
+                return False
+            self._apply(change)
+        self._offset += end
+        return True
+
+    def _apply(self, change: dict):
+        sid = change["id"]
+        self.seq = change["seq"]
+        old = self.sessions.get(sid)
+        if old is not None:
+            self.files.pop(old["file"], None)
+        if change.get("deleted"):
+            self.sessions.pop(sid, None)
+            return
+        record = dict(old or {"file": None, "title": None, "first_timestamp": None, "updated": None})
+        record.update((k, v) for k, v in change.items() if k not in ("seq", "id"))
+        self.sessions[sid] = record
+        self.files[record["file"]] = sid
+
+    # ---------- writing (hold locked()) ----------
+
+    @contextmanager
+    def locked(self) -> Iterator["SessionRegistry"]:
+        """Hold the registry lock, up to date, while changing sessions and their files."""
+        with self._mutex, self.lock:
+            yield self._refresh()
+
+    def _write(self, session_id: str, **fields):
+        change = {"seq": self.seq + 1, "id": session_id, **fields}
+        with self.journal_file.open("ab") as f:
+            if f.tell() != self._offset:
+                # A torn line from a writer that died: don't append after it
+                size = None
+            else:
+                f.write(json.dumps(change, ensure_ascii=False).encode("utf-8") + b"\n")
+                size = f.tell()
+        self._apply(change)
+        self._offset = size or 0
+        if size is None or size > COMPACT_BYTES:
+            self.compact()
+
+    def add(self, session_id: str, filename: str, first_timestamp: Optional[str] = None,
+            title: Optional[str] = None):
+        self._write(session_id, file=filename, title=title, first_timestamp=first_timestamp, updated=now())
+
+    def touch(self, session_id: str):
+        """Record that the session was just written to."""
+        if session_id in self.sessions:
+            self._write(session_id, updated=now())
+
+    def rename(self, old_filename: str, new_filename: str, title: Optional[str] = None):
+        """Record a renamed file (call after the rename; unregistered files are read for their id)."""
+        session_id = self.files.get(old_filename)
+        if session_id is not None:
+            self._write(session_id, file=new_filename, title=title)
+            return
+        session_id, first_timestamp = read_session_id(self.directory / new_filename)
+        if session_id is not None:
+            self.add(session_id, new_filename, first_timestamp, title)
+
+    def remove(self, filename: str):
+        session_id = self.files.get(filename)
+        if session_id is not None:
+            self._write(session_id, deleted=True)
+
+    def compact(self):
+        """Fold the journal into a new snapshot and empty it."""
+        temp_file = self.snapshot_file.with_name(f"{SNAPSHOT_NAME}.{os.getpid()}.tmp")
+        temp_file.write_text(json.dumps({"seq": self.seq, "sessions": self.sessions}, ensure_ascii=False),
+                             encoding="utf-8")
+        temp_file.replace(self.snapshot_file)
+        # Readers that see the new snapshot skip what is left of the old journal by seq
+        self.journal_file.write_bytes(b"")
+        st = self.snapshot_file.stat()
+        self._snapshot_sig = (st.st_ino, st.st_mtime_ns, st.st_size)
+        self._offset = 0
+
+    def rebuild(self):
+        """Register every session file in the directory from its contents (hold the lock)."""
+        self._reset()
+        self._loaded = True
+        for session_file in sorted(self.directory.glob("*.json")):
+            session_id, first_timestamp = read_session_id(session_file)
+            if session_id is None or session_id in self.sessions:
+                continue  # a duplicate left by an earlier rename: keep the oldest file
+            match = FILENAME_RE.match(session_file.name)
+            title = match.group(1) if match and match.group(1) != session_id else None
+            st = session_file.stat()
+            self.sessions[session_id] = {
+                "file": session_file.name,
+                "title": title,
+                "first_timestamp": first_timestamp,
+                "updated": datetime.fromtimestamp(st.st_mtime).isoformat(timespec="seconds"),
+            }
+        self.files = {record["file"]: sid for sid, record in self.sessions.items()}
+        self.compact()
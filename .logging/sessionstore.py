@@ -0,0 +1,456 @@
+"""
+Append-friendly storage for processed session files.
+
+A session is stored as:
+
+    requests/<stem>.json        base: JSON array of entries (the viewer format)
+    requests/<stem>.seg.jsonl   segment: one JSON delta per line, append-only
+    requests/<stem>.turns.jsonl content-addressed conversation turns
+
+A delta is {"prompt_id": ..., "request"|"response"|"error": {...}} holding
+only the slots that changed. The logical session is the base with every
+delta applied in order; prompt_ids not yet in the base are appended at the
+end. compact() folds the segment back into the base.
+
+Every api_request repeats the whole conversation in request_text. With
+dedup_entries() each turn is stored once in the turn store, keyed by a
+hash of its canonical JSON, and request_text becomes {"$turns": [...]}:
+the turns in their original order, each either {"$ref": hash} (a turn
+already stored) or the turn itself (new in this request). load_session()
+inflates that back to the plain list unless asked not to.
+
+write_base() also records where each entry sits in the base file
+(<stem>.offsets.idx), so read_window() can return a slice of the logical
+session without parsing the rest; the server rebuilds the offsets if they
+are missing or stale.
+
+Only the processor writes; server.py reads the logical session through
+load_session() or read_window(). Stdlib only.
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+SEGMENT_SUFFIX = ".seg.jsonl"
+TURNS_SUFFIX = ".turns.jsonl"
+OFFSETS_SUFFIX = ".offsets.idx"
+SIDECAR_SUFFIXES = (SEGMENT_SUFFIX, TURNS_SUFFIX)
+# Derived from the base file; doesn't need merging when serving
+DERIVED_SUFFIXES = (OFFSETS_SUFFIX,)
+ENTRY_SLOTS = ("request", "response", "error")
+# Format of the offset index
+OFFSETS_VERSION = 1
+
+# Fold a segment into its base once it grows past both of these
+COMPACT_MIN_BYTES = 1024 * 1024
+COMPACT_RATIO = 0.5  # segment size relative to the base file
+
+
+def segment_path(session_file: Path) -> Path:
+    """Segment file that belongs to a base session file."""
+    return session_file.with_name(session_file.stem + SEGMENT_SUFFIX)
+
+
+def turns_path(session_file: Path) -> Path:
+    """Turn store that belongs to a base session file."""
+    return session_file.with_name(session_file.stem + TURNS_SUFFIX)
+
+
+def offsets_path(session_file: Path) -> Path:
+    """Entry offset index that belongs to a base session file."""
+    return session_file.with_name(session_file.stem + OFFSETS_SUFFIX)
+
+
+def is_empty(entry: dict) -> bool:
+    """An entry with every slot unset (earlier versions wrote these for user_prompt events)."""
+    return not any(entry.get(slot) for slot in ENTRY_SLOTS)
+
+
+def entry_prompt_id(entry: dict) -> Optional[str]:
+    """Extract prompt_id from an entry's request, response, or error attributes."""
+    for slot in ENTRY_SLOTS:
+        if entry.get(slot) and "prompt_id" in entry[slot]:
+            return entry[slot]["prompt_id"]
+    return None
+
+
+def read_segment(session_file: Path) -> List[dict]:
+    """Read the deltas appended to a session. A torn last line is ignored."""
+    seg = segment_path(session_file)
+    try:
+        lines = seg.read_bytes().splitlines()
+    except FileNotFoundError:
+        return []
+    deltas = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            deltas.append(json.loads(line))
+        except json.JSONDecodeError:
+            # Only the last line can be mid-write; anything after it is unreadable anyway
+            break
+    return deltas
+
+
+def read_base(session_file: Path) -> List[dict]:
+    """Read the compacted base array ([] if missing)."""
+    try:
+        with session_file.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def apply_deltas(entries: List[dict], deltas: Iterable[dict]) -> List[dict]:
+    """
+    Apply deltas to base entries, keeping base order and appending new
+    prompt_ids. Entries with every slot empty are dropped.
+    """
+    by_id: Dict[str, dict] = {}
+    merged = []
+    for entry in entries:
+        if is_empty(entry):
+            continue  # nothing can ever merge into it
+        merged.append(entry)
+        prompt_id = entry_prompt_id(entry)
+        if prompt_id:
+            by_id[prompt_id] = entry
+    for delta in deltas:
+        prompt_id = delta.get("prompt_id")
+        entry = by_id.get(prompt_id)
+        if entry is None:
+            entry = {slot: None for slot in ENTRY_SLOTS}
+            merged.append(entry)
+            by_id[prompt_id] = entry
+        for slot in ENTRY_SLOTS:
+            if slot in delta:
+                entry[slot] = delta[slot]
+    return merged
+
+
+def load_session(session_file: Path, inflate: bool = True) -> List[dict]:
+    """
+    Return the logical session (base + segment), with deduplicated
+    request_text inflated back to full turn lists unless inflate=False.
+
+    The segment is read first: compaction replaces the base before it
+    removes the segment, so a concurrent compaction yields either the old
+    base plus deltas or the new base plus (already folded) deltas, and
+    applying a delta twice is harmless.
+    """
+    deltas = read_segment(session_file)
+    entries = apply_deltas(read_base(session_file), deltas)
+    if inflate:
+        inflate_entries(session_file, entries)
+    return entries
+
+
+def has_sidecars(session_file: Path) -> bool:
+    """True if the session must be merged/inflated rather than served as-is."""
+    return any(session_file.with_name(session_file.stem + suffix).exists()
+               for suffix in SIDECAR_SUFFIXES)
+
+
+def write_base(session_file: Path, entries: List[dict]):
+    """
+    Atomically replace the base file and record each entry's byte range.
+    The bytes are exactly those of json.dump(entries, indent=2).
+    """
+    temp_file = session_file.with_suffix(".tmp")
+    offsets = []
+    with temp_file.open("wb") as f:
+        if not entries:
+            f.write(b"[]")
+        else:
+            f.write(b"[\n")
+            pos = 2
+            for i, entry in enumerate(entries):
+                if i:
+                    f.write(b",\n")
+                    pos += 2
+                chunk = ("  " + json.dumps(entry, ensure_ascii=False, indent=2).replace("\n", "\n  ")).encode("utf-8")
+                f.write(chunk)
+                if not is_empty(entry):
+                    offsets.append([pos + 2, pos + len(chunk), entry_prompt_id(entry)])
+                pos += len(chunk)
+            f.write(b"\n]")
+    temp_file.replace(session_file)
+    write_offsets(session_file, offsets)
+
+
+# ---------- entry offset index ----------
+# {"version": 1, "sig": [base mtime_ns, base size], "entries": [[start, end, prompt_id], ...]}
+# One row per entry of the logical session, so empty entries have none
+
+def base_signature(session_file: Path) -> list:
+    st = session_file.stat()
+    return [st.st_mtime_ns, st.st_size]
+
+
+def write_offsets(session_file: Path, offsets: List[list]):
+    data = {"version": OFFSETS_VERSION, "sig": base_signature(session_file), "entries": offsets}
+    path = offsets_path(session_file)
+    temp_file = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temp_file.write_text(json.dumps(data), encoding="utf-8")
+    temp_file.replace(path)
+
+
+def build_offsets(session_file: Path) -> List[list]:
+    """Scan a base file for its entries' byte ranges (each entry is parsed once for its prompt_id)."""
+    from logstream import find_object_ends
+
+    buf = session_file.read_bytes()
+    open_bracket = buf.find(b"[")
+    offsets = []
+    pos = open_bracket + 1
+    for end in find_object_ends(buf[pos:]):
+        start = buf.find(b"{", pos)
+        end += open_bracket + 1
+        entry = json.loads(buf[start:end])
+        if not is_empty(entry):
+            offsets.append([start, end, entry_prompt_id(entry)])
+        pos = end
+    return offsets
+
+
+def load_offsets(session_file: Path) -> List[list]:
+    """Entry byte ranges of the current base file, rebuilt (and saved) if stale."""
+    try:
+        data = json.loads(offsets_path(session_file).read_text(encoding="utf-8"))
+        if data["sig"] == base_signature(session_file):
+            return data["entries"]
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    offsets = build_offsets(session_file)
+    try:
+        write_offsets(session_file, offsets)
+    except OSError:
+        pass
+    return offsets
+
+
+def read_window(session_file: Path, start: int, limit: int, inflate: bool = True):
+    """
+    Return (entries[start:start + limit], total) of the logical session,
+    reading only those entries' bytes from the base file.
+    """
+    for _ in range(3):
+        deltas = read_segment(session_file)
+        try:
+            sig = base_signature(session_file)
+            offsets = load_offsets(session_file)
+        except FileNotFoundError:
+            sig, offsets = None, []
+
+        # Logical order: base entries, then prompt_ids that only the segment has
+        base_ids = {row[2]: i for i, row in enumerate(offsets) if row[2]}
+        by_id: Dict[Optional[str], List[dict]] = {}
+        extra: List[Optional[str]] = []
+        for delta in deltas:
+            prompt_id = delta.get("prompt_id")
+            if prompt_id not in by_id and prompt_id not in base_ids:
+                extra.append(prompt_id)
+            by_id.setdefault(prompt_id, []).append(delta)
+        total = len(offsets) + len(extra)
+
+        window = range(max(start, 0), min(start + limit, total))
+        entries = []
+        base_rows = [offsets[i] for i in window if i < len(offsets)]
+        if base_rows:
+            with session_file.open("rb") as f:
+                for begin, end, prompt_id in base_rows:
+                    f.seek(begin)
+                    entry = json.loads(f.read(end - begin))
+                    # Deltas apply by prompt_id; base entries without one are never updated
+                    entries.append(apply_deltas([entry], by_id.get(prompt_id, []) if prompt_id else [])[0])
+        for i in window:
+            if i >= len(offsets):
+                entries.append(apply_deltas([], by_id[extra[i - len(offsets)]])[0])
+
+        # A compaction may have replaced the base meanwhile; read again if so
+        try:
+            current = base_signature(session_file)
+        except FileNotFoundError:
+            current = None
+        if current == sig:
+            break
+    else:
+        entries = load_session(session_file, inflate=False)
+        total = len(entries)
+        entries = entries[max(start, 0):start + limit]
+
+    if inflate:
+        inflate_entries(session_file, entries)
+    return entries, total
+
+
+def append_deltas(session_file: Path, deltas: Iterable[dict]):
+    """Append deltas to the session's segment as one write."""
+    lines = "".join(json.dumps(d, ensure_ascii=False) + "\n" for d in deltas)
+    if not lines:
+        return
+    with segment_path(session_file).open("a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+def needs_compaction(session_file: Path) -> bool:
+    try:
+        seg_size = segment_path(session_file).stat().st_size
+    except FileNotFoundError:
+        return False
+    base_size = session_file.stat().st_size if session_file.exists() else 0
+    return seg_size >= COMPACT_MIN_BYTES and seg_size >= base_size * COMPACT_RATIO
+
+
+def compact(session_file: Path) -> bool:
+    """Fold the segment into the base file. Returns False if there was nothing to do."""
+    seg = segment_path(session_file)
+    if not seg.exists():
+        return False
+    write_base(session_file, load_session(session_file, inflate=False))
+    seg.unlink()
+    return True
+
+
+def inflate_session(session_file: Path) -> bool:
+    """Rewrite a session in the plain format: compacted, full request_text, no turn store."""
+    if not has_sidecars(session_file):
+        return False
+    write_base(session_file, load_session(session_file))
+    for suffix in SIDECAR_SUFFIXES:
+        session_file.with_name(session_file.stem + suffix).unlink(missing_ok=True)
+    return True
+
+
+def logical_size(session_file: Path) -> int:
+    """Bytes on disk for a session (base + sidecars)."""
+    size = session_file.stat().st_size
+    for suffix in SIDECAR_SUFFIXES:
+        try:
+            size += session_file.with_name(session_file.stem + suffix).stat().st_size
+        except FileNotFoundError:
+            pass
+    return size
+
+
+def rename_session(old_file: Path, new_file: Path):
+    """Rename a session's base file and its sidecars together."""
+    old_file.rename(new_file)
+    for suffix in SIDECAR_SUFFIXES + DERIVED_SUFFIXES:
+        sidecar = old_file.with_name(old_file.stem + suffix)
+        if sidecar.exists():
+            os.replace(sidecar, new_file.with_name(new_file.stem + suffix))
+
+
+def delete_session(session_file: Path):
+    """Delete a session's base file and its sidecars."""
+    session_file.unlink()
+    for suffix in SIDECAR_SUFFIXES + DERIVED_SUFFIXES:
+        session_file.with_name(session_file.stem + suffix).unlink(missing_ok=True)
+
+
+# ---------- conversation turn store ----------
+# One line per turn: "<hash>\t<turn json>\n", so the set of stored hashes
+# can be read without decoding any turn.
+
+def turn_hash(turn) -> str:
+    canonical = json.dumps(turn, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:20]
+
+
+def stored_turn_hashes(session_file: Path) -> set:
+    try:
+        with turns_path(session_file).open("rb") as f:
+            return {line.split(b"\t", 1)[0].decode("ascii") for line in f if b"\t" in line}
+    except FileNotFoundError:
+        return set()
+
+
+def load_turns(session_file: Path) -> Dict[str, object]:
+    turns = {}
+    try:
+        with turns_path(session_file).open("rb") as f:
+            for line in f:
+                key, sep, body = line.partition(b"\t")
+                if not sep:
+                    continue
+                try:
+                    turns[key.decode("ascii")] = json.loads(body)
+                except json.JSONDecodeError:
+                    break  # torn last line
+    except FileNotFoundError:
+        pass
+    return turns
+
+
+def is_deduplicated(request_text) -> bool:
+    return isinstance(request_text, dict) and "$turns" in request_text
+
+
+def is_ref(item) -> bool:
+    return isinstance(item, dict) and len(item) == 1 and "$ref" in item
+
+
+def dedup_turns(turns: list, known: set) -> tuple:
+    """
+    Encode a turn list against the stored hashes in `known` (updated).
+    Returns ({"$turns": [...]}, [(hash, turn) for each turn to store]).
+    """
+    items, new = [], []
+    for turn in turns:
+        key = turn_hash(turn)
+        if key in known:
+            items.append({"$ref": key})
+        else:
+            known.add(key)
+            items.append(turn)
+            new.append((key, turn))
+    return {"$turns": items}, new
+
+
+def inline_turns(request_text) -> list:
+    """The turns a deduplicated request_text stores itself (new in that request)."""
+    return [item for item in request_text["$turns"] if not is_ref(item)]
+
+
+def inflate_turns(request_text, turns: Dict[str, object]) -> list:
+    """The full turn list of a deduplicated request_text."""
+    return [turns[item["$ref"]] if is_ref(item) else item for item in request_text["$turns"]]
+
+
+def dedup_entries(session_file: Path, entries: Iterable[dict], known: Optional[set] = None):
+    """
+    Replace each request's request_text turn list with its dedup_turns()
+    encoding (references to turns already in the session's turn store, new
+    turns inline, in order) and append the new turns to the store. Entries are modified in place.
+    `known` is the set of stored hashes, if the caller already has it.
+    """
+    if known is None:
+        known = stored_turn_hashes(session_file)
+    new_lines = []
+    for entry in entries:
+        request = entry.get("request")
+        if not request or not isinstance(request.get("request_text"), list):
+            continue
+        request["request_text"], new = dedup_turns(request["request_text"], known)
+        new_lines += [key + "\t" + json.dumps(turn, ensure_ascii=False) + "\n" for key, turn in new]
+    if new_lines:
+        # The store is written before the entries that reference it
+        with turns_path(session_file).open("a", encoding="utf-8") as f:
+            f.write("".join(new_lines))
+
+
+def inflate_entries(session_file: Path, entries: Iterable[dict], turns: Optional[Dict[str, object]] = None):
+    """Expand deduplicated request_text in place back to the full turn list."""
+    for entry in entries:
+        request = entry.get("request")
+        if not request or not is_deduplicated(request.get("request_text")):
+            continue
+        if turns is None:
+            turns = load_turns(session_file)
+        request["request_text"] = inflate_turns(request["request_text"], turns)
@@ -0,0 +1,50 @@
+"""
+Single-pass decoding of Gemini CLI telemetry records.
+
+A log record is an OTLP-style dict whose fields of interest live in
+"attributes", with a few top-level fallbacks used by other exporters.
+TelemetryRecord(raw) reads each of them once into a __slots__ object (no
+per-record __dict__); everything else stays in the raw attributes dict,
+which is not copied and is read through .attributes / .get() only when a
+caller needs a field. Stdlib only.
+"""
+
+from __future__ import annotations
+
+# Top-level keys consulted when "attributes" lacks a field
+FALLBACK_KEYS = ("event", "name", "timestamp", "event_timestamp", "time", "sessionId", "session_id")
+# Attributes read up front
+CORE_ATTRIBUTES = ("event.name", "event.timestamp", "session.id", "prompt_id", "model")
+
+_EMPTY: dict = {}
+
+
+class TelemetryRecord:
+    __slots__ = ("raw", "attributes", "event", "timestamp", "session_id", "prompt_id", "model")
+
+    def __init__(self, raw: dict):
+        attrs = raw.get("attributes")
+        if not isinstance(attrs, dict):
+            attrs = _EMPTY
+        get = attrs.get
+        self.raw = raw
+        self.attributes = attrs
+        self.event = get("event.name")
+        self.timestamp = get("event.timestamp")
+        self.session_id = get("session.id")
+        self.prompt_id = get("prompt_id")
+        self.model = get("model")
+        # Fallbacks are rare; only look at the top level when something is missing
+        if not (self.event and self.timestamp and self.session_id):
+            top = raw.get
+            self.event = self.event or top("event") or top("name")
+            self.timestamp = self.timestamp or top("timestamp") or top("event_timestamp") or top("time")
+            self.session_id = self.session_id or top("sessionId") or top("session_id")
+
+    def get(self, key: str, default=None):
+        """An attribute that is not decoded up front."""
+        return self.attributes.get(key, default)
+
+    def __repr__(self):
+        return (f"TelemetryRecord(event={self.event!r}, session_id={self.session_id!r}, "
+                f"prompt_id={self.prompt_id!r}, timestamp={self.timestamp!r})")
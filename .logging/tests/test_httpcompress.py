@@ -0,0 +1,27 @@
+"""Generated files are compressed in memory, never next to the source."""
+
+import gzip
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpcompress
+
+
+def test_memory_variant_is_reused_until_the_source_changes(tmp_path):
+    source = tmp_path / "rollups.json"
+    source.write_bytes(b"{}" * 1024)
+    produced = []
+
+    def produce():
+        produced.append(1)
+        return source.read_bytes()
+
+    body = httpcompress.memory_variant(source, "gzip", 1, produce)
+    assert gzip.decompress(body) == source.read_bytes()
+    assert httpcompress.memory_variant(source, "gzip", 1, produce) == body
+    assert len(produced) == 1
+    httpcompress.memory_variant(source, "gzip", 2, produce)
+    assert len(produced) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["rollups.json"]
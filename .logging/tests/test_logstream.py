@@ -0,0 +1,69 @@
+"""Finding complete objects in a log that is read, and written, in pieces."""
+
+import io
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import logstream
+
+RECORDS = [
+    {"attributes": {"event.name": "gemini_cli.api_request", "request_text": json.dumps([{"text": 'a "quoted" }{ \\ value'}])}},
+    {"attributes": {"event.name": "gemini_cli.api_response", "response_text": "ends in a backslash \\"}},
+    [{"nested": ["[", "]", "{"]}],
+]
+LOG = "".join(json.dumps(r, indent=2) + "\n" for r in RECORDS).encode()
+
+
+def read(data, chunk_size, offset=0):
+    return list(logstream.iter_complete_objects(io.BytesIO(data), offset, chunk_size))
+
+
+def test_objects_split_across_reads():
+    expected = read(LOG, len(LOG))
+    assert [json.loads(raw) for raw, _ in expected] == RECORDS
+    # Every chunk edge falls somewhere: inside strings, right after a backslash, between objects
+    for chunk_size in (1, 2, 3, 7, 64):
+        assert read(LOG, chunk_size) == expected
+
+
+def test_escaped_quote_at_a_chunk_edge():
+    data = b'{"a": "x\\"}"}\n{"b": 1}\n'
+    edge = data.index(b'\\') + 1  # the first read ends between the backslash and its quote
+    assert [json.loads(raw) for raw, _ in read(data, edge)] == [{"a": 'x"}'}, {"b": 1}]
+
+
+def test_trailing_partial_object_is_left_for_the_next_pass():
+    partial = LOG + b'{\n  "attributes": {"event.name": "gemini_cli.api_req'
+    objects = read(partial, 5)
+    assert len(objects) == len(RECORDS)
+    resume = objects[-1][1]
+    assert read(partial, 5, resume) == []
+    # Once the writer finishes it, reading from the checkpoint picks it up
+    finished = partial + b'uest"}}\n'
+    (raw, end), = read(finished, 5, resume)
+    assert json.loads(raw) == {"attributes": {"event.name": "gemini_cli.api_request"}}
+    assert end == len(finished) - 1
+
+
+def test_malformed_object_is_delimited_like_any_other():
+    data = b'{"a": 1,, "b": }\n{"c": 2}\n'
+    raws = [raw.strip() for raw, _ in read(data, 4)]
+    # Reported whole so the caller can skip it and go on with the next one
+    assert raws == [b'{"a": 1,, "b": }', b'{"c": 2}']
+
+
+def test_each_byte_is_scanned_once(monkeypatch):
+    scanned = []
+
+    class CountingScanner(logstream.ObjectScanner):
+        def scan(self, buf):
+            scanned.append(len(buf) - self.pos)
+            return super().scan(buf)
+
+    monkeypatch.setattr(logstream, "ObjectScanner", CountingScanner)
+    big = json.dumps({"request_text": "x" * 10000}).encode()
+    assert len(read(big, 100)) == 1
+    assert sum(scanned) == len(big)
@@ -0,0 +1,56 @@
+"""The Prometheus text exposition written by metrics.Registry."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import metrics
+
+
+def test_counters_and_gauges():
+    registry = metrics.Registry()
+    requests = registry.counter("app_requests_total", "Requests")
+    requests.inc(route="/api/files", status=200)
+    requests.inc(2, route="/api/files", status=200)
+    requests.inc(route='a "quoted"\\path\n', status=404)
+    registry.gauge("app_streams", "Open streams").set(1.5)
+    assert registry.counter("app_requests_total", "Requests") is requests
+
+    assert registry.render() == (
+        "# HELP app_requests_total Requests\n"
+        "# TYPE app_requests_total counter\n"
+        'app_requests_total{route="/api/files",status="200"} 3\n'
+        'app_requests_total{route="a \\"quoted\\"\\\\path\\n",status="404"} 1\n'
+        "# HELP app_streams Open streams\n"
+        "# TYPE app_streams gauge\n"
+        "app_streams 1.5\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.Registry()
+    seconds = registry.histogram("app_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        seconds.observe(value, op="read")
+    assert registry.render().splitlines()[2:] == [
+        'app_seconds_bucket{op="read",le="0.1"} 2',
+        'app_seconds_bucket{op="read",le="1"} 3',
+        'app_seconds_bucket{op="read",le="+Inf"} 4',
+        'app_seconds_sum{op="read"} 3.65',
+        'app_seconds_count{op="read"} 4',
+    ]
+    assert seconds.quantile(0.5, op="read") == 0.1
+    assert seconds.quantile(0.99, op="read") == float("inf")
+
+
+def test_write_dumps_the_registry(tmp_path):
+    registry = metrics.Registry()
+    registry.counter("app_records_total", "Records").inc(outcome="routed")
+    with registry.histogram("app_parse_seconds", "Parsing").time():
+        pass
+    path = tmp_path / "app.prom"
+    registry.write(path)
+    assert path.read_text() == registry.render()
+    assert [p.name for p in tmp_path.iterdir()] == ["app.prom"]
+    assert "app_parse_seconds_count 1" in path.read_text()
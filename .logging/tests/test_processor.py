@@ -0,0 +1,122 @@
+"""process-api-requests.py: reading the log, in one run or following it."""
+
+import importlib.util
+import json
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import sessionstore
+
+
+@pytest.fixture(scope="module")
+def processor():
+    path = Path(__file__).resolve().parent.parent / "process-api-requests.py"
+    spec = importlib.util.spec_from_file_location("process_api_requests", path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so worker processes can unpickle parse_byte_range
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    yield module
+    del sys.modules[spec.name]
+
+
+def api_request(i):
+    turns = [{"role": "user", "parts": [{"text": f'say "}}\\n{{" {i} ' + "x" * (i * 37 % 500)}]}]
+    return {"attributes": {"event.name": "gemini_cli.api_request", "event.timestamp": f"2025-01-01T00:00:{i % 60:02d}Z",
+                           "session.id": f"s{i % 3}", "prompt_id": f"p#{i}", "request_text": json.dumps(turns)}}
+
+
+def write_log(path, count):
+    """Pretty-printed records as Gemini writes them, with a malformed one and a partial one at the end."""
+    parts = [json.dumps(api_request(i), indent=2) + "\n" for i in range(count)]
+    parts.insert(count // 2, '{\n  "attributes": {"event.name": "x",, }\n}\n')
+    path.write_text("".join(parts) + '{\n  "attributes": {\n    "event.name": "gemini_cli.api_req')
+
+
+def test_parallel_decoding_matches_serial(processor, tmp_path, monkeypatch):
+    log = tmp_path / "log.jsonl"
+    write_log(log, 300)
+    # Many small ranges, so cuts fall everywhere
+    monkeypatch.setattr(processor, "MIN_RANGE_BYTES", 2048)
+    serial_entry, parallel_entry = {"offset": 0}, {"offset": 0}
+    serial = [processor.slim_record(r) for r in processor.records_from(log, serial_entry)]
+    parallel = list(processor.records_from(log, parallel_entry, workers=3))
+    assert len(serial) == 300
+    assert parallel == serial
+    assert parallel_entry == serial_entry
+    assert log.read_bytes()[serial_entry["offset"]:].lstrip().startswith(b'{\n  "attributes": {\n    "event.name"')
+
+
+def test_a_bad_cut_is_decoded_with_the_next_range(processor, tmp_path, monkeypatch):
+    # An object missing its closing brace makes a boundary-looking cut that isn't one
+    log = tmp_path / "log.jsonl"
+    records = [json.dumps(api_request(i), indent=2) for i in range(40)]
+    records[10] = records[10][:-2]
+    log.write_text("\n".join(records) + "\n")
+    monkeypatch.setattr(processor, "MIN_RANGE_BYTES", 1024)
+    serial_entry, parallel_entry = {"offset": 0}, {"offset": 0}
+    serial = [processor.slim_record(r) for r in processor.records_from(log, serial_entry)]
+    parallel = list(processor.records_from(log, parallel_entry, workers=2))
+    assert parallel == serial
+    assert parallel_entry == serial_entry
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def checkpoint(log):
+    try:
+        state = json.loads((log.parent / ".process-state.json").read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    return state["files"].get(str(log.stat().st_ino), {}).get("offset")
+
+
+def test_follow_processes_records_as_they_are_appended(tmp_path):
+    log = tmp_path / ".logging" / "log.jsonl"
+    log.parent.mkdir()
+    log.write_text(json.dumps(api_request(0), indent=2) + "\n")
+    script = Path(__file__).resolve().parent.parent / "process-api-requests.py"
+    proc = subprocess.Popen([sys.executable, str(script), "--follow", "--max-delay", "0.1"], cwd=tmp_path,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    requests_dir = log.parent / "requests"
+
+    def prompt_ids():
+        ids = []
+        for path in requests_dir.glob("*s0.json"):
+            try:
+                ids += [entry["request"]["prompt_id"] for entry in sessionstore.load_session(path)]
+            except (OSError, ValueError):
+                pass  # mid-write
+        return ids
+
+    try:
+        wait_for(lambda: prompt_ids() == ["p#0"])
+        # Appended in two writes, the first ending inside a string
+        record = json.dumps(api_request(3), indent=2) + "\n"
+        with log.open("a") as f:
+            f.write(record[:50])
+            f.flush()
+            time.sleep(0.3)
+            f.write(record[50:])
+        wait_for(lambda: prompt_ids() == ["p#0", "p#3"])
+        # The checkpoint follows the output, and stays at the end of the log
+        wait_for(lambda: checkpoint(log) == log.stat().st_size - 1)
+    finally:
+        proc.send_signal(signal.SIGINT)
+        output = proc.communicate(timeout=10)[0]
+    assert proc.returncode == 0, output
+    assert "Stopped following" in output
+    # The log is never rotated in follow mode
+    assert sorted(p.name for p in log.parent.glob("log.jsonl*")) == ["log.jsonl"]
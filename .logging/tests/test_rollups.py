@@ -0,0 +1,111 @@
+"""Rollups: counts, token sums, latency quantiles and the /api/stats report."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import rollups
+
+
+def response(model="gemini-2.5-pro", duration=100, total=0, **tokens):
+    return {"model": model, "duration_ms": duration, "total_token_count": total, **tokens}
+
+
+def test_counts_tokens_and_error_rate(tmp_path):
+    stats = rollups.Rollups(tmp_path / "rollups.json")
+    stats.add("request", "s1", "2025-01-01T10:00:00Z", {"model": "gemini-2.5-pro"})
+    stats.add("response", "s1", "2025-01-01T10:00:01Z",
+              response(duration=100, total=30, input_token_count=20, output_token_count="10"))
+    stats.add("response", "s1", "2025-01-01T10:00:02Z", response(duration=300, total=5))
+    stats.add("error", "s2", "2025-01-01T11:00:00Z", {"model": "gemini-2.5-pro", "error_type": "quota", "duration_ms": 50})
+    stats.add("error", "s2", "2025-01-01T11:00:00Z", {"model": "gemini-2.5-pro", "status_code": 500})
+
+    totals = rollups.view(stats.data["totals"])
+    assert (totals["requests"], totals["responses"], totals["errors"]) == (1, 2, 2)
+    assert totals["errorRate"] == 0.5
+    assert totals["tokens"]["total"] == 35
+    assert (totals["tokens"]["input"], totals["tokens"]["output"]) == (20, 10)
+    assert totals["errorTypes"] == {"quota": 1, "500": 1}
+    # The second error has no duration
+    assert totals["latencyMs"]["count"] == 3
+    assert totals["latencyMs"]["mean"] == 150.0
+    assert totals["latencyMs"]["max"] == 300
+
+    session = rollups.view(stats.data["sessions"]["s1"])
+    assert (session["first"], session["last"]) == ("2025-01-01T10:00:00Z", "2025-01-01T10:00:02Z")
+    assert sorted(stats.data["series"]) == ["2025-01-01T10", "2025-01-01T11"]
+
+    # Saved and loaded back unchanged
+    stats.save()
+    assert rollups.load(tmp_path / "rollups.json") == stats.data
+
+
+def test_quantiles_are_within_the_sketch_accuracy():
+    sketch = {}
+    for ms in range(1, 1001):
+        rollups.sketch_add(sketch, ms)
+    for q, exact in ((0.5, 500), (0.9, 900), (0.99, 990)):
+        estimate = rollups.sketch_quantile(sketch, q)
+        assert abs(estimate - exact) <= exact * rollups.SKETCH_ACCURACY + 0.1
+
+
+def test_merged_rollups_equal_one_rollup_of_everything():
+    events = [("response", response(duration=ms, total=ms)) for ms in range(1, 200, 7)]
+    events += [("error", {"error_type": "timeout", "duration_ms": 5000})]
+    whole, first, second = rollups.new_rollup(), rollups.new_rollup(), rollups.new_rollup()
+    for i, (kind, attrs) in enumerate(events):
+        rollups.add_event(whole, kind, attrs)
+        rollups.add_event(first if i % 2 else second, kind, attrs)
+    rollups.merge(first, second)
+    assert first == whole
+
+
+def add_hours(stats, start_day, days, model="gemini-2.5-pro"):
+    for day in range(start_day, start_day + days):
+        for hour in (9, 17):
+            stats.add("response", f"s{day}", f"2025-01-{day:02d}T{hour:02d}:00:00Z",
+                      response(model=model, duration=10 * hour, total=day))
+
+
+def test_old_hours_fold_into_days_without_changing_totals(tmp_path):
+    stats = rollups.Rollups(tmp_path / "rollups.json")
+    add_hours(stats, 1, 20)
+    before = rollups.report(stats.data, {"from": ["2025-01-01"], "to": ["2025-01-20"]})
+    stats.compact_series()
+    keys = sorted(stats.data["series"])
+    # The newest bucket is 01-20T17; hours before 01-06T17 became days
+    assert keys[:6] == ["2025-01-01", "2025-01-02", "2025-01-03", "2025-01-04", "2025-01-05", "2025-01-06"]
+    assert keys[6:8] == ["2025-01-06T17", "2025-01-07T09"]
+    after = rollups.report(stats.data, {"from": ["2025-01-01"], "to": ["2025-01-20"]})
+    assert after["totals"] == before["totals"]
+    assert after["totals"]["tokens"]["total"] == 2 * sum(range(1, 21))
+
+
+def test_report_filters(tmp_path):
+    stats = rollups.Rollups(tmp_path / "rollups.json")
+    add_hours(stats, 1, 3)
+    add_hours(stats, 3, 1, model="gemini-2.5-flash")
+
+    everything = rollups.report(stats.data, {})
+    assert everything["totals"]["responses"] == 8
+    assert sorted(everything["models"]) == ["gemini-2.5-flash", "gemini-2.5-pro"]
+
+    flash = rollups.report(stats.data, {"model": ["gemini-2.5-flash"]})
+    assert flash["totals"]["responses"] == 2
+    assert [point["responses"] for point in flash["series"]] == [0, 0, 0, 0, 1, 1]
+
+    # A range: totals from the series, by day
+    days = rollups.report(stats.data, {"from": ["2025-01-02"], "to": ["2025-01-03"], "bucket": ["day"]})
+    assert [(point["bucket"], point["responses"]) for point in days["series"]] == [("2025-01-02", 2),
+                                                                                   ("2025-01-03", 4)]
+    assert days["totals"]["responses"] == 6
+    assert days["models"]["gemini-2.5-flash"]["responses"] == 2
+
+    assert rollups.report(stats.data, {"session": ["s2"]})["session"]["responses"] == 2
+    with pytest.raises(LookupError):
+        rollups.report(stats.data, {"session": ["nope"]})
+    with pytest.raises(ValueError):
+        rollups.report(stats.data, {"bucket": ["week"]})
@@ -0,0 +1,74 @@
+"""Tool calls must be searchable by name and arguments."""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import searchindex
+
+FILE = "2025-01-01_00-00-00-s.json"
+TOOL_CALL = {"function_name": "read_file", "function_args": {"absolute_path": "/src/quokka.py"}}
+
+
+def entry(text):
+    return {"request": {"prompt_id": "p#0", "session.id": "s", "request_text": [{"role": "user", "parts": [{"text": text}]}]},
+            "response": None, "error": None}
+
+
+def hits(search, q):
+    return [(hit["promptId"], hit["field"]) for hit in search.search(q, field="tools")]
+
+
+def test_tool_call_name_and_args_are_indexed(tmp_path):
+    with searchindex.SearchIndex(tmp_path / "search.db") as search:
+        search.index_entries(FILE, {"p#0": entry("open it")})
+        search.index_tool_calls(FILE, {"p#0": [TOOL_CALL, {"function_name": "run_shell_command",
+                                                           "function_args": '{"command": "ls wombat"}'}]})
+        assert hits(search, "quokka") == [("p#0", "tools")]
+        assert hits(search, "wombat") == [("p#0", "tools")]
+        assert hits(search, "read_file") == [("p#0", "tools")]
+
+
+def test_rewriting_an_entry_keeps_its_tool_calls(tmp_path):
+    call = {"role": "model", "parts": [{"functionCall": {"name": "glob", "args": {"pattern": "*.md"}}}]}
+    with searchindex.SearchIndex(tmp_path / "search.db") as search:
+        search.index_tool_calls(FILE, {"p#0": [TOOL_CALL]})
+        later = entry("open it")
+        later["response"] = {"prompt_id": "p#0", "response_text": [call]}
+        search.index_entries(FILE, {"p#0": later})
+        assert hits(search, "quokka") == [("p#0", "tools")]
+        assert hits(search, "glob") == [("p#0", "tools")]
+
+
+def load_processor():
+    path = Path(__file__).resolve().parent.parent / "process-api-requests.py"
+    spec = importlib.util.spec_from_file_location("process_api_requests", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def record(event, **attrs):
+    return {"attributes": {"event.name": event, "event.timestamp": "2025-01-01T00:00:00Z",
+                           "session.id": "s", "prompt_id": "p#0", **attrs}}
+
+
+def test_processor_indexes_tool_call_events(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    processor = load_processor()
+    output_dir = processor.DEFAULT_OUTPUT_DIR
+    output_dir.mkdir(parents=True)
+    api = processor.ApiSessionSink(output_dir, processor.get_existing_sessions(output_dir))
+    pipeline = processor.Pipeline([api])
+    pipeline.feed([record(processor.EVENT_REQUEST, request_text='[{"role": "user", "parts": [{"text": "hi"}]}]'),
+                   record(processor.EVENT_TOOL_CALL, function_name="read_file",
+                          function_args='{"absolute_path": "/src/quokka.py"}')])
+    api.flush()
+    # A tool call whose entry was written by an earlier flush
+    pipeline.feed([record(processor.EVENT_TOOL_CALL, function_name="glob", function_args='{"pattern": "*.wombat"}')])
+    api.flush()
+    with searchindex.SearchIndex(processor.SEARCH_DB, readonly=True) as search:
+        assert hits(search, "quokka") == [("p#0", "tools")]
+        assert hits(search, "wombat") == [("p#0", "tools")]
@@ -0,0 +1,208 @@
+"""server.py over real sockets, serving a temporary directory."""
+
+import gzip
+import http.client
+import json
+import socket
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server
+
+WORKERS = 2
+
+
+@pytest.fixture
+def httpd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "requests").mkdir()
+    (tmp_path / "hello.txt").write_bytes(b"hello")
+    httpd = server.PooledHTTPServer(("localhost", 0), server.CORSRequestHandler, WORKERS)
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def connect(httpd):
+    return http.client.HTTPConnection(*httpd.server_address, timeout=2)
+
+
+def get(conn, path, headers=None):
+    conn.request("GET", path, headers=headers or {})
+    response = conn.getresponse()
+    return response, response.read()
+
+
+def test_idle_keep_alive_connections_dont_hold_workers(httpd):
+    # Each open connection would pin a worker until it timed out (5s)
+    conns = [connect(httpd) for _ in range(WORKERS * 3)]
+    for _ in range(2):
+        for conn in conns:
+            response, body = get(conn, "/hello.txt")
+            assert (response.status, body) == (200, b"hello")
+    for conn in conns:
+        conn.close()
+
+
+def test_pipelined_requests_are_answered(httpd):
+    request = b"GET /hello.txt HTTP/1.1\r\nHost: test\r\n\r\n"
+    with socket.create_connection(httpd.server_address, timeout=2) as sock:
+        sock.sendall(request * 2 + request.replace(b"\r\n\r\n", b"\r\nConnection: close\r\n\r\n"))
+        data = b""
+        while chunk := sock.recv(65536):
+            data += chunk
+    assert data.count(b"HTTP/1.1 200") == 3
+
+
+def test_static_files_get_compressed_copies_generated_files_dont(httpd, tmp_path):
+    (tmp_path / "viewer.html").write_text("<p>hello</p>" * 200)
+    (tmp_path / "rollups.json").write_text('{"totals": {}}' * 200)
+    conn = connect(httpd)
+    for name in ("viewer.html", "rollups.json"):
+        response, body = get(conn, "/" + name, {"Accept-Encoding": "gzip"})
+        assert response.getheader("Content-Encoding") == "gzip"
+        assert gzip.decompress(body) == (tmp_path / name).read_bytes()
+    assert (tmp_path / "viewer.html.gz").exists()
+    assert not (tmp_path / "rollups.json.gz").exists()
+
+
+def test_if_none_match_gets_304_until_the_file_changes(httpd, tmp_path):
+    conn = connect(httpd)
+    response, _ = get(conn, "/hello.txt")
+    etag = response.getheader("ETag")
+    assert response.getheader("Cache-Control") == "no-cache"
+    response, body = get(conn, "/hello.txt", {"If-None-Match": etag})
+    assert (response.status, body, response.getheader("ETag")) == (304, b"", etag)
+    # Weak comparison, and any tag of a list
+    response, _ = get(conn, "/hello.txt", {"If-None-Match": f'"other", W/{etag}'})
+    assert response.status == 304
+    (tmp_path / "hello.txt").write_bytes(b"hello again")
+    response, body = get(conn, "/hello.txt", {"If-None-Match": etag})
+    assert (response.status, body) == (200, b"hello again")
+    assert response.getheader("ETag") != etag
+
+
+def test_each_encoding_has_its_own_etag(httpd, tmp_path):
+    (tmp_path / "viewer.html").write_text("<p>hello</p>" * 200)
+    conn = connect(httpd)
+    plain, _ = get(conn, "/viewer.html")
+    gzipped, _ = get(conn, "/viewer.html", {"Accept-Encoding": "gzip"})
+    assert plain.getheader("ETag") != gzipped.getheader("ETag")
+    response, _ = get(conn, "/viewer.html", {"Accept-Encoding": "gzip", "If-None-Match": plain.getheader("ETag")})
+    assert response.status == 200
+    response, _ = get(conn, "/viewer.html", {"Accept-Encoding": "gzip", "If-None-Match": gzipped.getheader("ETag")})
+    assert response.status == 304
+
+
+@pytest.fixture
+def session_index(tmp_path, monkeypatch):
+    index = server.sessionindex.SessionIndex(tmp_path / ".session-index.json", server.describe_session)
+    monkeypatch.setattr(server, "SESSION_INDEX", index)
+    return index
+
+
+def add_session(tmp_path, stamp, session_id="s", tokens=0):
+    entries = [{"request": {"prompt_id": f"{session_id}#0", "session.id": session_id, "model": "gemini-2.5-pro"},
+                "response": {"total_token_count": tokens}, "error": None}]
+    name = f"{stamp}-{session_id}.json"
+    (tmp_path / "requests" / name).write_text(json.dumps(entries))
+    return name
+
+
+def test_api_files_revalidates_with_the_listing_etag(httpd, tmp_path, session_index):
+    add_session(tmp_path, "2025-01-01_00-00-00")
+    conn = connect(httpd)
+    response, body = get(conn, "/api/files")
+    etag = response.getheader("ETag")
+    assert [f["filename"] for f in json.loads(body)] == ["2025-01-01_00-00-00-s.json"]
+    response, body = get(conn, "/api/files", {"If-None-Match": etag})
+    assert (response.status, body) == (304, b"")
+    add_session(tmp_path, "2025-01-02_00-00-00")
+    response, body = get(conn, "/api/files", {"If-None-Match": etag})
+    assert response.status == 200
+    assert len(json.loads(body)) == 2
+
+
+def test_api_files_pages_with_query_parameters(httpd, tmp_path, session_index):
+    for day in range(1, 6):
+        add_session(tmp_path, f"2025-01-0{day}_00-00-00", f"s{day}", tokens=day * 10)
+    conn = connect(httpd)
+    response, body = get(conn, "/api/files?sort=tokens&order=asc&limit=2")
+    page = json.loads(body)
+    assert [f["sessionId"] for f in page["files"]] == ["s1", "s2"]
+    assert page["total"] == 5
+    response, body = get(conn, f"/api/files?sort=tokens&order=asc&limit=2&cursor={page['nextCursor']}")
+    assert [f["sessionId"] for f in json.loads(body)["files"]] == ["s3", "s4"]
+    response, _ = get(conn, "/api/files?sort=colour")
+    assert response.status == 400
+
+
+def test_range_gets_206_with_content_range(httpd, tmp_path):
+    data = bytes(range(256)) * 8
+    (tmp_path / "data.bin").write_bytes(data)
+    conn = connect(httpd)
+    for header, (start, end) in [("bytes=10-19", (10, 19)), ("bytes=2000-", (2000, 2047)),
+                                 ("bytes=-5", (2043, 2047)), ("bytes=2040-9999", (2040, 2047))]:
+        response, body = get(conn, "/data.bin", {"Range": header})
+        assert response.status == 206, header
+        assert response.getheader("Content-Range") == f"bytes {start}-{end}/{len(data)}"
+        assert body == data[start:end + 1]
+
+
+def test_several_ranges_get_multipart_byteranges(httpd, tmp_path):
+    (tmp_path / "data.bin").write_bytes(b"0123456789" * 10)
+    response, body = get(connect(httpd), "/data.bin", {"Range": "bytes=0-1, 95-"})
+    assert response.status == 206
+    boundary = response.getheader("Content-Type").split("boundary=")[1]
+    assert body.count(f"--{boundary}".encode()) == 3
+    assert b"Content-Range: bytes 0-1/100\r\n\r\n01\r\n" in body
+    assert b"Content-Range: bytes 95-99/100\r\n\r\n56789\r\n" in body
+
+
+def test_unsatisfiable_range_gets_416(httpd):
+    response, body = get(connect(httpd), "/hello.txt", {"Range": "bytes=5-9"})
+    assert (response.status, body) == (416, b"")
+    assert response.getheader("Content-Range") == "bytes */5"
+
+
+def test_stale_if_range_gets_the_whole_file(httpd):
+    conn = connect(httpd)
+    response, _ = get(conn, "/hello.txt")
+    etag = response.getheader("ETag")
+    response, body = get(conn, "/hello.txt", {"Range": "bytes=0-1", "If-Range": etag})
+    assert (response.status, body) == (206, b"he")
+    response, body = get(conn, "/hello.txt", {"Range": "bytes=0-1", "If-Range": '"stale"'})
+    assert (response.status, body) == (200, b"hello")
+
+
+def test_range_of_a_session_file(httpd, tmp_path):
+    name = add_session(tmp_path, "2025-01-01_00-00-00")
+    conn = connect(httpd)
+    _, whole = get(conn, f"/requests/{name}")
+    response, body = get(conn, f"/requests/{name}", {"Range": "bytes=3-12"})
+    assert response.status == 206
+    assert response.getheader("Content-Range") == f"bytes 3-12/{len(whole)}"
+    assert body == whole[3:13]
+
+
+def test_metrics_include_requests_and_the_processors_dumps(httpd, tmp_path, monkeypatch, session_index):
+    monkeypatch.setattr(server, "METRICS_DIR", tmp_path)
+    monkeypatch.setattr(server, "SESSION_EVENTS", server.sessionevents.SessionEvents(session_index, tmp_path, 1))
+    (tmp_path / "watcher.prom").write_text("# TYPE api_watcher_backlog_bytes gauge\napi_watcher_backlog_bytes 42\n")
+    conn = connect(httpd)
+    before = server.HTTP_REQUESTS.values.get((("method", "GET"), ("route", "/api/files"), ("status", "200")), 0)
+    get(conn, "/api/files")
+    response, body = get(conn, "/metrics")
+    assert response.getheader("Content-Type").startswith("text/plain; version=0.0.4")
+    text = body.decode()
+    assert f'api_server_requests_total{{method="GET",route="/api/files",status="200"}} {before + 1}' in text
+    assert 'api_server_request_seconds_count{route="/api/files"}' in text
+    assert "api_server_event_streams 0" in text
+    assert text.endswith("api_watcher_backlog_bytes 42\n")
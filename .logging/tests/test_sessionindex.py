@@ -0,0 +1,130 @@
+"""The /api/files index: refreshing, listing and paging session records."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import sessionindex
+
+
+def describe(path):
+    return {"filename": path.name, "timestamp": path.stem[:19], "size": path.stat().st_size}
+
+
+def add_session(requests_dir, stamp, body="{}"):
+    path = requests_dir / f"{stamp}-s.json"
+    path.write_text(body)
+    return path.name
+
+
+def test_watched_index_lists_without_scanning(tmp_path, monkeypatch):
+    requests_dir = tmp_path / "requests"
+    requests_dir.mkdir()
+    first = add_session(requests_dir, "2025-01-01_00-00-00")
+    index = sessionindex.SessionIndex(tmp_path / ".session-index.json", describe)
+    records, etag = index.listing(requests_dir)
+    assert [r["filename"] for r in records] == [first]
+
+    index.watched = True
+    stats = []
+    signature = sessionindex.signature
+    monkeypatch.setattr(sessionindex, "signature", lambda path: stats.append(path) or signature(path))
+    second = add_session(requests_dir, "2025-01-02_00-00-00")
+    assert index.listing(requests_dir) == (records, etag)
+    assert stats == []
+    # The watcher's refresh brings it up to date
+    index.refresh(requests_dir)
+    records, new_etag = index.listing(requests_dir)
+    assert [r["filename"] for r in records] == [second, first]
+    assert new_etag != etag
+
+    index.watched = False
+    stats.clear()
+    index.listing(requests_dir)
+    assert len(stats) == 2
+
+
+def test_only_new_or_changed_files_are_read(tmp_path):
+    requests_dir = tmp_path / "requests"
+    requests_dir.mkdir()
+    read = []
+
+    def counting_describe(path):
+        read.append(path.name)
+        return None if path.name == "notes.json" else describe(path)
+
+    first = add_session(requests_dir, "2025-01-01_00-00-00")
+    second = add_session(requests_dir, "2025-01-02_00-00-00")
+    (requests_dir / "notes.json").write_text("[]")
+    index_file = tmp_path / ".session-index.json"
+    records, etag = sessionindex.SessionIndex(index_file, counting_describe).refresh(requests_dir)
+    assert [r["filename"] for r in records] == [second, first]
+    assert sorted(read) == sorted([first, second, "notes.json"])
+
+    # A new server reuses the saved index; files that are not sessions aren't read again either
+    read.clear()
+    index = sessionindex.SessionIndex(index_file, counting_describe)
+    assert index.refresh(requests_dir) == (records, etag)
+    assert read == []
+
+    (requests_dir / first).write_text('{"changed": true}')
+    (requests_dir / second).unlink()
+    records, new_etag = index.refresh(requests_dir)
+    assert read == [first]
+    assert [(r["filename"], r["size"]) for r in records] == [(first, 17)]
+    assert new_etag != etag
+
+
+def record(day, tokens, model="gemini-2.5-pro", title="chat"):
+    return {"filename": f"2025-01-{day:02d}_00-00-00-{title}.json", "timestamp": f"2025-01-{day:02d}T00:00:00",
+            "title": title, "sessionId": f"s{day}", "size": day * 100, "models": [model],
+            "entries": 1, "tokens": {"total": tokens}}
+
+
+def pages(records, **params):
+    """Every page of a listing, following nextCursor."""
+    params = {name: [str(value)] for name, value in params.items()}
+    result = []
+    while True:
+        page = sessionindex.query(records, params)
+        result.append([r["filename"] for r in page["files"]])
+        if not page["nextCursor"]:
+            return result
+        params["cursor"] = [page["nextCursor"]]
+
+
+def test_filters_and_sorting():
+    records = [record(1, 50, title="alpha"), record(2, 10, model="gemini-2.5-flash"), record(3, 50)]
+    result = sessionindex.query(records, {"sort": ["tokens"], "order": ["asc"]})
+    # Ties are broken by filename
+    assert [r["sessionId"] for r in result["files"]] == ["s2", "s1", "s3"]
+    assert result["total"] == 3 and result["nextCursor"] is None
+    assert [r["sessionId"] for r in sessionindex.query(records, {"model": ["gemini-2.5-flash"]})["files"]] == ["s2"]
+    assert [r["sessionId"] for r in sessionindex.query(records, {"title": ["ALP"]})["files"]] == ["s1"]
+    # A bare end date includes the whole day
+    dated = sessionindex.query(records, {"from": ["2025-01-02"], "to": ["2025-01-03"], "sort": ["timestamp"]})
+    assert [r["sessionId"] for r in dated["files"]] == ["s3", "s2"]
+
+
+def test_cursor_pages_are_stable_across_inserts():
+    records = [record(day, tokens=day % 3) for day in range(1, 11)]
+    assert pages(records, sort="tokens", limit=3) == [
+        [records[i - 1]["filename"] for i in days] for days in ([8, 5, 2], [10, 7, 4], [1, 9, 6], [3])]
+
+    page = sessionindex.query(records, {"sort": ["tokens"], "limit": ["3"]})
+    # Sessions written while the client pages: the rest of the listing neither
+    # repeats nor skips what was there, wherever the new ones sort
+    records += [record(20, tokens=2), record(21, tokens=0)]
+    rest = pages(records, sort="tokens", limit=3, cursor=page["nextCursor"])
+    seen = [r["filename"] for r in page["files"]] + [name for names in rest for name in names]
+    assert len(seen) == len(set(seen))
+    assert set(seen) == {r["filename"] for r in records} - {record(20, 2)["filename"]}
+
+
+def test_bad_parameters_are_rejected():
+    for params in ({"sort": ["colour"]}, {"order": ["up"]}, {"limit": ["ten"]}, {"cursor": ["%%%"]}):
+        with pytest.raises(ValueError):
+            sessionindex.query([record(1, 0)], params)
@@ -0,0 +1,37 @@
+"""The stdlib lock that stands in for filelock when it isn't installed."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import sessionregistry
+
+
+def test_lock_file_is_reentrant_and_exclusive(tmp_path):
+    lock_path = tmp_path / sessionregistry.LOCK_NAME
+    lock = sessionregistry.LockFile(lock_path)
+    other = sessionregistry.LockFile(lock_path, timeout=0.1)
+    with lock:
+        with lock:  # rebuilding from inside locked() takes it again
+            pass
+        with pytest.raises(TimeoutError):
+            with other:
+                pass
+    with other:
+        pass
+
+
+def test_registry_works_without_filelock(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessionregistry, "FileLock", None)
+    registry = sessionregistry.SessionRegistry(tmp_path)
+    assert isinstance(registry.lock, sessionregistry.LockFile)
+    with registry.locked():
+        registry.add("s", "2025-01-01_00-00-00-s.json", "2025-01-01T00:00:00Z")
+    registry.journal_file.unlink()
+    registry.snapshot_file.unlink()
+    # With nothing on disk it rebuilds under the lock it already holds
+    with registry.locked():
+        assert len(registry) == 0
@@ -0,0 +1,66 @@
+"""Turn deduplication must give back request_text exactly as it was logged."""
+
+import copy
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import sessiondb
+import sessionstore
+
+HI = {"role": "user", "parts": [{"text": "hi"}]}
+HELLO = {"role": "model", "parts": [{"text": "hello"}]}
+SUMMARY = {"role": "user", "parts": [{"text": "summary of the conversation so far"}]}
+MORE = {"role": "user", "parts": [{"text": "more"}]}
+
+# Each request is deduplicated against the turns of the ones before it
+REQUESTS = [
+    [HI, HELLO],
+    [SUMMARY, HELLO, HI],      # a new turn before repeated ones
+    [HI, HELLO, HI],           # a turn repeated within one request
+    [MORE, SUMMARY, MORE, HI],
+]
+
+
+def entries():
+    return {f"p#{i}": {"request": {"prompt_id": f"p#{i}", "session.id": "s", "request_text": copy.deepcopy(turns)},
+                       "response": None, "error": None}
+            for i, turns in enumerate(REQUESTS)}
+
+
+def request_texts(loaded):
+    return [entry["request"]["request_text"] for entry in loaded]
+
+
+def test_file_store_round_trips_turn_order(tmp_path):
+    session_file = tmp_path / "2025-01-01_00-00-00-s.json"
+    data = entries()
+    for entry in data.values():
+        # One request at a time, as successive processor runs would
+        sessionstore.dedup_entries(session_file, [entry])
+    assert all(sessionstore.is_deduplicated(text) for text in request_texts(data.values()))
+    sessionstore.write_base(session_file, list(data.values()))
+    assert request_texts(sessionstore.load_session(session_file)) == REQUESTS
+
+
+def test_sqlite_store_round_trips_turn_order(tmp_path):
+    with sessiondb.SessionDB(tmp_path / "sessions.db") as db:
+        filename, _ = db.upsert("s", entries(), "2025-01-01T00:00:00Z")
+        db.commit()
+        assert request_texts(db.load(filename)) == REQUESTS
+        # Every turn of the third request was seen before: all references, in order
+        refs = [{"$ref": sessionstore.turn_hash(turn)} for turn in REQUESTS[2]]
+        assert request_texts(db.load(filename, inflate=False))[2] == {"$turns": refs}
+
+
+def test_empty_entries_are_dropped(tmp_path):
+    # Earlier versions wrote an entry with no slot for a user_prompt whose
+    # api_request came after a flush; the request then arrived as a delta
+    session_file = tmp_path / "2025-01-01_00-00-00-s.json"
+    request = {"prompt_id": "p#0", "session.id": "s", "request_text": "hi"}
+    sessionstore.write_base(session_file, [{"request": None, "response": None, "error": None}])
+    sessionstore.append_deltas(session_file, [{"prompt_id": "p#0", "request": request}])
+    expected = [{"request": request, "response": None, "error": None}]
+    assert sessionstore.load_session(session_file) == expected
+    assert sessionstore.read_window(session_file, 0, 10) == (expected, 1)
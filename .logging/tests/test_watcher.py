@@ -0,0 +1,97 @@
+"""watcher.py: resuming from its checkpoint, and truncate.py's new session requests."""
+
+import importlib
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import logstream
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    # Its paths are relative to the working directory, and importing it creates sessions/
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".logging").mkdir()
+    module = importlib.import_module("watcher")
+    monkeypatch.setattr(module, "SINK", module.SessionLogSink(module.SESS_BASE, module.WRITERS))
+    yield module
+    module.WRITERS.close()
+
+
+def prompt(path, day, text):
+    record = {"attributes": {"event.name": "gemini_cli.user_prompt", "event.timestamp": f"2025-01-{day:02d}T00:00:00Z",
+                             "session.id": "s", "prompt": text}}
+    with path.open("a") as f:
+        f.write(json.dumps(record, indent=2) + "\n")
+
+
+def test_new_session_request_opens_a_new_folder(watcher):
+    log = watcher.LOG_FILE
+    prompt(log, 1, "before")
+    state = watcher.process_all(watcher.load_state())
+    # What truncate.py does; Gemini keeps appending to the rotated file
+    generation = logstream.rotate(log)
+    logstream.request_new_session(log)
+    prompt(generation, 2, "after")
+    state = watcher.process_all(state)
+    watcher.checkpoint(state)
+
+    folders = sorted(p.name for p in watcher.SESS_BASE.iterdir())
+    assert folders == ["2025-01-01_00-00-00", "2025-01-02_00-00-00"]
+    assert "after" in (watcher.SESS_BASE / folders[1] / "prompts.log").read_text()
+    assert "after" not in (watcher.SESS_BASE / folders[0] / "prompts.log").read_text()
+    # Acted on once, and the checkpoint says so
+    assert json.loads(watcher.STATE_FILE.read_text())["new_session"] == logstream.new_session_token(log)
+    prompt(generation, 3, "same session")
+    watcher.process_all(state)
+    watcher.checkpoint(state)
+    assert sorted(p.name for p in watcher.SESS_BASE.iterdir()) == folders
+
+
+def test_a_fresh_watcher_ignores_an_old_request(watcher):
+    logstream.request_new_session(watcher.LOG_FILE)
+    assert watcher.load_state()["new_session"] == logstream.new_session_token(watcher.LOG_FILE)
+
+
+def test_restart_resumes_from_the_checkpoint(watcher, monkeypatch):
+    log = watcher.LOG_FILE
+    prompt(log, 1, "one")
+    prompt(log, 1, "two")
+    third = json.dumps({"attributes": {"event.name": "gemini_cli.user_prompt", "event.timestamp": "2025-01-01T00:00:00Z",
+                                       "session.id": "s", "prompt": "three"}}, indent=2) + "\n"
+    with log.open("a") as f:
+        f.write(third[:40])  # Gemini is still writing it
+    watcher.checkpoint(watcher.process_all(watcher.load_state()))
+
+    # A new run: fresh sink, state from disk, and only the rest of the log is decoded
+    monkeypatch.setattr(watcher, "SINK", watcher.SessionLogSink(watcher.SESS_BASE, watcher.WRITERS))
+    decoded = []
+    decode = watcher.decode_record
+    monkeypatch.setattr(watcher, "decode_record", lambda raw: decoded.append(raw) or decode(raw))
+    state = watcher.load_state()
+    watcher.SINK.restore(state)
+    with log.open("a") as f:
+        f.write(third[40:])
+    watcher.checkpoint(watcher.process_all(state))
+
+    assert len(decoded) == 1
+    (folder,) = watcher.SESS_BASE.iterdir()
+    text = (folder / "prompts.log").read_text()
+    assert [text.count(p) for p in ("one", "two", "three")] == [1, 1, 1]
+    assert state["files"][str(log.stat().st_ino)]["offset"] == log.stat().st_size - 1
+
+
+def test_record_count_checkpoint_is_migrated(watcher):
+    log = watcher.LOG_FILE
+    for text in ("one", "two", "three"):
+        prompt(log, 1, text)
+    watcher.STATE_FILE.write_text(json.dumps({"processed_count": 2, "last_size": log.stat().st_size,
+                                              "current_sid": "s", "session_folder": None}))
+    entry = watcher.load_state()["files"][str(log.stat().st_ino)]
+    # Just past the second object
+    assert json.loads(log.read_bytes()[entry["offset"]:])["attributes"]["prompt"] == "three"
@@ -1,20 +1,31 @@
 #!/usr/bin/env -S uv run --script
 # /// script
 # requires-python = ">=3.8"
-# dependencies = []
+# dependencies = ["filelock>=3.12.0"]
 # ///
 from pathlib import Path
-import json
+
+from filelock import FileLock
+
+from logstream import request_new_session, rotate
 
 base = Path(".")
 logdir = base / ".logging"
 logdir.mkdir(parents=True, exist_ok=True)
+log_file = logdir / "log.jsonl"
 
-# truncate (create if missing)
-(logdir / "log.jsonl").write_text("", encoding="utf-8")
+# rotate instead of truncating, so records not yet processed are kept as a
+# generation (log.jsonl.<N>) for process-api-requests.py to pick up
+with FileLock(logdir / ".process.lock", timeout=10):
+    generation = rotate(log_file)
 
-# reset watcher state so next record starts a new session folder
-state = {"processed_count": 0, "last_size": 0, "current_sid": None, "session_folder": None}
-(logdir / ".state.json").write_text(json.dumps(state), encoding="utf-8")
+# Gemini keeps appending to the renamed file, so no new log.jsonl appears
+# for the readers to notice; tell watcher.py (and --session-logs) directly
+# that the next record opens a new session folder
+request_new_session(log_file)
 
-print("New session: truncated .logging/log.jsonl and reset watcher state.")
+if generation:
+    print(f"New session: rotated .logging/log.jsonl to {generation.name}; the next record opens a new session folder.")
+else:
+    print("New session: .logging/log.jsonl was empty; the next record opens a new session folder.")
+print("Restart Gemini CLI so it starts writing a new .logging/log.jsonl (until then it appends to the rotated file).")
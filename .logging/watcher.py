@@ -14,40 +14,61 @@ Gemini telemetry watcher using ijson (streaming, multi-value) + watchfiles.
         tools.log
 
 Session rollover triggers:
-- File truncation/rotation (size shrank → next record opens new folder)
-- Session id changes (attributes["session.id"] or similar)
+- A new log.jsonl or truncation (size shrank → next record opens new folder).
+- truncate.py's new session request (.logging/.new-session changed).
+  When log.jsonl is rotated to log.jsonl.<N> the watcher finishes reading
+  the generation first (Gemini may keep appending to it).
+- Session id changes (attributes["session.id"] or similar) on a routed event
+
+The folders and log lines come from sessionlogs.SessionLogSink, which
+process-api-requests.py --session-logs also feeds from its own read of
+the log; use one or the other.
 
 This script NEVER launches Gemini. Start Gemini yourself.
 """
 
 from __future__ import annotations
+import asyncio
 import json
+import queue
+import threading
+import time
 from pathlib import Path
-from datetime import datetime
 from typing import Optional, Tuple
 
 import ijson
-from watchfiles import awatch, Change
+from watchfiles import awatch
+
+import metrics
+from logstream import generation_paths, iter_complete_objects, new_session_marker, new_session_token, pending_files
+from sessionlogs import FLUSH_INTERVAL, ROUTED_EVENTS, SessionLogSink, WriterPool
+from telemetryrecord import TelemetryRecord
 
 BASE = Path(".")
 LOG_FILE = BASE / ".logging" / "log.jsonl"
 SESS_BASE = BASE / ".logging" / "sessions"
 STATE_FILE = BASE / ".logging" / ".state.json"
-SESS_BASE.mkdir(parents=True, exist_ok=True)
+# Metrics dump, served by server.py's /metrics
+METRICS_FILE = BASE / ".logging" / "watcher.prom"
 
-# ---------- helpers ----------
-def ts_folder(val) -> str:
-    """Return 'YYYY-MM-DD_HH-mm-ss' from ISO string or epoch (ms/sec)."""
-    if isinstance(val, (int, float)):
-        return datetime.fromtimestamp(val/1000 if val > 1e12 else val).strftime("%Y-%m-%d_%H-%M-%S")
-    if isinstance(val, str):
-        try:
-            dt = datetime.fromisoformat(val.replace("Z", "+00:00"))
-            return dt.strftime("%Y-%m-%d_%H-%M-%S")
-        except Exception:
-            pass
-    return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+# Stop decoding a record as soon as attributes."event.name" shows it is not routed
+SELECTIVE_DECODE = True
+
+# Change events waiting for the worker; a burst beyond this is merged into the pending pass
+QUEUE_SIZE = 64
 
+# Seconds between metrics dumps while running
+METRICS_INTERVAL = 5.0
+
+RECORDS = metrics.counter("api_watcher_records_total", "Log records read, by outcome")
+PARSE_SECONDS = metrics.histogram("api_watcher_parse_seconds", "Decoding one log record")
+NORMALIZE_SECONDS = metrics.histogram("api_watcher_normalize_seconds", "Decoding the common fields of one record")
+WRITE_SECONDS = metrics.histogram("api_watcher_write_seconds", "Writing one session log's buffer to disk")
+STATE_SAVE_SECONDS = metrics.histogram("api_watcher_state_save_seconds", "Saving the watcher checkpoint")
+LAG_SECONDS = metrics.histogram("api_watcher_lag_seconds", "Change notification to output written")
+BACKLOG_BYTES = metrics.gauge("api_watcher_backlog_bytes", "Bytes not yet read from log.jsonl and its generations")
+
+# ---------- helpers ----------
 def g(obj, *path, default=None):
     cur = obj
     for k in path:
@@ -56,168 +77,272 @@ def g(obj, *path, default=None):
         cur = cur[k]
     return cur
 
-def normalize(rec: dict) -> dict:
-    """Extract common fields from the OTLP-ish record."""
-    attrs = rec.get("attributes", {}) if isinstance(rec.get("attributes", {}), dict) else {}
-    event = attrs.get("event.name") or rec.get("event") or rec.get("name") or ""
-    t = attrs.get("event.timestamp") or rec.get("time") or None
-    sid = attrs.get("session.id") or rec.get("sessionId") or rec.get("session_id") or "unknown"
-    model = attrs.get("model", "")
-    in_tok = attrs.get("input_token_count", "")
-    out_tok = attrs.get("output_token_count", "")
-    prompt = attrs.get("prompt", "") or ""
-    resp = attrs.get("response_text", "") or ""
-    tool_name = attrs.get("function_name", "") or ""
-    tool_args = attrs.get("function_args", {}) or {}
-    tool_ok = attrs.get("success", "")
-    tool_dur = attrs.get("duration_ms", "")
-    return {
-        "event": event,
-        "time": t,
-        "sid": sid,
-        "model": model,
-        "in_tok": in_tok,
-        "out_tok": out_tok,
-        "prompt": prompt,
-        "resp": resp,
-        "tool_name": tool_name,
-        "tool_args": tool_args,
-        "tool_ok": tool_ok,
-        "tool_dur": tool_dur,
-    }
-
-def open_session_folder(first_info: dict, suffix_bump: int = 0) -> Path:
-    """Create a timestamped session folder; bump suffix if same-second collision."""
-    stamp = ts_folder(first_info["time"])
-    folder = SESS_BASE / (f"{stamp}__{suffix_bump}" if suffix_bump else stamp)
-    i = suffix_bump
-    while folder.exists():
-        i += 1
-        folder = SESS_BASE / f"{stamp}__{i}"
-    folder.mkdir(parents=True, exist_ok=True)
-    return folder
-
-def write_prompt(folder: Path, info: dict):
-    with (folder / "prompts.log").open("a", encoding="utf-8") as f:
-        f.write(f"[{ts_folder(info['time'])}] session={info['sid']}\n{info['prompt'].rstrip()}\n---\n")
-
-def write_resp(folder: Path, info: dict):
-    with (folder / "responses.log").open("a", encoding="utf-8") as f:
-        f.write(
-            f"[{ts_folder(info['time'])}] session={info['sid']} model={info['model']} "
-            f"tokens(in={info['in_tok']},out={info['out_tok']})\n{info['resp'].rstrip()}\n---\n"
-        )
-
-def write_tool(folder: Path, info: dict):
-    try:
-        args_s = json.dumps(info["tool_args"], ensure_ascii=False)
-    except Exception:
-        args_s = str(info["tool_args"])
-    with (folder / "tools.log").open("a", encoding="utf-8") as f:
-        f.write(
-            f"[{ts_folder(info['time'])}] session={info['sid']} tool={info['tool_name']} "
-            f"success={info['tool_ok']} duration_ms={info['tool_dur']}\nargs={args_s}\n---\n"
-        )
+# Session folders and log formatting live in sessionlogs.py (shared with
+# process-api-requests.py --session-logs)
+WRITERS = WriterPool(WRITE_SECONDS)
+SINK = SessionLogSink(SESS_BASE, WRITERS)
+
+def offset_after(count: int) -> int:
+    """Byte offset just past the first `count` objects (migrates old processed_count state)."""
+    if count <= 0 or not LOG_FILE.exists():
+        return 0
+    offset = 0
+    with LOG_FILE.open("rb") as f:
+        for seen, (_, end) in enumerate(iter_complete_objects(f, 0), start=1):
+            offset = end
+            if seen >= count:
+                break
+    return offset
+
+def decode_record(raw: bytes) -> Optional[dict]:
+    """
+    Build one record from ijson's event stream. With SELECTIVE_DECODE the
+    build stops at attributes."event.name" when the event is not routed, so
+    large ignored records (api_request with the whole history in
+    request_text) are never materialized. Returns None for skipped records.
+    """
+    if not SELECTIVE_DECODE:
+        return next(ijson.items(raw, ""))
+    builder = ijson.ObjectBuilder()
+    for prefix, event, value in ijson.parse(raw):
+        if prefix == "attributes.event.name" and event == "string" and value not in ROUTED_EVENTS:
+            return None
+        builder.event(event, value)
+    return builder.value
 
 # ---------- state handling ----------
+def new_state() -> dict:
+    # files: inode -> {"offset", "size"} for log.jsonl and generations rotated from it
+    return {"files": {}, "current_sid": None, "session_folder": None, "new_session": new_session_token(LOG_FILE)}
+
 def load_state() -> dict:
     if STATE_FILE.exists():
         try:
-            return json.loads(STATE_FILE.read_text(encoding="utf-8"))
+            state = json.loads(STATE_FILE.read_text(encoding="utf-8"))
+            if "files" not in state:
+                # Checkpoint from before byte offsets: a count of processed records
+                offset = offset_after(state.pop("processed_count", 0))
+                size = state.pop("last_size", 0)
+                state["files"] = {}
+                if LOG_FILE.exists():
+                    state["files"][str(LOG_FILE.stat().st_ino)] = {"offset": offset, "size": size}
+            return state
         except Exception:
             pass
-    return {"processed_count": 0, "last_size": 0, "current_sid": None, "session_folder": None}
+    return new_state()
 
 def save_state(state: dict):
-    STATE_FILE.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    with STATE_SAVE_SECONDS.time():
+        STATE_FILE.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
 
 # ---------- processing ----------
-def process_all(state: dict) -> dict:
+def consume(path: Path, entry: dict, state: dict) -> int:
     """
-    Re-parse the file and process only NEW objects by skipping first N=processed_count.
-    This avoids partial-object issues and keeps the code simple.
+    Route the complete objects in `path` after entry["offset"] and advance
+    the offset. Returns the number of objects read.
     """
-    if not LOG_FILE.exists():
-        return state
+    offset = entry["offset"]
+    new_objs = 0
+
+    with path.open("rb") as f:
+        for raw, end in iter_complete_objects(f, offset):
+            try:
+                with PARSE_SECONDS.time():
+                    rec = decode_record(raw)
+            except Exception as e:
+                # A complete but malformed object will never parse; skip past it.
+                print(f"Failed to parse record at byte {offset} of {path.name}: {e}")
+                RECORDS.inc(outcome="malformed")
+                offset = end
+                continue
+            offset = end
+            new_objs += 1
+            if rec is None:
+                RECORDS.inc(outcome="skipped")
+                continue
+
+            with NORMALIZE_SECONDS.time():
+                r = TelemetryRecord(rec)
+            if r.event not in ROUTED_EVENTS:
+                RECORDS.inc(outcome="skipped")
+                continue
+            RECORDS.inc(outcome="routed")
+            SINK.handle(r)
 
-    size = LOG_FILE.stat().st_size
-    # Detect truncation/rotation
-    if size < state.get("last_size", 0):
-        state["processed_count"] = 0
-        state["current_sid"] = None
-        state["session_folder"] = None
+    entry["offset"] = offset
+    entry["size"] = max(entry["size"], offset)
+    state.update(SINK.state())
+    return new_objs
 
-    processed = 0
+def process_all(state: dict) -> dict:
+    """
+    Resume each file from the byte offset of its last complete object and
+    process only what was appended since. Files are log.jsonl plus any
+    generation it was rotated into (Gemini may still be appending there),
+    keyed by inode so a rename keeps the checkpoint. A partial trailing
+    object is not consumed, so checkpoints always sit on object boundaries.
+    """
+    files = state.setdefault("files", {})
     new_objs = 0
-    session_folder: Optional[Path] = Path(state["session_folder"]) if state.get("session_folder") else None
-    current_sid = state.get("current_sid")
 
-    with LOG_FILE.open("rb") as f:
-        try:
-            # ijson will iterate over multiple concatenated JSON values
-            records = ijson.items(f, "", multiple_values=True)
-            for rec in records:
-                processed += 1
-                if processed <= state.get("processed_count", 0):
-                    continue  # already handled in a previous run
-
-                info = normalize(rec)
-
-                # rotate session folder on session id change or if none yet
-                if info["sid"] != current_sid or session_folder is None:
-                    # new folder based on this record's timestamp
-                    session_folder = open_session_folder(info)
-                    current_sid = info["sid"]
-
-                # route by event
-                ev = info["event"]
-                if ev == "gemini_cli.user_prompt":
-                    write_prompt(session_folder, info)
-                elif ev == "gemini_cli.api_response":
-                    write_resp(session_folder, info)
-                elif ev == "gemini_cli.tool_call":
-                    write_tool(session_folder, info)
-                # else ignore other events (config, metrics, etc.)
-
-                new_objs += 1
+    # truncate.py asked for a new session → next record opens a new folder
+    token = new_session_token(LOG_FILE)
+    requested = token != state.get("new_session")
+    if requested:
+        SINK.restart()
+        state.update(SINK.state())
+        state["new_session"] = token
 
-        except Exception:
-            # Likely trailing incomplete JSON while Gemini is writing; ignore for now.
-            print("Failed to parse line:", rec)
-            pass
+    for path, key, restarted in pending_files(LOG_FILE, files, adopt_generations=False):
+        # A new or truncated log.jsonl → next record opens a new folder
+        if restarted:
+            SINK.restart()
+            state.update(SINK.state())
+        new_objs += consume(path, files[key], state)
 
-    # update state
-    state["processed_count"] = processed
-    state["last_size"] = size
-    state["current_sid"] = current_sid
-    state["session_folder"] = str(session_folder) if session_folder else None
-    if new_objs:
-        save_state(state)
+    if new_objs or requested:
+        # Never persist an offset ahead of output that is still buffered
+        if WRITERS.due():
+            WRITERS.flush()
+        if not WRITERS.pending:
+            save_state(state)
     return state
 
+def checkpoint(state: dict):
+    """Flush buffered session output and persist the state that covers it."""
+    WRITERS.flush()
+    save_state(state)
+
+def dump_metrics(state: dict):
+    """Record the backlog and write METRICS_FILE."""
+    backlog = 0
+    for path in [LOG_FILE] + [path for _, path in generation_paths(LOG_FILE)]:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        entry = state.get("files", {}).get(str(st.st_ino))
+        if entry is not None or path == LOG_FILE:
+            backlog += max(st.st_size - (entry or {}).get("offset", 0), 0)
+    BACKLOG_BYTES.set(backlog)
+    try:
+        metrics.REGISTRY.write(METRICS_FILE)
+    except OSError as e:
+        print(f"Could not write {METRICS_FILE.name}: {e}")
+
+# ---------- worker ----------
+# Counters maintained by the worker and the awatch loop
+STATS = {
+    "events": 0,           # change notifications received for log.jsonl
+    "passes": 0,           # process_all passes run
+    "coalesced": 0,        # notifications merged into another pass
+    "queue_depth": 0,      # depth seen by the last pass
+    "queue_depth_max": 0,
+    "flushes": 0,          # times all pending output reached disk
+    "lag_last_ms": 0.0,    # change notification → output written
+    "lag_max_ms": 0.0,
+    "lag_total_ms": 0.0,
+}
+
+def print_stats():
+    flushes = STATS["flushes"] or 1
+    print(
+        f"📊 events={STATS['events']} passes={STATS['passes']} coalesced={STATS['coalesced']} "
+        f"queue_max={STATS['queue_depth_max']} lag(last={STATS['lag_last_ms']:.0f}ms, "
+        f"avg={STATS['lag_total_ms'] / flushes:.0f}ms, max={STATS['lag_max_ms']:.0f}ms)"
+    )
+    for line in metrics.REGISTRY.summary():
+        print(f"   {line}")
+
+def drain(q: queue.Queue, first) -> list:
+    """Return `first` plus everything already queued behind it."""
+    batch = [first]
+    while True:
+        try:
+            batch.append(q.get_nowait())
+        except queue.Empty:
+            return batch
+
+def worker(q: queue.Queue, state: dict):
+    """
+    Parse and write off the event loop. Queue items are the monotonic time
+    of a change notification; None stops the worker. Everything queued when
+    a pass starts is handled by that single pass.
+    """
+    SINK.restore(state)
+    stop = False
+    unflushed_since = None  # time of the oldest change whose output is still buffered
+    last_dump = 0.0
+    while not stop:
+        try:
+            first = q.get(timeout=FLUSH_INTERVAL)
+        except queue.Empty:
+            first = ()
+        batch = drain(q, first) if first != () else []
+        stop = None in batch
+        events = [t for t in batch if t is not None]
+
+        if events:
+            STATS["queue_depth"] = len(events)
+            STATS["queue_depth_max"] = max(STATS["queue_depth_max"], len(events))
+            STATS["coalesced"] += len(events) - 1
+            state = process_all(state)
+            STATS["passes"] += 1
+            oldest = min(events)
+            unflushed_since = oldest if unflushed_since is None else min(unflushed_since, oldest)
+
+        if WRITERS.due():
+            checkpoint(state)
+        WRITERS.close_idle()
+
+        if unflushed_since is not None and not WRITERS.pending:
+            lag_ms = (time.monotonic() - unflushed_since) * 1000
+            STATS["lag_last_ms"] = lag_ms
+            STATS["lag_max_ms"] = max(STATS["lag_max_ms"], lag_ms)
+            STATS["lag_total_ms"] += lag_ms
+            STATS["flushes"] += 1
+            LAG_SECONDS.observe(lag_ms / 1000)
+            unflushed_since = None
+
+        if time.monotonic() - last_dump >= METRICS_INTERVAL:
+            dump_metrics(state)
+            last_dump = time.monotonic()
+
+    WRITERS.close()
+    save_state(state)
+    dump_metrics(state)
+
 # ---------- watcher main ----------
 async def main():
     # Ensure folder exists; don’t create/clear the log (user controls it)
     LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
 
+    # watchfiles reports absolute paths; generations are log.jsonl.<N>
+    log_path = str(LOG_FILE.resolve())
+    marker_path = str(new_session_marker(LOG_FILE).resolve())
+
+    work: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+    thread = threading.Thread(target=worker, args=(work, load_state()), name="watcher-worker", daemon=True)
+    thread.start()
+
     # Prime once (in case the file already has content)
-    state = load_state()
-    state = process_all(state)
-
-    # React to changes
-    async for changes in awatch(LOG_FILE.parent, debounce=150):
-        # only act if our file changed
-        if not any(str(p) == str(LOG_FILE) and (chg in (Change.modified, Change.added) or Change.deleted)
-                   for chg, p in changes):
-            continue
-        # if deleted, just reset counters and wait for re-creation
-        if any(chg == Change.deleted and str(p) == str(LOG_FILE) for chg, p in changes):
-            state = {"processed_count": 0, "last_size": 0, "current_sid": None, "session_folder": None}
-            save_state(state)
-            continue
-        # modified/added → (re)process
-        state = process_all(state)
+    work.put(time.monotonic())
+
+    # React to changes; the loop only enqueues, the worker does the parsing
+    try:
+        async for changes in awatch(LOG_FILE.parent, debounce=150):
+            if not any(p in (log_path, marker_path) or p.startswith(log_path + ".") for _, p in changes):
+                continue
+            STATS["events"] += 1
+            try:
+                work.put_nowait(time.monotonic())
+            except queue.Full:
+                # The queued passes will pick these bytes up anyway
+                STATS["coalesced"] += 1
+    finally:
+        work.put(None)
+        thread.join()
+        print_stats()
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())